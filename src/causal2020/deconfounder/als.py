@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Masked matrix factorization by alternating least squares (ALS), and
+cross-validated selection of the number of principal components by holding
+out random entries of the data, as in the `cv_pca` of the project's notebooks.
+"""
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+
+def group_missingness_patterns(M: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups the columns of a mask by their pattern of observed entries.
+
+    Parameters
+    ----------
+    M : 2D np.ndarray of bools.
+        Shape `(m, n)`. False for missing entries.
+
+    Returns
+    -------
+    patterns : 2D np.ndarray of floats.
+        Shape `(num_patterns, m)`. One for the observed entries of each
+        unique column pattern.
+    pattern_idx : 1D np.ndarray of ints.
+        Shape `(n,)`. The row of `patterns` matching each column of `M`.
+    """
+    # Pack each column into bytes so the patterns are compared as scalars
+    packed = np.packbits(M.astype(bool), axis=0).T
+    packed = np.ascontiguousarray(packed).view(
+        np.dtype((np.void, packed.shape[1]))
+    )
+    _, first_idx, pattern_idx = np.unique(
+        packed.ravel(), return_index=True, return_inverse=True
+    )
+    patterns = M[:, first_idx].T.astype(float)
+    return patterns, pattern_idx.ravel()
+
+
+def censored_lstsq(
+    A: np.ndarray,
+    B: np.ndarray,
+    M: np.ndarray,
+    ridge: float = 0.0,
+    patterns: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> np.ndarray:
+    """
+    Solves the least squares problem `min_X norm(M * (A @ X - B))`, where `M`
+    marks the observed entries of `B`. Columns of `B` that share a missingness
+    pattern share one Cholesky factorization of their normal equations.
+
+    Parameters
+    ----------
+    A : 1D or 2D np.ndarray.
+        Shape `(m, r)`, or `(m,)` for `r == 1`.
+    B : 2D np.ndarray.
+        Shape `(m, n)`.
+    M : 2D np.ndarray of bools.
+        Shape `(m, n)`. False for missing entries of `B`.
+    ridge : optional, non-negative float.
+        Added to the diagonal of the normal equations. Default == 0.
+    patterns : optional, tuple or None.
+        The output of `group_missingness_patterns(M)`, to avoid recomputing
+        it when `M` is reused. Default is None.
+
+    Returns
+    -------
+    X : 2D np.ndarray.
+        Shape `(r, n)`.
+    """
+    if A.ndim == 1:
+        A = A[:, None]
+    rank = A.shape[1]
+    M = M.astype(bool)
+    if patterns is None:
+        patterns = group_missingness_patterns(M)
+    pattern_mask, pattern_idx = patterns
+
+    # Build the normal equations once per unique missingness pattern
+    outer_products = (A[:, :, None] * A[:, None, :]).reshape((-1, rank ** 2))
+    grams = (pattern_mask @ outer_products).reshape((-1, rank, rank))
+    grams += ridge * np.eye(rank)
+    chol = _cholesky_by_pattern(grams)
+
+    # Forward and back substitution, vectorized over the columns of `B`.
+    # Each column reads one row of its pattern's factor at a time, so no
+    # `(n, r, r)` copy of the factors is made
+    X = A.T @ np.where(M, B, 0)
+    factors = np.ascontiguousarray(chol.transpose((1, 2, 0)))
+    diag = np.take(np.diagonal(chol, axis1=1, axis2=2).T, pattern_idx, axis=1)
+    for k in range(rank):
+        row = np.take(factors[k, :k], pattern_idx, axis=1)
+        X[k] = (X[k] - (row * X[:k]).sum(axis=0)) / diag[k]
+    for k in reversed(range(rank)):
+        col = np.take(factors[k + 1 :, k], pattern_idx, axis=1)
+        X[k] = (X[k] - (col * X[k + 1 :]).sum(axis=0)) / diag[k]
+    return X
+
+
+def _cholesky_by_pattern(grams: np.ndarray) -> np.ndarray:
+    """
+    Computes the lower Cholesky factors of a stack of normal equations,
+    adding a small ridge to those that are singular.
+    """
+    try:
+        return np.linalg.cholesky(grams)
+    except np.linalg.LinAlgError:
+        pass
+    chol = np.empty_like(grams)
+    jitter = 1e-6 * np.eye(grams.shape[-1])
+    for pos, gram in enumerate(grams):
+        try:
+            chol[pos] = np.linalg.cholesky(gram)
+        except np.linalg.LinAlgError:
+            # The pattern leaves too few observed rows; regularize as in
+            # `cv_pca`
+            chol[pos] = np.linalg.cholesky(gram + jitter)
+    return chol
+
+
+def masked_als(
+    data: np.ndarray,
+    rank: int,
+    mask: np.ndarray,
+    max_iter: int = 1000,
+    tol: float = 1e-6,
+    ridge: float = 0.0,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Factorizes `data ~= U @ Vt` using only the entries where `mask` is True.
+
+    Parameters
+    ----------
+    data : 2D np.ndarray.
+        Shape `(num_rows, num_cols)`.
+    rank : positive int.
+        The number of components.
+    mask : 2D np.ndarray of bools.
+        Same shape as `data`. True for the entries used in the fit.
+    max_iter : optional, positive int.
+        The maximum number of alternating updates. Default == 1000.
+    tol : optional, non-negative float.
+        Stop when the relative change of the masked squared error between
+        iterations is at most `tol`. Default == 1e-6.
+    ridge : optional, non-negative float.
+        See `censored_lstsq`. Default == 0.
+    seed : optional, int or None.
+        The random seed used to initialize `U`. Default is None.
+
+    Returns
+    -------
+    U : 2D np.ndarray.
+        Shape `(num_rows, rank)`.
+    Vt : 2D np.ndarray.
+        Shape `(rank, num_cols)`.
+    num_iterations : int.
+        The number of alternating updates performed.
+    """
+    rng = np.random.default_rng(seed)
+    mask = mask.astype(bool)
+    U = rng.standard_normal((data.shape[0], rank))
+    col_patterns = group_missingness_patterns(mask)
+    row_patterns = group_missingness_patterns(mask.T)
+
+    prev_objective = np.inf
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        Vt = censored_lstsq(U, data, mask, ridge, col_patterns)
+        U = censored_lstsq(Vt.T, data.T, mask.T, ridge, row_patterns).T
+
+        objective = (((U @ Vt - data) ** 2)[mask]).sum()
+        if abs(prev_objective - objective) <= tol * objective:
+            break
+        prev_objective = objective
+    return U, Vt, iteration
+
+
+def cv_pca(
+    data: np.ndarray,
+    rank: int,
+    mask: Optional[np.ndarray] = None,
+    p_holdout: float = 0.3,
+    max_iter: int = 1000,
+    tol: float = 1e-6,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, float, float, np.ndarray, np.ndarray]:
+    """
+    Fits PCA by masked ALS while holding out a random fraction of the entries
+    of `data`.
+
+    Parameters
+    ----------
+    data : 2D np.ndarray.
+        Shape `(num_rows, num_cols)`.
+    rank : positive int.
+        The number of components.
+    mask : optional, 2D np.ndarray of bools or None.
+        True for the entries used in the fit. If None, each entry is held out
+        with probability `p_holdout`. Default is None.
+    p_holdout : optional, float in (0, 1).
+        See `mask`. Default == 0.3.
+    max_iter, tol : optional.
+        See `masked_als`. Default == 1000 and 1e-6.
+    seed : optional, int or None.
+        The random seed used for the mask and the initialization.
+        Default is None.
+
+    Returns
+    -------
+    U, Vt : 2D np.ndarrays.
+        The fitted factors. See `masked_als`.
+    train_err, test_err : float.
+        The mean squared error on the fitted and held-out entries.
+    mask : 2D np.ndarray of bools.
+        True for the entries used in the fit.
+    resid : 2D np.ndarray.
+        `U @ Vt - data`.
+    """
+    mask_seed, als_seed = np.random.SeedSequence(seed).spawn(2)
+    if mask is None:
+        mask_rng = np.random.default_rng(mask_seed)
+        mask = mask_rng.random(data.shape) > p_holdout
+    mask = mask.astype(bool)
+
+    U, Vt, _ = masked_als(
+        data, rank, mask, max_iter=max_iter, tol=tol, seed=als_seed
+    )
+    resid = U @ Vt - data
+    train_err = np.mean(resid[mask] ** 2)
+    test_err = np.mean(resid[~mask] ** 2)
+    return U, Vt, train_err, test_err, mask, resid
+
+
+def select_rank_cv(
+    data: np.ndarray,
+    ranks: Sequence[int],
+    num_repeats: int = 5,
+    p_holdout: float = 0.3,
+    max_iter: int = 1000,
+    tol: float = 1e-6,
+    seed: Optional[int] = None,
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Selects the number of principal components with the lowest mean held-out
+    error over repeated random holdouts. Every rank is evaluated on the same
+    holdout masks.
+
+    Parameters
+    ----------
+    data : 2D np.ndarray.
+        Shape `(num_rows, num_cols)`.
+    ranks : list of positive ints.
+        The candidate numbers of components.
+    num_repeats : optional, positive int.
+        The number of random holdout masks. Default == 5.
+    p_holdout, max_iter, tol : optional.
+        See `cv_pca`.
+    seed : optional, int or None.
+        The random seed to be used to ensure reproducibility. Default is None.
+
+    Returns
+    -------
+    best_rank : int.
+        The element of `ranks` with the lowest mean held-out error.
+    train_errs, test_errs : 2D np.ndarrays.
+        Shape `(len(ranks), num_repeats)`. The errors of each fit.
+    """
+    repeat_seeds = np.random.SeedSequence(seed).spawn(num_repeats)
+    train_errs = np.empty((len(ranks), num_repeats))
+    test_errs = np.empty((len(ranks), num_repeats))
+    for repeat, repeat_seed in enumerate(repeat_seeds):
+        mask = np.random.default_rng(repeat_seed).random(data.shape)
+        mask = mask > p_holdout
+        for pos, rank in enumerate(ranks):
+            _, _, train_err, test_err, _, _ = cv_pca(
+                data,
+                rank,
+                mask=mask,
+                max_iter=max_iter,
+                tol=tol,
+                seed=int(repeat_seed.generate_state(1)[0]),
+            )
+            train_errs[pos, repeat] = train_err
+            test_errs[pos, repeat] = test_err
+    best_rank = ranks[int(np.argmin(test_errs.mean(axis=1)))]
+    return best_rank, train_errs, test_errs
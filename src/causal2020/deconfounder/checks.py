@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Posterior predictive checks of the factor models used by the deconfounder,
+following the held-out entry checks of Wang and Blei (2019).
+"""
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from causal2020.deconfounder.ppca import PPCAFit
+
+
+def _sample_means(
+    fit: PPCAFit, num_draws: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Draws `num_draws` samples of the coefficients and substitute confounders
+    from their posteriors and returns the implied means of the data, with
+    shape `(num_draws, num_rows, data_dim)`.
+    """
+    w_draws = rng.normal(
+        fit.w_mean, fit.w_std, size=(num_draws,) + fit.w_mean.shape
+    )
+    z_draws = rng.normal(
+        fit.z_mean, fit.z_std, size=(num_draws,) + fit.z_mean.shape
+    )
+    return np.matmul(z_draws, w_draws) + fit.mean
+
+
+def heldout_predictive_check(
+    x: np.ndarray,
+    fit: PPCAFit,
+    holdout_mask: Optional[np.ndarray] = None,
+    num_replicates: int = 100,
+    num_eval: int = 100,
+    sigma: Optional[float] = None,
+    seed: Optional[int] = None,
+    chunk_size: int = 10,
+) -> Tuple[float, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Performs the held-out posterior predictive check of a fitted factor model.
+    Replicated held-out entries are drawn from the posterior predictive
+    distribution, and the average log-likelihood of each row's held-out
+    entries is compared between the observed and replicated data.
+
+    Parameters
+    ----------
+    x : 2D np.ndarray.
+        Shape `(num_rows, data_dim)`. The data the factor model was fit to,
+        including the held-out entries.
+    fit : PPCAFit.
+        The factor model fitted with the held-out entries masked.
+    holdout_mask : optional, 2D np.ndarray of bools or None.
+        Shape `(num_rows, data_dim)`. True for held-out entries. If None,
+        `fit.holdout_mask` is used. Default is None.
+    num_replicates : optional, positive int.
+        The number of replicated datasets to draw. Default == 100.
+    num_eval : optional, positive int.
+        The number of posterior draws of the coefficients and substitute
+        confounders used to evaluate the log-likelihoods. Default == 100.
+    sigma : optional, positive float or None.
+        The noise standard deviation of the factor model. If None, `fit.sigma`
+        is used. Default is None.
+    seed : optional, int or None.
+        The random seed to be used to ensure reproducibility. Default is None.
+    chunk_size : optional, positive int.
+        The number of replicates or posterior draws that are held in memory
+        at once. Default == 10.
+
+    Returns
+    -------
+    overall_pvalue : float.
+        The mean of `pvalues` over the rows with at least one held-out entry.
+    pvalues : 1D np.ndarray.
+        Shape `(num_rows,)`. The fraction of replicates whose average held-out
+        log-likelihood is lower than that of the observed data, for each row.
+    obs_ll : 1D np.ndarray.
+        Shape `(num_rows,)`. The observed data's average held-out
+        log-likelihood for each row.
+    rep_ll : 2D np.ndarray.
+        Shape `(num_replicates, num_rows)`. The replicated datasets' average
+        held-out log-likelihood for each row.
+    """
+    if holdout_mask is None:
+        holdout_mask = fit.holdout_mask
+    if holdout_mask is None:
+        msg = "A `holdout_mask` is needed for the held-out predictive check."
+        raise ValueError(msg)
+    holdout_mask = holdout_mask.astype(bool)
+    sigma = fit.sigma if sigma is None else sigma
+    rng = np.random.default_rng(seed)
+    num_rows, data_dim = x.shape
+
+    # Accumulate the first two posterior moments of the held-out means. The
+    # average over draws of each squared error then follows in closed form:
+    # E[(x - mu)^2] = x^2 - 2 x E[mu] + E[mu^2].
+    first_moment = np.zeros((num_rows, data_dim))
+    second_moment = np.zeros((num_rows, data_dim))
+    for start in range(0, num_eval, chunk_size):
+        means = _sample_means(fit, min(chunk_size, num_eval - start), rng)
+        means *= holdout_mask
+        first_moment += means.sum(axis=0)
+        second_moment += (means ** 2).sum(axis=0)
+    first_moment /= num_eval
+    second_moment /= num_eval
+
+    log_norm_const = -0.5 * np.log(2 * np.pi * sigma ** 2)
+
+    def average_log_likelihood(x_heldout):
+        expected_squared_error = (
+            x_heldout ** 2 - 2 * x_heldout * first_moment + second_moment
+        )
+        return log_norm_const - expected_squared_error.mean(axis=-1) / (
+            2 * sigma ** 2
+        )
+
+    obs_ll = average_log_likelihood(x * holdout_mask)
+
+    # Draw the replicated held-out entries, one block of replicates at a time
+    rep_ll = np.empty((num_replicates, num_rows))
+    for start in range(0, num_replicates, chunk_size):
+        current_size = min(chunk_size, num_replicates - start)
+        x_rep = _sample_means(fit, current_size, rng)
+        x_rep += rng.normal(scale=sigma, size=x_rep.shape)
+        x_rep *= holdout_mask
+        rep_ll[start : start + current_size] = average_log_likelihood(x_rep)
+
+    pvalues = (rep_ll < obs_ll).mean(axis=0)
+    overall_pvalue = pvalues[holdout_mask.any(axis=1)].mean()
+    return overall_pvalue, pvalues, obs_ll, rep_ll
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Functions for fitting one factor model per travel mode on long-format data
+and attaching the resulting substitute confounders to that data.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from causal2020.deconfounder.ppca import fit_ppca
+from causal2020.deconfounder.ppca import make_holdout_mask
+from causal2020.deconfounder.ppca import PPCAFit
+
+
+def group_rows_by_mode(
+    mode_ids: np.ndarray,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Computes, in a single pass, the positional row indices of each mode in a
+    long-format dataset.
+
+    Parameters
+    ----------
+    mode_ids : 1D np.ndarray.
+        The alternative / mode id of each row.
+
+    Returns
+    -------
+    unique_modes : 1D np.ndarray.
+        The sorted, unique mode ids.
+    row_indices : list of 1D np.ndarrays of ints.
+        `row_indices[i]` contains, in ascending order, the positions of the
+        rows whose mode id is `unique_modes[i]`.
+    """
+    unique_modes, mode_codes = np.unique(mode_ids, return_inverse=True)
+    sorted_rows = np.argsort(mode_codes, kind="stable")
+    split_points = np.cumsum(np.bincount(mode_codes.ravel()))[:-1]
+    return unique_modes, np.split(sorted_rows, split_points)
+
+
+def _standardize(x: np.ndarray) -> np.ndarray:
+    """
+    Standardizes each column of `x`, using the sample standard deviation as in
+    `pandas.DataFrame.std`.
+    """
+    return (x - x.mean(axis=0)) / x.std(axis=0, ddof=1)
+
+
+def fit_mode_confounders(
+    data: pd.DataFrame,
+    mode_columns: Dict[int, Sequence[str]],
+    mode_id_col: str = "mode_id",
+    latent_dim: int = 1,
+    holdout_portion: Optional[float] = None,
+    seed: Optional[int] = None,
+    n_jobs: int = 1,
+) -> Tuple[np.ndarray, Dict[int, PPCAFit]]:
+    """
+    Fits a PPCA factor model to the standardized covariates of each mode and
+    scatters each mode's substitute confounder back onto the rows of `data`.
+
+    Parameters
+    ----------
+    data : pandas DataFrame.
+        Long-format dataset with one row per (observation, mode).
+    mode_columns : dict.
+        Keys are the mode ids to fit a factor model for. Values are the names
+        of the columns of `data` to be used as that mode's covariates.
+    mode_id_col : optional, str.
+        Name of the column in `data` with mode ids. Default == 'mode_id'.
+    latent_dim : optional, positive int.
+        The number of latent factors per mode. Default == 1.
+    holdout_portion : optional, float in (0, 1) or None.
+        If not None, the fraction of each mode's covariate entries to hold out
+        of the fit for predictive checks. Default is None.
+    seed : optional, int or None.
+        The random seed used to select held-out entries. Each mode receives
+        its own stream derived from `seed`. Default is None.
+    n_jobs : optional, positive int.
+        Number of threads used to fit the per-mode models. Default == 1.
+
+    Returns
+    -------
+    confounders : 2D np.ndarray.
+        Shape `(data.shape[0], latent_dim)`. The posterior mean substitute
+        confounder of each row's mode, and zero for rows of modes that are not
+        keys of `mode_columns`.
+    fits : dict.
+        Keys are the mode ids of `mode_columns`. Values are the PPCAFit of
+        each mode.
+    """
+    # Find the rows of every mode in one pass over the mode ids
+    unique_modes, row_indices = group_rows_by_mode(
+        data[mode_id_col].to_numpy()
+    )
+    rows_per_mode = dict(zip(unique_modes.tolist(), row_indices))
+    missing_modes = [m for m in mode_columns if m not in rows_per_mode]
+    if missing_modes:
+        msg = "Modes {} do not occur in `data`.".format(missing_modes)
+        raise ValueError(msg)
+
+    modes = list(mode_columns)
+    mode_seeds = np.random.SeedSequence(seed).spawn(len(modes))
+
+    # Extract every needed column from the DataFrame only once
+    all_columns = list(
+        dict.fromkeys(col for mode in modes for col in mode_columns[mode])
+    )
+    all_values = data[all_columns].to_numpy(dtype=float)
+    column_positions = {col: pos for pos, col in enumerate(all_columns)}
+
+    def fit_mode(position):
+        mode = modes[position]
+        col_idxs = [column_positions[col] for col in mode_columns[mode]]
+        x = _standardize(all_values[np.ix_(rows_per_mode[mode], col_idxs)])
+        holdout_mask = None
+        if holdout_portion is not None:
+            holdout_mask, _ = make_holdout_mask(
+                *x.shape, holdout_portion, seed=mode_seeds[position]
+            )
+        return fit_ppca(x, latent_dim, holdout_mask=holdout_mask)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        fits = dict(zip(modes, executor.map(fit_mode, range(len(modes)))))
+
+    # Scatter all confounders back with a single indexed assignment
+    confounders = np.zeros((data.shape[0], latent_dim))
+    if modes:
+        all_rows = np.concatenate([rows_per_mode[mode] for mode in modes])
+        confounders[all_rows] = np.concatenate(
+            [fits[mode].z_mean for mode in modes], axis=0
+        )
+    return confounders, fits
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Probabilistic principal component analysis (PPCA) for estimating substitute
+confounders with the deconfounder of Wang and Blei (2019).
+
+The factor model is `X = Z W + mu + epsilon`, with `epsilon ~ N(0, sigma^2)`.
+The maximum likelihood solution of Tipping and Bishop (1999) is computed in
+closed form from an eigendecomposition of the sample covariance. When entries
+of `X` are held out for predictive checks, an EM algorithm that ignores the
+held-out entries is used instead. For wide data, the leading eigenpairs can
+instead be found with a randomized range finder (Halko et al., 2011).
+"""
+from typing import Callable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+
+class PPCAFit(NamedTuple):
+    """
+    Fitted parameters of a PPCA model.
+
+    w_mean, w_std : 2D np.ndarray of shape `(latent_dim, data_dim)`.
+        Posterior means and standard deviations of the factor coefficients,
+        given the posterior of the substitute confounders and a standard
+        normal prior on the coefficients.
+    z_mean, z_std : 2D np.ndarray of shape `(num_rows, latent_dim)`.
+        Posterior means and standard deviations of the substitute confounders.
+    mean : 1D np.ndarray of shape `(data_dim,)`.
+        Estimated mean of each column of the data.
+    sigma : float.
+        Maximum likelihood estimate of the noise standard deviation.
+    holdout_mask : 2D np.ndarray of bools or None.
+        Shape `(num_rows, data_dim)`. True for the entries that were held out
+        of the fit. None if no entries were held out.
+    heldout_reconstruction : 2D np.ndarray or None.
+        Shape `(num_rows, data_dim)`. The posterior mean reconstruction,
+        `z_mean @ w_mean + mean`, on the held-out entries and zero elsewhere.
+        None if no entries were held out.
+    num_iterations : int.
+        Number of EM iterations used. Zero for the closed-form solution.
+    """
+
+    w_mean: np.ndarray
+    w_std: np.ndarray
+    z_mean: np.ndarray
+    z_std: np.ndarray
+    mean: np.ndarray
+    sigma: float
+    holdout_mask: Optional[np.ndarray]
+    heldout_reconstruction: Optional[np.ndarray]
+    num_iterations: int
+
+
+def make_holdout_mask(
+    num_rows: int,
+    data_dim: int,
+    holdout_portion: float,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Randomly selects entries of a `(num_rows, data_dim)` matrix to be held
+    out, as in the deconfounder tutorial of Wang and Blei.
+
+    Parameters
+    ----------
+    num_rows, data_dim : positive int.
+        The shape of the data matrix.
+    holdout_portion : float in (0, 1).
+        The fraction of entries to sample (with replacement) for holdout.
+    seed : optional, int or None.
+        The random seed to be used to ensure reproducibility. Default is None.
+
+    Returns
+    -------
+    holdout_mask : 2D np.ndarray of bools.
+        True for held-out entries.
+    holdout_rows : 1D np.ndarray of ints.
+        The row index of each sampled holdout entry.
+    """
+    rng = np.random.default_rng(seed)
+    num_holdout = int(holdout_portion * num_rows * data_dim)
+    holdout_rows = rng.integers(num_rows, size=num_holdout)
+    holdout_cols = rng.integers(data_dim, size=num_holdout)
+
+    holdout_mask = np.zeros((num_rows, data_dim), dtype=bool)
+    holdout_mask[holdout_rows, holdout_cols] = True
+    return holdout_mask, holdout_rows
+
+
+def _closed_form_ppca(
+    x_centered: np.ndarray, latent_dim: int
+) -> Tuple[np.ndarray, float]:
+    """
+    Computes the Tipping and Bishop maximum likelihood estimates of the
+    coefficients, with shape `(latent_dim, data_dim)`, and of the noise
+    variance, for centered data.
+    """
+    num_rows, data_dim = x_centered.shape
+    covariance = x_centered.T @ x_centered / num_rows
+    eigvals, eigvecs = np.linalg.eigh(covariance)
+    # Sort the eigenvalues in descending order
+    eigvals, eigvecs = eigvals[::-1], eigvecs[:, ::-1]
+    return _ppca_from_eigenpairs(
+        eigvals[:latent_dim],
+        eigvecs[:, :latent_dim],
+        np.trace(covariance),
+        latent_dim,
+    )
+
+
+def _ppca_from_eigenpairs(
+    top_eigvals: np.ndarray,
+    top_eigvecs: np.ndarray,
+    total_variance: float,
+    latent_dim: int,
+) -> Tuple[np.ndarray, float]:
+    """
+    Computes the Tipping and Bishop maximum likelihood estimates from the
+    leading `latent_dim` eigenpairs of the sample covariance and its trace.
+    The noise variance is the mean of the remaining eigenvalues, which only
+    depends on their sum.
+    """
+    data_dim = top_eigvecs.shape[0]
+    if latent_dim < data_dim:
+        sigma2 = (total_variance - top_eigvals.sum()) / (data_dim - latent_dim)
+    else:
+        sigma2 = 0.0
+    sigma2 = max(sigma2, np.finfo(float).eps)
+    scales = np.sqrt(np.maximum(top_eigvals - sigma2, 0))
+    w_ml = (top_eigvecs * scales).T
+    return w_ml, sigma2
+
+
+def randomized_top_eigenpairs(
+    covariance_product: Callable[[np.ndarray], np.ndarray],
+    data_dim: int,
+    latent_dim: int,
+    oversamples: int = 10,
+    num_power_iter: int = 4,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the leading eigenpairs of a covariance matrix that is only
+    accessible through products with it, using a randomized range finder with
+    power iterations.
+
+    Parameters
+    ----------
+    covariance_product : callable.
+        Takes a 2D np.ndarray `omega` of shape `(data_dim, k)` and returns the
+        product of the covariance matrix with `omega`. Called
+        `num_power_iter + 2` times, e.g. once per pass over the data.
+    data_dim : positive int.
+        The number of rows and columns of the covariance matrix.
+    latent_dim : positive int.
+        The number of leading eigenpairs to return.
+    oversamples : optional, non-negative int.
+        The number of extra random directions used to find the range of the
+        covariance matrix. Default == 10.
+    num_power_iter : optional, non-negative int.
+        The number of power iterations. Default == 4.
+    seed : optional, int or None.
+        The random seed to be used to ensure reproducibility. Default is None.
+
+    Returns
+    -------
+    eigvals : 1D np.ndarray.
+        Shape `(latent_dim,)`. The leading eigenvalues in descending order.
+    eigvecs : 2D np.ndarray.
+        Shape `(data_dim, latent_dim)`. The corresponding eigenvectors.
+    """
+    rng = np.random.default_rng(seed)
+    num_directions = min(latent_dim + oversamples, data_dim)
+    omega = rng.normal(size=(data_dim, num_directions))
+    basis, _ = np.linalg.qr(covariance_product(omega))
+    for _ in range(num_power_iter):
+        basis, _ = np.linalg.qr(covariance_product(basis))
+
+    # Solve the small eigenproblem of the covariance projected on the basis
+    projected = basis.T @ covariance_product(basis)
+    eigvals, small_eigvecs = np.linalg.eigh((projected + projected.T) / 2)
+    eigvals, small_eigvecs = eigvals[::-1], small_eigvecs[:, ::-1]
+    eigvecs = basis @ small_eigvecs[:, :latent_dim]
+    return eigvals[:latent_dim], eigvecs
+
+
+def _posterior_z(
+    x_centered: np.ndarray, obs_mask: np.ndarray, w: np.ndarray, sigma2: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the posterior means, shape `(num_rows, latent_dim)`, and
+    covariances, shape `(num_rows, latent_dim, latent_dim)`, of the substitute
+    confounders using only the observed entries of each row.
+    """
+    num_rows, latent_dim = x_centered.shape[0], w.shape[0]
+    # Sum the outer products of the observed coefficient columns of each row
+    outer_products = (w[:, None, :] * w[None, :, :]).reshape((-1, w.shape[1]))
+    precision = (obs_mask @ outer_products.T).reshape(
+        (num_rows, latent_dim, latent_dim)
+    )
+    precision += sigma2 * np.eye(latent_dim)
+    z_cov = sigma2 * np.linalg.inv(precision)
+    projected = (x_centered * obs_mask) @ w.T
+    z_mean = np.einsum("nkl,nl->nk", z_cov, projected) / sigma2
+    return z_mean, z_cov
+
+
+def _posterior_w(
+    x_centered: np.ndarray,
+    obs_mask: np.ndarray,
+    z_mean: np.ndarray,
+    z_cov: np.ndarray,
+    sigma2: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the posterior means and standard deviations of the coefficients,
+    each with shape `(latent_dim, data_dim)`, given the posterior of the
+    substitute confounders and a standard normal prior on the coefficients.
+    """
+    latent_dim = z_mean.shape[1]
+    second_moments = z_cov + np.einsum("nk,nl->nkl", z_mean, z_mean)
+    precision = np.einsum("nj,nkl->jkl", obs_mask, second_moments) / sigma2
+    precision += np.eye(latent_dim)
+    w_cov = np.linalg.inv(precision)
+    projected = np.einsum("nj,nk->jk", x_centered * obs_mask, z_mean) / sigma2
+    w_mean = np.einsum("jkl,jl->kj", w_cov, projected)
+    w_std = np.sqrt(np.diagonal(w_cov, axis1=1, axis2=2)).T
+    return w_mean, w_std
+
+
+def _em_ppca(
+    x_centered: np.ndarray,
+    obs_mask: np.ndarray,
+    latent_dim: int,
+    max_iter: int,
+    tol: float,
+) -> Tuple[np.ndarray, float, int]:
+    """
+    Estimates the coefficients and noise variance of PPCA by EM, using only
+    the entries where `obs_mask` is one. The algorithm starts from the closed
+    form solution for the data with unobserved entries set to their means.
+    """
+    w, sigma2 = _closed_form_ppca(x_centered * obs_mask, latent_dim)
+    num_rows, data_dim = x_centered.shape
+    num_observed = obs_mask.sum()
+    x_observed = x_centered * obs_mask
+    sum_squares = (x_observed ** 2).sum()
+
+    prev_sigma2 = np.inf
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        # E-step: posterior moments of the substitute confounders
+        z_mean, z_cov = _posterior_z(x_centered, obs_mask, w, sigma2)
+        second_moments = z_cov + np.einsum("nk,nl->nkl", z_mean, z_mean)
+
+        # M-step: update each column's coefficients, then the noise variance
+        lhs = (obs_mask.T @ second_moments.reshape((num_rows, -1))).reshape(
+            (data_dim, latent_dim, latent_dim)
+        )
+        rhs = x_observed.T @ z_mean
+        w = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0].T
+
+        cross_term = (x_observed * (z_mean @ w)).sum()
+        quad_term = np.einsum("kj,jkl,lj->", w, lhs, w)
+        sigma2 = (sum_squares - 2 * cross_term + quad_term) / num_observed
+        sigma2 = max(sigma2, np.finfo(float).eps)
+
+        if abs(prev_sigma2 - sigma2) <= tol * sigma2:
+            break
+        prev_sigma2 = sigma2
+    return w, sigma2, iteration
+
+
+def fit_ppca(
+    X: np.ndarray,
+    latent_dim: int,
+    holdout_mask: Optional[np.ndarray] = None,
+    method: str = "auto",
+    max_iter: int = 500,
+    tol: float = 1e-6,
+    seed: Optional[int] = None,
+) -> PPCAFit:
+    """
+    Fits a PPCA model to `X` and computes the posterior of the substitute
+    confounders.
+
+    Parameters
+    ----------
+    X : 2D np.ndarray.
+        Should have shape `(num_rows, data_dim)`. Denotes the covariates to be
+        used to infer the substitute confounders. Usually standardized.
+    latent_dim : positive int.
+        The number of latent factors to be estimated.
+    holdout_mask : optional, 2D np.ndarray of bools or None.
+        Should have the same shape as `X`. True for entries to be held out of
+        the fit, e.g. for later predictive checks. Default is None.
+    method : optional, str.
+        One of 'closed_form', 'randomized', 'em', or 'auto'. 'closed_form'
+        uses the Tipping and Bishop maximum likelihood solution and cannot be
+        combined with `holdout_mask`. 'randomized' computes the same solution
+        from randomized estimates of the leading eigenpairs, which is faster
+        for wide data. 'em' uses the EM algorithm on the entries that are not
+        held out. 'auto' uses 'closed_form' if `holdout_mask` is None and
+        'em' otherwise. Default == 'auto'.
+    max_iter : optional, positive int.
+        The maximum number of EM iterations. Default == 500.
+    tol : optional, positive float.
+        The EM algorithm stops when the relative change in the noise variance
+        is below `tol`. Default == 1e-6.
+    seed : optional, int or None.
+        The random seed used by the 'randomized' method. Default is None.
+
+    Returns
+    -------
+    fit : PPCAFit
+        The fitted parameters and posterior of the substitute confounders.
+    """
+    if X.ndim != 2:
+        raise ValueError("`X` MUST be a 2D ndarray.")
+    if holdout_mask is not None and holdout_mask.shape != X.shape:
+        raise ValueError("`holdout_mask` MUST have the same shape as `X`.")
+    if method == "auto":
+        method = "closed_form" if holdout_mask is None else "em"
+    if method not in ("closed_form", "randomized", "em"):
+        msg = (
+            "`method` MUST be one of 'closed_form', 'randomized', 'em', "
+            "or 'auto'."
+        )
+        raise ValueError(msg)
+    if method != "em" and holdout_mask is not None:
+        msg = "The {} solution cannot honour `holdout_mask`.".format(method)
+        raise ValueError(msg)
+
+    X = np.asarray(X, dtype=float)
+    obs_mask = (
+        np.ones(X.shape)
+        if holdout_mask is None
+        else (~holdout_mask.astype(bool)).astype(float)
+    )
+
+    # Estimate the column means from the observed entries only
+    column_counts = np.maximum(obs_mask.sum(axis=0), 1)
+    mean = (X * obs_mask).sum(axis=0) / column_counts
+    x_centered = X - mean
+
+    if method == "closed_form":
+        w_ml, sigma2 = _closed_form_ppca(x_centered, latent_dim)
+        num_iterations = 0
+    elif method == "randomized":
+        num_rows = X.shape[0]
+        eigvals, eigvecs = randomized_top_eigenpairs(
+            lambda omega: x_centered.T @ (x_centered @ omega) / num_rows,
+            X.shape[1],
+            latent_dim,
+            seed=seed,
+        )
+        w_ml, sigma2 = _ppca_from_eigenpairs(
+            eigvals, eigvecs, (x_centered ** 2).sum() / num_rows, latent_dim
+        )
+        num_iterations = 0
+    else:
+        w_ml, sigma2, num_iterations = _em_ppca(
+            x_centered, obs_mask, latent_dim, max_iter, tol
+        )
+
+    # Compute the posteriors of the substitute confounders and coefficients
+    z_mean, z_cov = _posterior_z(x_centered, obs_mask, w_ml, sigma2)
+    z_std = np.sqrt(np.diagonal(z_cov, axis1=1, axis2=2))
+    w_mean, w_std = _posterior_w(x_centered, obs_mask, z_mean, z_cov, sigma2)
+
+    heldout_reconstruction = None
+    if holdout_mask is not None:
+        heldout_reconstruction = (z_mean @ w_mean + mean) * holdout_mask
+    return PPCAFit(
+        w_mean=w_mean,
+        w_std=w_std,
+        z_mean=z_mean,
+        z_std=z_std,
+        mean=mean,
+        sigma=np.sqrt(sigma2),
+        holdout_mask=holdout_mask,
+        heldout_reconstruction=heldout_reconstruction,
+        num_iterations=num_iterations,
+    )
+
+
+def confounder_ppca(
+    X: np.ndarray,
+    latent_dim: int,
+    holdout_portion: float,
+    seed: Optional[int] = None,
+) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Estimates a substitute confounder using PPCA, with the same inputs and
+    outputs as the TensorFlow-based `confounder_ppca` of the project's
+    notebooks.
+
+    Parameters
+    ----------
+    X : 2D np.ndarray.
+        Should have shape `(num_rows, data_dim)`. Denotes the original
+        covariates.
+    latent_dim : positive int.
+        The number of latent factors to be estimated.
+    holdout_portion : float in (0, 1).
+        Fraction of the entries of `X` to be used as holdout.
+    seed : optional, int or None.
+        The random seed used to select the held-out entries. Default is None.
+
+    Returns
+    -------
+    params : list of 2D np.ndarrays.
+        `[w_mean, w_std, z_mean, z_std]`. See `PPCAFit`.
+    x_vad : 2D np.ndarray.
+        `X` on the held-out entries and zero elsewhere.
+    holdout_mask : 2D np.ndarray.
+        One on the held-out entries and zero elsewhere.
+    holdout_rows : 1D np.ndarray of ints.
+        Row indices of the held-out entries.
+    """
+    X = np.asarray(X, dtype=float)
+    holdout_mask, holdout_rows = make_holdout_mask(
+        X.shape[0], X.shape[1], holdout_portion, seed=seed
+    )
+    fit = fit_ppca(X, latent_dim, holdout_mask=holdout_mask)
+
+    params = [fit.w_mean, fit.w_std, fit.z_mean, fit.z_std]
+    x_vad = X * holdout_mask
+    return params, x_vad, holdout_mask.astype(float), holdout_rows
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+A versioned, on-disk store for fitted factor-model parameters. Each artifact
+is a directory of `.npy` files, which can be memory-mapped when loaded, plus a
+JSON manifest recording the settings and data the parameters were fit with.
+"""
+import hashlib
+import json
+import os
+import uuid
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from causal2020.deconfounder.ppca import fit_ppca
+from causal2020.deconfounder.ppca import make_holdout_mask
+from causal2020.deconfounder.ppca import PPCAFit
+
+ARTIFACT_MANIFEST = "manifest.json"
+
+ARTIFACT_VERSION = 1
+
+
+def hash_array(array: np.ndarray) -> str:
+    """
+    Computes a hex digest identifying the shape, dtype, and contents of
+    `array`.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str((array.shape, array.dtype.str)).encode())
+    hasher.update(np.ascontiguousarray(array).tobytes())
+    return hasher.hexdigest()
+
+
+def _read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads the manifest of the artifact in `directory`, or returns None if
+    there is none.
+    """
+    manifest_path = os.path.join(directory, ARTIFACT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_artifact(
+    directory: str, arrays: Dict[str, np.ndarray], settings: Dict[str, Any]
+) -> None:
+    """
+    Saves `arrays` as one `.npy` file each, and then atomically writes the
+    manifest so that a partially written artifact is never loaded. Every save
+    uses new file names, so memory maps of a previous save stay valid.
+
+    Parameters
+    ----------
+    directory : str.
+        The artifact directory. Created if needed.
+    arrays : dict.
+        Keys are array names, which prefix the file names. Values are the
+        arrays.
+    settings : dict.
+        JSON-serializable description of how the arrays were produced.
+    """
+    os.makedirs(directory, exist_ok=True)
+    old_manifest = _read_manifest(directory)
+
+    token = uuid.uuid4().hex[:12]
+    file_names = {}
+    for name, array in arrays.items():
+        file_names[name] = "{}.{}.npy".format(name, token)
+        np.save(os.path.join(directory, file_names[name]), array)
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "settings": settings,
+        "arrays": file_names,
+    }
+    manifest_path = os.path.join(directory, ARTIFACT_MANIFEST)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+    # Unlinking the previous files leaves any open memory maps of them intact
+    if old_manifest is not None and isinstance(
+        old_manifest.get("arrays"), dict
+    ):
+        for file_name in old_manifest["arrays"].values():
+            old_path = os.path.join(directory, file_name)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    return None
+
+
+def load_artifact(
+    directory: str,
+    settings: Optional[Dict[str, Any]] = None,
+    mmap_mode: Optional[str] = "r",
+) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Loads the arrays of an artifact saved with `save_artifact`.
+
+    Parameters
+    ----------
+    directory : str.
+        The artifact directory.
+    settings : optional, dict or None.
+        If not None, the artifact is only loaded if its manifest records
+        exactly these settings. Default is None.
+    mmap_mode : optional, str or None.
+        Passed to `np.load`. With the default, the arrays are read-only
+        memory maps of the files rather than copies. Default == 'r'.
+
+    Returns
+    -------
+    arrays : dict or None.
+        Keys are array names and values are the arrays. None if the artifact
+        does not exist, was written by another version, or has different
+        settings.
+    """
+    manifest = _read_manifest(directory)
+    if manifest is None or manifest.get("version") != ARTIFACT_VERSION:
+        return None
+    # Round-trip through JSON so that e.g. tuples compare equal to lists
+    if settings is not None and manifest["settings"] != json.loads(
+        json.dumps(settings)
+    ):
+        return None
+
+    return {
+        name: np.load(os.path.join(directory, file_name), mmap_mode)
+        for name, file_name in manifest["arrays"].items()
+    }
+
+
+def _ppca_fit_to_arrays(fit: PPCAFit) -> Dict[str, np.ndarray]:
+    """
+    Converts the fields of `fit` that are not None into named arrays.
+    """
+    return {
+        name: np.asarray(value)
+        for name, value in fit._asdict().items()
+        if value is not None
+    }
+
+
+def _ppca_fit_from_arrays(arrays: Dict[str, np.ndarray]) -> PPCAFit:
+    """
+    Rebuilds a PPCAFit from the output of `_ppca_fit_to_arrays`.
+    """
+    fields = {name: arrays.get(name) for name in PPCAFit._fields}
+    fields["sigma"] = float(fields["sigma"])
+    fields["num_iterations"] = int(fields["num_iterations"])
+    return PPCAFit(**fields)
+
+
+def load_or_fit_ppca(
+    X: np.ndarray,
+    latent_dim: int,
+    directory: str,
+    holdout_portion: Optional[float] = None,
+    seed: Optional[int] = None,
+    mmap_mode: Optional[str] = "r",
+    **fit_kwargs: Any,
+) -> Tuple[PPCAFit, bool]:
+    """
+    Loads the PPCA fit stored in `directory` if it was fit to the same data
+    with the same settings. Otherwise, fits the model and stores it.
+
+    Parameters
+    ----------
+    X : 2D np.ndarray.
+        The covariates to be used to infer the substitute confounders.
+    latent_dim : positive int.
+        The number of latent factors to be estimated.
+    directory : str.
+        The artifact directory.
+    holdout_portion : optional, float in (0, 1) or None.
+        If not None, the fraction of entries of `X` to hold out of the fit.
+        See `make_holdout_mask`. Default is None.
+    seed : optional, int or None.
+        The random seed used to select the held-out entries and by the
+        'randomized' method. If None, such fits are never loaded from
+        `directory`. Default is None.
+    mmap_mode : optional, str or None.
+        See `load_artifact`. Default == 'r'.
+    fit_kwargs :
+        Keyword arguments passed to `fit_ppca`, e.g. `method` or `tol`.
+
+    Returns
+    -------
+    fit : PPCAFit
+        The fitted parameters and posterior of the substitute confounders.
+    loaded : bool.
+        True if `fit` was loaded from `directory` and False if it was refit.
+    """
+    X = np.asarray(X, dtype=float)
+    settings = {
+        "data_hash": hash_array(X),
+        "latent_dim": latent_dim,
+        "holdout_portion": holdout_portion,
+        "seed": seed,
+        "fit_kwargs": fit_kwargs,
+    }
+    # Fits that depend on an unseeded random stream are never reused
+    randomized = fit_kwargs.get("method") == "randomized"
+    if seed is not None or (holdout_portion is None and not randomized):
+        arrays = load_artifact(directory, settings, mmap_mode)
+        if arrays is not None:
+            return _ppca_fit_from_arrays(arrays), True
+
+    holdout_mask = None
+    if holdout_portion is not None:
+        holdout_mask, _ = make_holdout_mask(
+            X.shape[0], X.shape[1], holdout_portion, seed=seed
+        )
+    if randomized:
+        fit_kwargs = dict(fit_kwargs, seed=seed)
+    fit = fit_ppca(X, latent_dim, holdout_mask=holdout_mask, **fit_kwargs)
+    save_artifact(directory, _ppca_fit_to_arrays(fit), settings)
+    return fit, False
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+PPCA for data that is too large to hold in memory. The data is read from
+disk in chunks of rows, and each pass over the data costs time linear in the
+number of rows and memory linear in the chunk size.
+"""
+import os
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+from typing import Sequence
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from causal2020.deconfounder.ppca import _ppca_from_eigenpairs
+from causal2020.deconfounder.ppca import PPCAFit
+from causal2020.deconfounder.ppca import randomized_top_eigenpairs
+
+SOURCE_TYPE = Union[str, os.PathLike, np.ndarray]
+
+
+def make_chunk_reader(
+    source: SOURCE_TYPE,
+    chunk_size: int = 100000,
+    columns: Optional[Sequence[str]] = None,
+) -> Callable[[], Iterator[np.ndarray]]:
+    """
+    Creates a function that iterates over the rows of `source` in chunks.
+    Each call of the returned function starts a new pass over the data.
+
+    Parameters
+    ----------
+    source : str, os.PathLike, or 2D np.ndarray.
+        A path to a `.npy` file, which is memory-mapped, a path to a `.csv`
+        file, which is read with `pandas.read_csv`, or an array such as a
+        `np.memmap`.
+    chunk_size : optional, positive int.
+        The number of rows per chunk. Default == 100000.
+    columns : optional, list of str or None.
+        The columns of a `.csv` file to be used. If None, all columns are
+        used. Ignored for other sources. Default is None.
+
+    Returns
+    -------
+    read_chunks : callable.
+        Takes no arguments and returns an iterator of 2D np.ndarrays of floats.
+    """
+    if isinstance(source, np.ndarray):
+        array = source
+    elif str(source).endswith(".npy"):
+        array = np.load(source, mmap_mode="r")
+    elif str(source).endswith(".csv"):
+
+        def read_csv_chunks():
+            for chunk in pd.read_csv(
+                source, usecols=columns, chunksize=chunk_size
+            ):
+                yield chunk.to_numpy(dtype=float)
+
+        return read_csv_chunks
+    else:
+        msg = "`source` MUST be an array or a path to a .npy or .csv file."
+        raise ValueError(msg)
+
+    if array.ndim != 2:
+        raise ValueError("`source` MUST contain a 2D array.")
+
+    def read_array_chunks():
+        for start in range(0, array.shape[0], chunk_size):
+            yield np.asarray(array[start : start + chunk_size], dtype=float)
+
+    return read_array_chunks
+
+
+def fit_ppca_streaming(
+    source: SOURCE_TYPE,
+    latent_dim: int,
+    method: str = "randomized",
+    chunk_size: int = 100000,
+    columns: Optional[Sequence[str]] = None,
+    oversamples: int = 10,
+    num_power_iter: int = 4,
+    seed: Optional[int] = None,
+) -> PPCAFit:
+    """
+    Fits a PPCA model to data read in chunks of rows, and computes the
+    posterior of the substitute confounders. Gives the same result as
+    `fit_ppca(X, latent_dim, method=method)` without loading `X` into memory.
+
+    Parameters
+    ----------
+    source : str, os.PathLike, or 2D np.ndarray.
+        The data. See `make_chunk_reader`.
+    latent_dim : positive int.
+        The number of latent factors to be estimated.
+    method : optional, str.
+        'closed_form' accumulates the full `(data_dim, data_dim)` sample
+        covariance, using three passes over the data. 'randomized' only
+        accumulates products of the covariance with `latent_dim + oversamples`
+        directions, using `num_power_iter + 4` passes, and should be used for
+        wide data. Default == 'randomized'.
+    chunk_size : optional, positive int.
+        The number of rows read at once. Default == 100000.
+    columns : optional, list of str or None.
+        The columns of a `.csv` source to be used. Default is None.
+    oversamples : optional, non-negative int.
+        See `randomized_top_eigenpairs`. Default == 10.
+    num_power_iter : optional, non-negative int.
+        See `randomized_top_eigenpairs`. Default == 4.
+    seed : optional, int or None.
+        The random seed used by the 'randomized' method. Default is None.
+
+    Returns
+    -------
+    fit : PPCAFit
+        The fitted parameters and posterior of the substitute confounders.
+        Entries cannot be held out, so `holdout_mask` and
+        `heldout_reconstruction` are None.
+    """
+    if method not in ("closed_form", "randomized"):
+        msg = "`method` MUST be one of 'closed_form' or 'randomized'."
+        raise ValueError(msg)
+    read_chunks = make_chunk_reader(source, chunk_size, columns)
+
+    # First pass: the number of rows, column means, and total variance.
+    # Each chunk's mean and sum of squared deviations are merged as in Chan
+    # et al. (1979), which avoids the cancellation of E[x^2] - E[x]^2
+    num_rows, mean, sum_sq_dev = 0, 0.0, 0.0
+    for chunk in read_chunks():
+        chunk_rows = chunk.shape[0]
+        chunk_mean = chunk.mean(axis=0)
+        delta = chunk_mean - mean
+        sum_sq_dev = (
+            sum_sq_dev
+            + ((chunk - chunk_mean) ** 2).sum(axis=0)
+            + delta ** 2 * num_rows * chunk_rows / (num_rows + chunk_rows)
+        )
+        num_rows += chunk_rows
+        mean = mean + delta * chunk_rows / num_rows
+    total_variance = (sum_sq_dev / num_rows).sum()
+    data_dim = mean.shape[0]
+
+    def covariance_product(omega):
+        product = np.zeros(omega.shape)
+        for chunk in read_chunks():
+            centered = chunk - mean
+            product += centered.T @ (centered @ omega)
+        return product / num_rows
+
+    if method == "closed_form":
+        covariance = covariance_product(np.eye(data_dim))
+        eigvals, eigvecs = np.linalg.eigh(covariance)
+        eigvals = eigvals[::-1][:latent_dim]
+        eigvecs = eigvecs[:, ::-1][:, :latent_dim]
+        total_variance = np.trace(covariance)
+    else:
+        eigvals, eigvecs = randomized_top_eigenpairs(
+            covariance_product,
+            data_dim,
+            latent_dim,
+            oversamples=oversamples,
+            num_power_iter=num_power_iter,
+            seed=seed,
+        )
+    w_ml, sigma2 = _ppca_from_eigenpairs(
+        eigvals, eigvecs, total_variance, latent_dim
+    )
+
+    # Last pass: without held-out entries, every row shares the posterior
+    # covariance of the substitute confounders and every column shares the
+    # posterior covariance of the coefficients.
+    z_precision = w_ml @ w_ml.T + sigma2 * np.eye(latent_dim)
+    z_cov = sigma2 * np.linalg.inv(z_precision)
+    z_mean_parts = []
+    z_sum_squares = np.zeros((latent_dim, latent_dim))
+    x_z_products = np.zeros((data_dim, latent_dim))
+    for chunk in read_chunks():
+        centered = chunk - mean
+        chunk_z_mean = centered @ w_ml.T @ z_cov / sigma2
+        z_mean_parts.append(chunk_z_mean)
+        z_sum_squares += chunk_z_mean.T @ chunk_z_mean
+        x_z_products += centered.T @ chunk_z_mean
+    z_mean = np.concatenate(z_mean_parts, axis=0)
+    z_std = np.broadcast_to(np.sqrt(np.diag(z_cov)), z_mean.shape).copy()
+
+    w_precision = (num_rows * z_cov + z_sum_squares) / sigma2
+    w_cov = np.linalg.inv(w_precision + np.eye(latent_dim))
+    w_mean = w_cov @ x_z_products.T / sigma2
+    w_std = np.broadcast_to(
+        np.sqrt(np.diag(w_cov))[:, None], w_mean.shape
+    ).copy()
+    return PPCAFit(
+        w_mean=w_mean,
+        w_std=w_std,
+        z_mean=z_mean,
+        z_std=z_std,
+        mean=mean,
+        sigma=np.sqrt(sigma2),
+        holdout_mask=None,
+        heldout_reconstruction=None,
+        num_iterations=0,
+    )
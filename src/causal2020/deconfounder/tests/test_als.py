@@ -0,0 +1,59 @@
+import numpy as np
+from causal2020.deconfounder.als import censored_lstsq
+from causal2020.deconfounder.als import select_rank_cv
+
+
+def test_censored_lstsq_matches_per_column_solve():
+    # Setup
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(30, 3))
+    B = rng.normal(size=(30, 50))
+    M = rng.random(B.shape) > 0.3
+    # Repeat some missingness patterns so columns share factorizations
+    M[:, 25:] = M[:, :25]
+
+    # Exercise
+    X = censored_lstsq(A, B, M)
+
+    # Verify
+    for col in range(B.shape[1]):
+        rows = M[:, col]
+        expected, *_ = np.linalg.lstsq(A[rows], B[rows, col], rcond=None)
+        np.testing.assert_allclose(X[:, col], expected)
+
+
+def test_select_rank_cv_recovers_rank():
+    # Setup
+    rng = np.random.default_rng(1)
+    factors = rng.normal(size=(500, 2)) @ rng.normal(size=(2, 10))
+    data = factors + 0.1 * rng.normal(size=factors.shape)
+
+    # Exercise
+    best_rank, train_errs, test_errs = select_rank_cv(
+        data, [1, 2, 3], num_repeats=2, max_iter=200, seed=2
+    )
+
+    # Verify
+    assert best_rank == 2
+    assert test_errs.shape == (3, 2)
+
+
+def test_censored_lstsq_regularizes_only_singular_patterns():
+    # Setup
+    rng = np.random.default_rng(3)
+    A = rng.normal(size=(30, 3))
+    B = rng.normal(size=(30, 20))
+    M = rng.random(B.shape) > 0.3
+    # Leave fewer observed rows than components in the last column
+    M[:, -1] = False
+    M[:2, -1] = True
+
+    # Exercise
+    X = censored_lstsq(A, B, M)
+
+    # Verify
+    assert np.isfinite(X).all()
+    for col in range(B.shape[1] - 1):
+        rows = M[:, col]
+        expected, *_ = np.linalg.lstsq(A[rows], B[rows, col], rcond=None)
+        np.testing.assert_allclose(X[:, col], expected)
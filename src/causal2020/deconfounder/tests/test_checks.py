@@ -0,0 +1,48 @@
+import numpy as np
+from causal2020.deconfounder.checks import _sample_means
+from causal2020.deconfounder.checks import heldout_predictive_check
+from causal2020.deconfounder.ppca import fit_ppca
+from causal2020.deconfounder.ppca import make_holdout_mask
+from scipy import stats
+
+
+def test_heldout_predictive_check_matches_loop():
+    # Setup
+    rng = np.random.default_rng(0)
+    z = rng.normal(size=(300, 1))
+    x = z @ rng.normal(size=(1, 4)) + 0.2 * rng.normal(size=(300, 4))
+    holdout_mask, _ = make_holdout_mask(*x.shape, 0.2, seed=1)
+    fit = fit_ppca(x, 1, holdout_mask=holdout_mask)
+
+    # Exercise
+    overall_pvalue, pvalues, obs_ll, rep_ll = heldout_predictive_check(
+        x, fit, num_replicates=7, num_eval=5, seed=2, chunk_size=3
+    )
+
+    # Verify
+    loop_rng = np.random.default_rng(2)
+    eval_means = [
+        _sample_means(fit, size, loop_rng) * holdout_mask for size in (3, 2)
+    ]
+    eval_means = np.concatenate(eval_means)
+    replicates = []
+    for size in (3, 3, 1):
+        x_rep = _sample_means(fit, size, loop_rng)
+        x_rep += loop_rng.normal(scale=fit.sigma, size=x_rep.shape)
+        replicates.append(x_rep * holdout_mask)
+    replicates = np.concatenate(replicates)
+
+    def loop_log_likelihood(x_heldout):
+        return np.mean(
+            [
+                stats.norm(mean, fit.sigma).logpdf(x_heldout).mean(axis=-1)
+                for mean in eval_means
+            ],
+            axis=0,
+        )
+
+    np.testing.assert_allclose(obs_ll, loop_log_likelihood(x * holdout_mask))
+    np.testing.assert_allclose(rep_ll, loop_log_likelihood(replicates))
+    expected_pvalues = (rep_ll < obs_ll).mean(axis=0)
+    np.testing.assert_allclose(pvalues, expected_pvalues)
+    assert 0 <= overall_pvalue <= 1
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from causal2020.deconfounder.modes import fit_mode_confounders
+from causal2020.deconfounder.ppca import fit_ppca
+
+
+def test_fit_mode_confounders_matches_per_mode_loop():
+    # Setup
+    rng = np.random.default_rng(0)
+    num_rows = 3000
+    data = pd.DataFrame(
+        {
+            "mode_id": rng.integers(1, 5, size=num_rows),
+            "x1": rng.normal(size=num_rows),
+            "x2": rng.normal(size=num_rows),
+        }
+    )
+    data["x2"] += data["x1"]
+    mode_columns = {1: ["x1", "x2"], 3: ["x2", "x1"]}
+
+    # Exercise
+    confounders, fits = fit_mode_confounders(data, mode_columns, n_jobs=2)
+
+    # Verify
+    expected = np.zeros(num_rows)
+    for mode, columns in mode_columns.items():
+        mode_data = data.loc[data["mode_id"] == mode, columns]
+        x = np.array((mode_data - mode_data.mean()) / mode_data.std())
+        expected[data["mode_id"] == mode] = fit_ppca(x, 1).z_mean[:, 0]
+    np.testing.assert_allclose(confounders[:, 0], expected)
+    assert sorted(fits) == [1, 3]
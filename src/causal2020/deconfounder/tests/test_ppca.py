@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from causal2020.deconfounder.ppca import fit_ppca
+from causal2020.deconfounder.ppca import make_holdout_mask
+
+
+def simulate_factor_data(num_rows=2000, data_dim=5, latent_dim=1, seed=0):
+    rng = np.random.default_rng(seed)
+    z = rng.normal(size=(num_rows, latent_dim))
+    w = rng.normal(size=(latent_dim, data_dim))
+    noise = 0.2 * rng.normal(size=(num_rows, data_dim))
+    return z @ w + noise
+
+
+def test_closed_form_matches_em():
+    # Setup
+    x = simulate_factor_data()
+
+    # Exercise
+    closed_form_fit = fit_ppca(x, 1, method="closed_form")
+    em_fit = fit_ppca(x, 1, method="em", tol=1e-12)
+
+    # Verify
+    assert pytest.approx(closed_form_fit.sigma, rel=1e-6) == em_fit.sigma
+    np.testing.assert_allclose(
+        np.abs(closed_form_fit.w_mean), np.abs(em_fit.w_mean), rtol=1e-4
+    )
+
+
+def test_em_recovers_heldout_entries():
+    # Setup
+    x = simulate_factor_data()
+    holdout_mask, _ = make_holdout_mask(*x.shape, 0.2, seed=1)
+
+    # Exercise
+    fit = fit_ppca(x, 1, holdout_mask=holdout_mask)
+
+    # Verify
+    assert (fit.heldout_reconstruction[~holdout_mask] == 0).all()
+    errors = (fit.heldout_reconstruction - x)[holdout_mask]
+    assert np.sqrt((errors ** 2).mean()) < 0.3
+    assert pytest.approx(fit.sigma, rel=0.05) == 0.2
+
+
+def test_closed_form_rejects_holdout_mask():
+    # Setup
+    x = simulate_factor_data()
+    holdout_mask, _ = make_holdout_mask(*x.shape, 0.2, seed=1)
+
+    # Exercise and Verify
+    with pytest.raises(ValueError):
+        fit_ppca(x, 1, holdout_mask=holdout_mask, method="closed_form")
@@ -0,0 +1,28 @@
+import numpy as np
+from causal2020.deconfounder.store import load_or_fit_ppca
+
+
+def test_load_or_fit_ppca_reuses_and_refits(tmp_path):
+    # Setup
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(200, 1)) @ rng.normal(size=(1, 4))
+    x += 0.2 * rng.normal(size=x.shape)
+    directory = str(tmp_path / "ppca")
+
+    # Exercise
+    fit, loaded = load_or_fit_ppca(
+        x, 1, directory, holdout_portion=0.2, seed=3
+    )
+    reloaded_fit, reloaded = load_or_fit_ppca(
+        x, 1, directory, holdout_portion=0.2, seed=3
+    )
+    _, refit_loaded = load_or_fit_ppca(
+        x + 1, 1, directory, holdout_portion=0.2, seed=3
+    )
+
+    # Verify
+    assert not loaded and reloaded and not refit_loaded
+    assert isinstance(reloaded_fit.z_mean, np.memmap)
+    np.testing.assert_array_equal(reloaded_fit.z_mean, fit.z_mean)
+    np.testing.assert_array_equal(reloaded_fit.holdout_mask, fit.holdout_mask)
+    assert reloaded_fit.sigma == fit.sigma
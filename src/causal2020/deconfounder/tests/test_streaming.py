@@ -0,0 +1,41 @@
+import numpy as np
+from causal2020.deconfounder.ppca import fit_ppca
+from causal2020.deconfounder.streaming import fit_ppca_streaming
+
+
+def test_streaming_fit_matches_in_memory_fit(tmp_path):
+    # Setup
+    rng = np.random.default_rng(0)
+    z = rng.normal(size=(1000, 2))
+    x = 3 * z @ rng.normal(size=(2, 40)) + rng.normal(size=(1000, 40))
+    path = str(tmp_path / "x.npy")
+    np.save(path, x)
+    exact_fit = fit_ppca(x, 2)
+
+    for method in ["closed_form", "randomized"]:
+        # Exercise
+        fit = fit_ppca_streaming(path, 2, method=method, chunk_size=128)
+
+        # Verify
+        np.testing.assert_allclose(fit.sigma, exact_fit.sigma)
+        np.testing.assert_allclose(
+            np.abs(fit.z_mean), np.abs(exact_fit.z_mean), atol=1e-8
+        )
+        np.testing.assert_allclose(fit.z_std, exact_fit.z_std)
+        np.testing.assert_allclose(fit.w_std, exact_fit.w_std)
+
+
+def test_streaming_fit_is_stable_for_large_means(tmp_path):
+    # Setup
+    rng = np.random.default_rng(1)
+    z = rng.normal(size=(1000, 2))
+    x = 3 * z @ rng.normal(size=(2, 40)) + rng.normal(size=(1000, 40))
+    path = str(tmp_path / "x.npy")
+    np.save(path, x + 1e8)
+    exact_fit = fit_ppca(x, 2)
+
+    # Exercise
+    fit = fit_ppca_streaming(path, 2, method="randomized", chunk_size=128)
+
+    # Verify
+    np.testing.assert_allclose(fit.sigma, exact_fit.sigma, rtol=1e-6)
@@ -7,6 +7,8 @@ import random
 
 import numpy as np
 import pandas as pd
+from causal2020.observables.sampling import CategoricalSampler
+from causal2020.observables.sampling import draw_uniforms
 
 # Functions to replace within SimulateAvailability
 
@@ -34,33 +36,35 @@ def get_num_of_av_alts(data_long, obs_id_col):
 
 
 # Function to simulate availability matrix
-def sim_availability_matrix(num_alts, sim_size, alt_name_dict):
+def sim_availability_matrix(
+    num_alts, sim_size, alt_name_dict, random_state=None
+):
     """
     Get the availability matrix based on the number of
     available alternatives, the simulation size,
-    and the alternative name dictionary
+    and the alternative name dictionary. `num_alts` is
+    either the observed numbers of available alternatives
+    or a `CategoricalSampler` built from them. Draws from
+    `random_state`, a np.random.Generator, or from numpy's
+    global random state if None.
     """
     # Simulate number of available alternatives for
     # each observation in sim_data
     av_size = sim_size
-    alts_sim = np.random.choice(
-        a=np.arange(num_alts.max() + 1),
-        p=np.bincount(num_alts) / len(num_alts),
-        size=av_size,
-    )
+    if not isinstance(num_alts, CategoricalSampler):
+        num_alts = CategoricalSampler.from_observations(num_alts)
+    alts_sim = num_alts.sample(av_size, random_state)
 
     # simulate the availability matrix based on number
-    # of available alternatives
+    # of available alternatives. Ranking random keys within
+    # each row and marking the K lowest ranks as available
+    # picks a uniformly random set of K alternatives per
+    # observation, without shuffling each row in a loop
     N = len(alt_name_dict)
-    av_sim = [np.array([1] * K + [0] * (N - K)) for K in alts_sim]
-
-    # Shuffle the available alternatives for each observation
-    # because av_sim will always start with 1s
-    for x in av_sim:
-        np.random.shuffle(x)
-
-    # Shuffle the availability across different observations
-    np.random.shuffle(av_sim)
+    keys = draw_uniforms((av_size, N), random_state)
+    ranks = np.argsort(keys, axis=1)
+    ranks = np.argsort(ranks, axis=1)
+    av_sim = (ranks < np.asarray(alts_sim)[:, None]).astype(int)
 
     # Create columns for the availability matrix
     AV_columns = [alt_name_dict[i] + "_AV" for i in alt_name_dict.keys()]
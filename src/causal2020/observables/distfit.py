@@ -2,11 +2,22 @@
 Functions used in the fitting of distributions
 to variables to be simulated.
 """
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+import warnings
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
 import pandas as pd
+import scipy.optimize
+import scipy.stats
 from fitter import Fitter
+from fitter import get_common_distributions
 
 # Functions to replace code within
 # DistNodeNoParent
@@ -80,10 +91,48 @@ def get_constant_dist(var, var_val, alt_name=None):
     return constant_dict
 
 
-def get_empirical_dist(var, var_val, alt_name=None):
+def compress_empirical(var_val, max_unique=256, num_quantiles=257):
+    """
+    Summarizes the empirical distribution of a variable in
+    a fixed amount of memory.
+
+    Parameters
+    ----------
+    var_val: array-like
+        Values of the variable.
+
+    max_unique: int
+        Floating point variables with more unique values than
+        this are summarized by quantiles. Default == 256.
+
+    num_quantiles: int
+        Number of quantiles, from the minimum to the maximum,
+        kept for such variables. Their levels are spaced more
+        densely in the tails. Default == 257.
+
+    Returns
+    -------
+    dictionary with keys 'values' and 'counts', holding the
+    sorted unique values and their number of occurrences, or
+    with keys 'levels' and 'quantiles', holding increasing
+    probabilities and the corresponding quantiles.
+    """
+    values = np.asarray(var_val)
+    unique_values, counts = np.unique(values, return_counts=True)
+    if values.dtype.kind == "f" and unique_values.shape[0] > max_unique:
+        levels = (1 - np.cos(np.linspace(0, np.pi, num_quantiles))) / 2
+        levels[0], levels[-1] = 0, 1
+        return {"levels": levels, "quantiles": np.quantile(values, levels)}
+    counts = counts.astype(np.min_scalar_type(counts.max()))
+    return {"values": unique_values, "counts": counts}
+
+
+def get_empirical_dist(var, var_val, alt_name=None, compact=True):
     """
     Retrives the empirical values of the alternative
     specific variable of interest as its distribution.
+    If `compact` is True, the values are summarized with
+    `compress_empirical` instead of being stored verbatim.
     """
     empir_dict = defaultdict(dict)
     # Add name of alternative to variable and store distriburion & parameters
@@ -93,7 +142,10 @@ def get_empirical_dist(var, var_val, alt_name=None):
         else get_alt_specific_variable_name(var, alt_name)
     )
     empir_dict[var_name]["distribution"] = "empirical"
-    empir_dict[var_name]["parameters"] = np.array(var_val)
+    if compact:
+        empir_dict[var_name]["parameters"] = compress_empirical(var_val)
+    else:
+        empir_dict[var_name]["parameters"] = np.array(var_val)
     return empir_dict
 
 
@@ -113,39 +165,167 @@ def get_categorical_dist(var, var_val, alt_name=None):
         else get_alt_specific_variable_name(var, alt_name)
     )
     categ_dict[var_name]["distribution"] = "categorical"
-    np_array_range = np.arange(var_val.max() + 1)
-    array_bincount = np.bincount(var_val)
-    probs = array_bincount / len(var_val)
-    categ_dict[var_name]["parameters"] = [np_array_range, probs]
+    # Only store the observed codes, since a bincount would
+    # allocate space for every integer up to the largest code
+    values, counts = np.unique(np.asarray(var_val), return_counts=True)
+    probs = counts / counts.sum()
+    categ_dict[var_name]["parameters"] = [values, probs]
     return categ_dict
 
 
-def get_continuous_dist(var, var_val, cont_dists, alt_name=None):
+def fit_binned_mle(
+    var_val,
+    dist_name,
+    num_bins=200,
+    subsample_size=5000,
+    seed=None,
+    timeout=None,
+):
+    """
+    Fits a scipy distribution by maximizing the multinomial
+    likelihood of binned counts of the data, so that each
+    optimizer iteration costs O(num_bins) instead of O(n).
+
+    The bins have adaptive widths, with edges at quantiles
+    of a subsample, and the counts of all values are
+    computed once. The optimizer starts from the maximum
+    likelihood fit on the subsample.
+
+    Parameters
+    ----------
+    var_val: array-like
+        Values of the variable.
+
+    dist_name: str
+        Name of a continuous scipy distribution.
+
+    num_bins: int
+        Number of bins. Default == 200.
+
+    subsample_size: int
+        Number of values used for the starting fit and the
+        bin edges. Default == 5000.
+
+    seed: int or None
+        Random seed used to draw the subsample.
+
+    timeout: float or None
+        Maximum number of seconds for the fit. If not None,
+        the whole fit, including the starting fit, runs in a
+        `TimedFitRunner` worker process, and a TimeoutError is
+        raised once it is exceeded. Default is None.
+
+    Returns
+    -------
+    tuple of the fitted shape, loc and scale parameters,
+    as returned by the distribution's `fit` method.
+    """
+    if timeout is not None:
+        with TimedFitRunner() as runner:
+            return runner.run(
+                fit_binned_mle,
+                (var_val, dist_name, num_bins, subsample_size, seed),
+                timeout,
+            )
+    values = np.asarray(var_val, dtype=float)
+    dist = getattr(scipy.stats, dist_name)
+    subsample = values
+    if values.shape[0] > subsample_size:
+        rng = np.random.default_rng(seed)
+        subsample = rng.choice(values, size=subsample_size, replace=False)
+
+    edges = np.unique(np.quantile(subsample, np.linspace(0, 1, num_bins + 1)))
+    edges[0], edges[-1] = values.min(), values.max()
+    counts = np.histogram(values, bins=edges)[0]
+    # The outer bins extend to infinity so the probabilities sum to one
+    inner_edges = edges[1:-1]
+
+    def negative_log_likelihood(theta):
+        # The scale is optimized on the log scale to keep it positive
+        params = tuple(theta[:-1]) + (np.exp(theta[-1]),)
+        cdf = dist.cdf(inner_edges, *params)
+        probs = np.diff(np.concatenate(([0.0], cdf, [1.0])))
+        if not np.all(np.isfinite(probs)):
+            return np.inf
+        return -np.sum(counts * np.log(np.maximum(probs, 1e-300)))
+
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore")
+        start_params = dist.fit(subsample)
+        start_theta = np.array(
+            tuple(start_params[:-1]) + (np.log(start_params[-1]),)
+        )
+        result = scipy.optimize.minimize(
+            negative_log_likelihood,
+            start_theta,
+            method="Nelder-Mead",
+            options={"xatol": 1e-6, "fatol": 1e-8, "maxiter": 2000},
+        )
+    theta = result.x
+    if not result.fun <= negative_log_likelihood(start_theta):
+        theta = start_theta
+    return tuple(theta[:-1]) + (np.exp(theta[-1]),)
+
+
+def get_continuous_dist(
+    var, var_val, cont_dists, alt_name=None, binned=False, timeout=60
+):
     """
     Retrives the distribution of continuous alternative
-    specific variables using the Fitter package.
+    specific variables using the Fitter package, or, if
+    `binned` is True, using `fit_binned_mle` and the same
+    selection criterion as Fitter. Either way, candidates
+    whose fit takes more than `timeout` seconds are skipped.
+    Without `cont_dists`, the binned fits are limited to
+    Fitter's common distributions.
     """
     cont_dict = defaultdict(dict)
+    # Add name of alternative to variable and store distriburion & parameters
+    var_name = (
+        var
+        if alt_name is None
+        else get_alt_specific_variable_name(var, alt_name)
+    )
+    if binned:
+        values = np.asarray(var_val, dtype=float)
+        best_fit = (np.inf, None, None)
+        with TimedFitRunner() as runner:
+            for dist_name in cont_dists or get_common_distributions():
+                dist = getattr(scipy.stats, dist_name, None)
+                if not isinstance(dist, scipy.stats.rv_continuous):
+                    continue
+                try:
+                    params = runner.run(
+                        fit_binned_mle, (values, dist_name), timeout
+                    )
+                except Exception:
+                    continue
+                sse = _histogram_sse(dist, params, values)
+                if best_fit[1] is None or sse < best_fit[0]:
+                    best_fit = (sse, dist_name, params)
+        if best_fit[1] is None:
+            msg = "No candidate distribution could be fit to {}."
+            raise ValueError(msg.format(var))
+        cont_dict[var_name]["distribution"] = best_fit[1]
+        cont_dict[var_name]["parameters"] = best_fit[2]
+        return cont_dict
+
     # Use the Fitter library to fit distributions
     # to the data
     fitter_object = Fitter(
-        data=var_val, distributions=cont_dists, timeout=60
+        data=var_val, distributions=cont_dists, timeout=timeout
     )
     fitter_object.fit()
     # Get the best distribution and store in dictionary
     BestDict = fitter_object.get_best()
-    # Add name of alternative to variable and store distriburion & parameters
-    var_name = (
-        var
-        if alt_name is None
-        else get_alt_specific_variable_name(var, alt_name)
-    )
     cont_dict[var_name]["distribution"] = list(BestDict.items())[0][0]
     cont_dict[var_name]["parameters"] = list(BestDict.items())[0][1]
     return cont_dict
 
 
-def get_distribution_dicts(var, var_type, var_val, cont_dists, alt_name=None):
+def get_distribution_dicts(
+    var, var_type, var_val, cont_dists, alt_name=None, binned=False
+):
     """
     Helper function to generate a distribution dictionary
     for the variable specified.
@@ -170,10 +350,544 @@ def get_distribution_dicts(var, var_type, var_val, cont_dists, alt_name=None):
             dist_dic = get_constant_dist(var, var_val, alt_name)
         # If data is not categorical but has more than one unique value
         else:
-            dist_dic = get_continuous_dist(var, var_val, alt_name, cont_dists)
+            dist_dic = get_continuous_dist(
+                var, var_val, cont_dists, alt_name=alt_name, binned=binned
+            )
     return dist_dic
 
 
+def fit_variable(
+    var, var_type, var_val, cont_dists, alt_name=None, binned=False
+):
+    """
+    Generates the distribution dictionary of one variable and measures the
+    wall-clock time, in seconds, that the fit took.
+    """
+    start_time = time.perf_counter()
+    dist_dic = get_distribution_dicts(
+        var, var_type, var_val, cont_dists, alt_name=alt_name, binned=binned
+    )
+    return dist_dic, time.perf_counter() - start_time
+
+
+def _fit_variable_task(task, binned=False):
+    """
+    Unpacks a (var, var_type, var_val, cont_dists, alt_name) task so that it
+    can be passed to `Executor.map`.
+    """
+    return fit_variable(*task, binned=binned)
+
+
+def run_fit_tasks(tasks, n_jobs=1, binned=False):
+    """
+    Fits the distributions of the variables described by `tasks`, either
+    sequentially or with a pool of `n_jobs` processes. Results are returned
+    in the order of `tasks` either way.
+
+    Parameters
+    ----------
+    tasks: list of tuples
+        Each tuple holds the `var`, `var_type`, `var_val`, `cont_dists`, and
+        `alt_name` arguments of `fit_variable`.
+
+    n_jobs: int
+        Number of processes used to fit the variables. Default == 1.
+
+    binned: bool
+        Whether continuous variables are fitted with
+        `fit_binned_mle` instead of Fitter. Default == False.
+
+    Returns
+    -------
+    list of (distribution dictionary, fit time in seconds) tuples.
+    """
+    fit_task = partial(_fit_variable_task, binned=binned)
+    if n_jobs == 1 or len(tasks) <= 1:
+        return [fit_task(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(fit_task, tasks))
+
+
+def task_var_name(task):
+    """
+    Gets the name under which the variable of a fit task
+    is stored in the distribution dictionary.
+    """
+    var, _, _, _, alt_name = task
+    return (
+        var
+        if alt_name is None
+        else get_alt_specific_variable_name(var, alt_name)
+    )
+
+
+def needs_continuous_fit(var_type, var_val):
+    """
+    Checks whether a variable is fitted with a
+    continuous distribution by `get_distribution_dicts`.
+    """
+    return not (
+        is_empirical(var_type)
+        or is_categorical(var_type)
+        or is_unique(var_val)
+    )
+
+
+def _histogram_sse(dist, params, values, bins=100):
+    """
+    Computes the sum of squared errors between a
+    distribution's density and the density histogram
+    of `values`, the criterion used by Fitter.get_best.
+    """
+    density, edges = np.histogram(values, bins=bins, density=True)
+    centers = (edges[:-1] + edges[1:]) / 2
+    with np.errstate(all="ignore"):
+        sse = np.sum((dist.pdf(centers, *params) - density) ** 2)
+    return sse if np.isfinite(sse) else np.inf
+
+
+class TimedFitRunner:
+    """
+    Runs fits in a worker process, so that a fit exceeding
+    its time limit can be stopped. This follows Fitter's
+    per-distribution timeout, except that the worker is
+    killed and replaced, rather than left running.
+    """
+
+    def __init__(self):
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, func, args, timeout):
+        """
+        Calls `func(*args)` in the worker process, raising a
+        TimeoutError if it takes more than `timeout` seconds.
+        """
+        if timeout <= 0:
+            raise TimeoutError("No time is left for the fit.")
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(1)
+        async_result = self._pool.apply_async(func, args)
+        try:
+            return async_result.get(timeout)
+        except multiprocessing.TimeoutError:
+            self.close()
+            msg = "The fit exceeded {:.1f} seconds."
+            raise TimeoutError(msg.format(timeout))
+
+    def close(self):
+        """
+        Kills the worker process, if any.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def _fit_dist_params(dist_name, values):
+    """
+    Fits a scipy distribution by maximum likelihood.
+    """
+    dist = getattr(scipy.stats, dist_name)
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore")
+        return tuple(dist.fit(values))
+
+
+def _rank_dist(dist_name, values):
+    """
+    Fits a scipy distribution by maximum likelihood and
+    computes the Kolmogorov-Smirnov statistic of the fit.
+    """
+    dist = getattr(scipy.stats, dist_name)
+    params = _fit_dist_params(dist_name, values)
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore")
+        ks_stat = scipy.stats.kstest(values, dist.cdf, params)[0]
+    return params, ks_stat
+
+
+def _rank_candidates(
+    var_val, cont_dists, subsample_size, seed, deadline=None, runner=None
+):
+    """
+    Implements `rank_continuous_dists`, with the fits run by
+    `runner` until `deadline` if it is not None. Also returns
+    the number of candidates skipped for lack of time.
+    """
+    values = np.asarray(var_val, dtype=float)
+    if values.shape[0] > subsample_size:
+        rng = np.random.default_rng(seed)
+        values = rng.choice(values, size=subsample_size, replace=False)
+    if cont_dists is None:
+        cont_dists = get_common_distributions()
+
+    ranking = []
+    num_skipped = 0
+    for dist_name in cont_dists:
+        dist = getattr(scipy.stats, dist_name, None)
+        if not isinstance(dist, scipy.stats.rv_continuous):
+            continue
+        try:
+            if deadline is None:
+                params, ks_stat = _rank_dist(dist_name, values)
+            else:
+                params, ks_stat = runner.run(
+                    _rank_dist,
+                    (dist_name, values),
+                    deadline - time.perf_counter(),
+                )
+        except TimeoutError:
+            num_skipped += 1
+            continue
+        except Exception:
+            continue
+        if np.isfinite(ks_stat):
+            ranking.append((dist_name, ks_stat, params))
+    ranking.sort(key=lambda candidate: candidate[1])
+    return ranking, num_skipped
+
+
+def rank_continuous_dists(
+    var_val, cont_dists, subsample_size=1000, seed=None, deadline=None
+):
+    """
+    Cheaply ranks candidate distributions for a
+    continuous variable, by fitting each one on a small
+    subsample and computing the Kolmogorov-Smirnov
+    statistic of that fit. The subsample fits use maximum
+    likelihood since scipy's generic method of moments
+    optimizer is often slower, and fails for distributions
+    with infinite moments.
+
+    Parameters
+    ----------
+    var_val: array-like
+        Values of the variable.
+
+    cont_dists: list or None
+        List of continuous RVs distribution names from scipy.
+        If None, Fitter's common distributions are ranked.
+
+    subsample_size: int
+        Maximum number of values used for the ranking.
+        Default == 1000.
+
+    seed: int or None
+        Random seed used to draw the subsample.
+
+    deadline: float or None
+        Value of `time.perf_counter` at which ranking stops.
+        The fits are then run by a `TimedFitRunner`, which
+        stops a fit still running at the deadline. If None,
+        all candidates are ranked.
+
+    Returns
+    -------
+    list of (distribution name, KS statistic, parameters)
+    tuples, sorted by increasing KS statistic. Candidates
+    that are not scipy distributions, that fail to fit, or
+    that are not fitted by the deadline are left out.
+    """
+    if deadline is None:
+        return _rank_candidates(var_val, cont_dists, subsample_size, seed)[0]
+    with TimedFitRunner() as runner:
+        return _rank_candidates(
+            var_val, cont_dists, subsample_size, seed, deadline, runner
+        )[0]
+
+
+def _rank_budget_tasks(
+    tasks, deadline, runner, top_k, max_ks_gap, subsample_size, seed
+):
+    """
+    Ranking phase of `fit_tasks_with_budget`. Ranks the
+    candidates of the continuous variables until `deadline`,
+    and fits all other variables directly since they are
+    cheap. Returns the fit results of the other variables,
+    the time spent on each task, the pruned candidates of
+    each continuous variable, and the positions of the
+    variables with candidates skipped for lack of time.
+    """
+    fit_results = [None] * len(tasks)
+    fit_times = [0.0] * len(tasks)
+    candidates = {}
+    cut_short = set()
+    for position, task in enumerate(tasks):
+        var, var_type, var_val, cont_dists, alt_name = task
+        start_time = time.perf_counter()
+        if needs_continuous_fit(var_type, var_val):
+            ranking, num_skipped = _rank_candidates(
+                var_val, cont_dists, subsample_size, seed, deadline, runner
+            )
+            if num_skipped > 0:
+                cut_short.add(position)
+            if not ranking and num_skipped == 0:
+                msg = "No candidate distribution could be fit to {}."
+                raise ValueError(msg.format(var))
+            if not ranking:
+                ranking = [_fallback_candidate(var_val)]
+            best_ks = ranking[0][1]
+            candidates[position] = [
+                candidate
+                for candidate in ranking[:top_k]
+                if candidate[1] <= best_ks + max_ks_gap
+            ]
+        else:
+            fit_results[position] = fit_variable(*task)
+        fit_times[position] += time.perf_counter() - start_time
+    return fit_results, fit_times, candidates, cut_short
+
+
+def _fallback_candidate(var_val):
+    """
+    Ranking entry of a normal distribution, whose maximum
+    likelihood fit is in closed form, for variables whose
+    candidates could not be ranked in time.
+    """
+    values = np.asarray(var_val, dtype=float)
+    params = tuple(scipy.stats.norm.fit(values))
+    ks_stat = scipy.stats.kstest(values, "norm", params)[0]
+    return "norm", ks_stat, params
+
+
+def _fit_full_candidate(
+    values, dist_name, timeout, runner, binned=False, seed=None
+):
+    """
+    Fits one ranked candidate on the full data with `runner`,
+    returning a (histogram SSE, distribution name, parameters)
+    tuple, or None if the fit fails. Raises a TimeoutError if
+    the fit takes more than `timeout` seconds.
+    """
+    if binned:
+        func, args = fit_binned_mle, (values, dist_name, 200, 5000, seed)
+    else:
+        func, args = _fit_dist_params, (dist_name, values)
+    try:
+        params = runner.run(func, args, timeout)
+    except TimeoutError:
+        raise
+    except Exception:
+        return None
+    dist = getattr(scipy.stats, dist_name)
+    return _histogram_sse(dist, params, values), dist_name, params
+
+
+def _fit_ranked_candidates(
+    tasks, candidates, deadline, runner, fit_times, seed=None, binned=False
+):
+    """
+    Full fit phase of `fit_tasks_with_budget`. Fits the
+    candidates one rank level at a time across all
+    variables until `deadline`, adding the time spent to
+    `fit_times`. Returns the successful fits and the number
+    of fits of each variable that finished in time.
+    """
+    full_fits = defaultdict(list)
+    num_finished = defaultdict(int)
+    max_rank = max((len(c) for c in candidates.values()), default=0)
+    for rank in range(max_rank):
+        for position, ranking in candidates.items():
+            if rank >= len(ranking) or time.perf_counter() >= deadline:
+                continue
+            start_time = time.perf_counter()
+            values = np.asarray(tasks[position][2], dtype=float)
+            try:
+                full_fit = _fit_full_candidate(
+                    values,
+                    ranking[rank][0],
+                    deadline - start_time,
+                    runner,
+                    binned=binned,
+                    seed=seed,
+                )
+                num_finished[position] += 1
+            except TimeoutError:
+                full_fit = None
+            if full_fit is not None:
+                full_fits[position].append(full_fit)
+            fit_times[position] += time.perf_counter() - start_time
+    return full_fits, num_finished
+
+
+def fit_tasks_with_budget(
+    tasks,
+    time_budget,
+    top_k=3,
+    max_ks_gap=0.1,
+    subsample_size=1000,
+    seed=None,
+    binned=False,
+):
+    """
+    Fits the distributions of the variables described by
+    `tasks` within a total wall-clock budget. Candidate
+    distributions of each continuous variable are first
+    ranked with `rank_continuous_dists`. Candidates whose
+    KS statistic exceeds the best one by more than
+    `max_ks_gap` are pruned, and at most `top_k` remain.
+    Maximum likelihood fits on the full data are then run
+    one rank at a time across all variables, so that every
+    variable gets its best candidate fitted before any
+    variable gets its second, until the budget runs out.
+    Among the fitted candidates, the one with the lowest
+    histogram sum of squared errors is chosen, as in
+    `get_continuous_dist`.
+
+    The ranking and the full fits share one deadline. Each
+    fit runs in a `TimedFitRunner` worker process, which is
+    killed if the fit is still running at the deadline.
+
+    Parameters
+    ----------
+    tasks: list of tuples
+        See `run_fit_tasks`. Continuous variables without
+        candidate distributions are ranked against Fitter's
+        common distributions.
+
+    time_budget: float
+        Total number of seconds to spend on the ranking and
+        the fits of the continuous variables.
+
+    top_k: int
+        Maximum number of candidates fitted by maximum
+        likelihood per variable. Default == 3.
+
+    max_ks_gap: float
+        Candidates whose KS statistic exceeds the best one
+        by more than this are pruned. Default == 0.1.
+
+    subsample_size: int
+        See `rank_continuous_dists`. Default == 1000.
+
+    seed: int or None
+        See `rank_continuous_dists`.
+
+    binned: bool
+        Whether the full fits use `fit_binned_mle` instead of
+        the distributions' `fit` methods. Default == False.
+
+    Returns
+    -------
+    fit_results: list
+        (distribution dictionary, fit time in seconds)
+        tuples in the order of `tasks`, as for `run_fit_tasks`.
+
+    truncated: list
+        Names of the variables with candidates that were not
+        ranked, or not fitted, because the budget ran out. If
+        none of a variable's candidates were fitted, the
+        subsample fit of its best ranked candidate is used,
+        and if none were ranked, a normal distribution.
+    """
+    deadline = time.perf_counter() + time_budget
+    with TimedFitRunner() as runner:
+        fit_results, fit_times, candidates, cut_short = _rank_budget_tasks(
+            tasks, deadline, runner, top_k, max_ks_gap, subsample_size, seed
+        )
+        full_fits, num_finished = _fit_ranked_candidates(
+            tasks, candidates, deadline, runner, fit_times, seed, binned
+        )
+
+    truncated = []
+    for position, ranking in candidates.items():
+        var_name = task_var_name(tasks[position])
+        if full_fits[position]:
+            _, dist_name, params = min(full_fits[position])
+        else:
+            dist_name, _, params = ranking[0]
+        cont_dict = defaultdict(dict)
+        cont_dict[var_name]["distribution"] = dist_name
+        cont_dict[var_name]["parameters"] = params
+        fit_results[position] = (cont_dict, fit_times[position])
+        if position in cut_short or num_finished[position] < len(ranking):
+            truncated.append(var_name)
+    return fit_results, truncated
+
+
+############################################
+# Functions for caching fitted distributions
+# on disk across runs.
+############################################
+
+# Part of every cache key. Bump it whenever the layout of the
+# stored distribution dictionaries, or the default candidate
+# distributions, change, so that old entries are refitted
+# instead of loaded.
+CACHE_FORMAT_VERSION = 3
+
+
+def fit_cache_key(var_type, var_val, cont_dists, fit_settings=""):
+    """
+    Computes the cache key of a variable's fit from
+    its values, its type, the candidate distributions
+    and a description of the fitting procedure.
+    """
+    values = np.asarray(var_val)
+    if values.dtype == object:
+        values = values.astype(str)
+    hasher = hashlib.sha256()
+    hasher.update(str((values.shape, values.dtype.str)).encode())
+    hasher.update(np.ascontiguousarray(values).tobytes())
+    hasher.update(
+        repr(
+            (CACHE_FORMAT_VERSION, var_type, cont_dists, fit_settings)
+        ).encode()
+    )
+    return hasher.hexdigest()
+
+
+def load_cached_fit(cache_dir, key):
+    """
+    Loads the distribution and parameters stored in
+    `cache_dir` under `key`, or returns None if there
+    are none. Marks the entry as recently used.
+    """
+    path = os.path.join(cache_dir, key + ".pkl")
+    try:
+        with open(path, "rb") as cache_file:
+            dist_params = pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path)
+    return dist_params
+
+
+def store_cached_fit(cache_dir, key, dist_params, max_bytes=100 * 2 ** 20):
+    """
+    Stores a variable's distribution and parameters in
+    `cache_dir` under `key`. The least recently used
+    entries are then evicted until the cache occupies at
+    most `max_bytes` bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".pkl")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as cache_file:
+        pickle.dump(dict(dist_params), cache_file)
+    os.replace(temp_path, path)
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".pkl"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        os.remove(entry_path)
+        total_bytes -= size
+    return None
+
+
 ############################################
 # Functions to replace functionality for
 # fitting distributions for variables
@@ -182,81 +896,264 @@ def get_distribution_dicts(var, var_type, var_val, cont_dists, alt_name=None):
 ############################################
 
 
-def ind_spec_dist(data_long, obs_id_col, ind_spec, var_types, cont_dists):
+def index_long_data(data_long, obs_id_col, alt_id_col):
+    """
+    Computes, in one hashing pass over each id column of a
+    long format dataset, the positions of the first row of
+    every observation and the positions of the rows of
+    every alternative.
+
+    Returns
+    -------
+    first_obs_rows: 1D ndarray of ints
+        Position of the first row of each observation, in
+        the order in which the observations first appear,
+        as with `drop_duplicates(obs_id_col)`.
+
+    alt_rows: dict
+        Keys are the alternative ids, in the order in which
+        they first appear, as with `unique()`. Values are
+        the ascending positions of each alternative's rows.
+    """
+    first_obs_rows = _first_rows(data_long[obs_id_col].to_numpy())
+
+    # Hash the alternative ids, which numbers them in order of
+    # appearance, and group the rows by a stable sort of those
+    # numbers. Small integer codes are radix sorted by numpy.
+    alt_codes, unique_alts = pd.factorize(data_long[alt_id_col].to_numpy())
+    alt_codes = alt_codes.astype(np.min_scalar_type(len(unique_alts)))
+    sorted_rows = np.argsort(alt_codes, kind="stable")
+    split_points = np.cumsum(np.bincount(alt_codes))[:-1]
+    alt_rows = dict(zip(unique_alts, np.split(sorted_rows, split_points)))
+    return first_obs_rows, alt_rows
+
+
+def _first_rows(ids):
+    """
+    Computes the position of the first occurrence of every
+    unique value of `ids`, in order of first occurrence.
+    """
+    return np.flatnonzero(~pd.Series(ids, copy=False).duplicated().to_numpy())
+
+
+def _obs_level_tasks(
+    data_long, obs_id_col, variables, var_types, cont_dists, first_obs_rows
+):
+    """
+    Lists the fit tasks of variables taking one value per
+    observation, using the first row of each observation.
+    """
+    if first_obs_rows is None:
+        first_obs_rows = _first_rows(data_long[obs_id_col].to_numpy())
+    tasks = []
+    for var in variables:
+        var_val = pd.Series(data_long[var].to_numpy()[first_obs_rows])
+        tasks.append((var, var_types[var], var_val, cont_dists, None))
+    return tasks
+
+
+def ind_spec_tasks(
+    data_long,
+    obs_id_col,
+    ind_spec,
+    var_types,
+    cont_dists,
+    first_obs_rows=None,
+):
+    """
+    Function that lists the fit tasks of all individual
+    specific variables. `first_obs_rows` may be given from
+    `index_long_data` to avoid recomputing it.
+    """
+    return _obs_level_tasks(
+        data_long, obs_id_col, ind_spec, var_types, cont_dists, first_obs_rows
+    )
+
+
+def alt_spec_tasks(
+    data_long,
+    alt_id_col,
+    alt_spec_dic,
+    var_types,
+    alt_name_dic,
+    cont_dists,
+    alt_rows=None,
+):
+    """
+    Function that lists the fit tasks of all alternative
+    specific variables. `alt_rows` may be given from
+    `index_long_data` to avoid recomputing it.
+    """
+    if alt_rows is None:
+        # The observation id column is irrelevant here
+        _, alt_rows = index_long_data(data_long, alt_id_col, alt_id_col)
+
+    # Reorder each needed column once so that the rows of
+    # every alternative form a contiguous slice
+    row_order = np.concatenate(list(alt_rows.values()))
+    bounds = np.cumsum([0] + [len(rows) for rows in alt_rows.values()])
+    alt_vars = {var for alt_id in alt_rows for var in alt_spec_dic[alt_id]}
+    ordered_values = {
+        var: data_long[var].to_numpy()[row_order] for var in alt_vars
+    }
+
+    tasks = []
+    for position, alt_id in enumerate(alt_rows):
+        alt_name = alt_name_dic[alt_id]
+        start, end = bounds[position], bounds[position + 1]
+        for alt_var in alt_spec_dic[alt_id]:
+            var_val = pd.Series(
+                ordered_values[alt_var][start:end], copy=False
+            )
+            var_type = var_types[alt_var]
+            tasks.append((alt_var, var_type, var_val, cont_dists, alt_name))
+    return tasks
+
+
+def trip_spec_tasks(
+    data_long,
+    obs_id_col,
+    trip_spec,
+    var_types,
+    cont_dists,
+    first_obs_rows=None,
+):
+    """
+    Function that lists the fit tasks of all trip
+    specific variables. `first_obs_rows` may be given from
+    `index_long_data` to avoid recomputing it.
+    """
+    return _obs_level_tasks(
+        data_long,
+        obs_id_col,
+        trip_spec,
+        var_types,
+        cont_dists,
+        first_obs_rows,
+    )
+
+
+def _collect_dist_dicts(fit_results):
+    """
+    Merges the distribution dictionaries of `run_fit_tasks` results.
+    """
+    dist_dict = defaultdict(dict)
+    for dist_dic, _ in fit_results:
+        dist_dict.update(dist_dic)
+    return dist_dict
+
+
+def ind_spec_dist(
+    data_long, obs_id_col, ind_spec, var_types, cont_dists, n_jobs=1
+):
     """
     Function that retrieves distributions for all individual
     specific variables.
     """
-    ind_spec_dict = defaultdict(dict)
-    for ind_var in ind_spec:
-        # generate array of values for individual specific variable
-        var_val = (
-            data_long[[obs_id_col, ind_var]]
-            .drop_duplicates(obs_id_col, inplace=False)
-            .loc[:, ind_var]
-            .reset_index(drop=True)
-        )
-        # Get distribution of variable
-        var_type = var_types[ind_var]
-        ind_var_dic = get_distribution_dicts(
-            ind_var, var_type, var_val, cont_dists
-        )
-        ind_spec_dict.update(ind_var_dic)
-    return ind_spec_dict
+    tasks = ind_spec_tasks(
+        data_long, obs_id_col, ind_spec, var_types, cont_dists
+    )
+    return _collect_dist_dicts(run_fit_tasks(tasks, n_jobs))
 
 
 def alt_spec_dist(
-    data_long, alt_id_col, alt_spec_dic, var_types, alt_name_dic, cont_dists
+    data_long,
+    alt_id_col,
+    alt_spec_dic,
+    var_types,
+    alt_name_dic,
+    cont_dists,
+    n_jobs=1,
 ):
     """
     Function that retrieves distributions for all alternative
     specific variables.
     """
-    all_alt_spec_var_dic = defaultdict(dict)
-    for alt_id in data_long[alt_id_col].unique():
-        # Store data for specific alternative (mode)
-        alt_data = data_long.loc[data_long[alt_id_col] == alt_id]
-        alt_spec_var_dic = defaultdict(dict)
-        # Loop around the alternative specific
-        # variables in the input dictionary
-        alt_name = alt_name_dic[alt_id]
-        for alt_var in alt_spec_dic[alt_id]:
-            var_val = alt_data[alt_var]
-            var_type = var_types[alt_var]
-            alt_spec_var_dist = get_distribution_dicts(
-                alt_var, var_type, var_val, alt_name, cont_dists
-            )
-            alt_spec_var_dic.update(alt_spec_var_dist)
-        all_alt_spec_var_dic.update(alt_spec_var_dic)
-    return all_alt_spec_var_dic
+    tasks = alt_spec_tasks(
+        data_long,
+        alt_id_col,
+        alt_spec_dic,
+        var_types,
+        alt_name_dic,
+        cont_dists,
+    )
+    return _collect_dist_dicts(run_fit_tasks(tasks, n_jobs))
 
 
-def trip_spec_dist(data_long, obs_id_col, trip_spec, var_types, cont_dists):
+def trip_spec_dist(
+    data_long, obs_id_col, trip_spec, var_types, cont_dists, n_jobs=1
+):
     """
     Function that retrieves distributions for all trip
     specific variables.
     """
-    # Trip Specific Variable (maybe combine with individual specific variables)
-    # Loop around trip (observation) specific variables
-    trip_spec_dict = defaultdict(dict)
-    for trip_var in trip_spec:
-        # generate array of values for trip specific variable
-        var_val = (
-            data_long[[obs_id_col, trip_var]]
-            .drop_duplicates(obs_id_col, inplace=False)
-            .loc[:, trip_var]
-            .reset_index(drop=True)
-        )
-        var_type = var_types[trip_var]
-        # If data is to be taken as empirical values
-        trip_spec_var_dist = get_distribution_dicts(
-            trip_var, var_type, var_val, cont_dists
-        )
-        trip_spec_dict.update(trip_spec_var_dist)
-    return trip_spec_dict
+    tasks = trip_spec_tasks(
+        data_long, obs_id_col, trip_spec, var_types, cont_dists
+    )
+    return _collect_dist_dicts(run_fit_tasks(tasks, n_jobs))
+
+
+def _print_fit_times(fit_results):
+    """
+    Prints the time spent fitting each variable.
+    """
+    for dist_dic, fit_time in fit_results:
+        for var_name in dist_dic:
+            print("{}: {:.2f}s".format(var_name, fit_time))
 
 
 # Define the main function
+def get_fit_settings(time_budget=None, top_k=3, seed=None, binned=False):
+    """
+    Describes the fitting procedure of `get_dist_node_no_parent`
+    for `fit_cache_key`, so that fits made with different
+    settings are cached separately.
+    """
+    fit_settings = (
+        "fitter"
+        if time_budget is None
+        else "budget_top_{}_seed_{}".format(top_k, seed)
+    )
+    if binned:
+        fit_settings += "_binned"
+    return fit_settings
+
+
+def _load_cached_results(cache_dir, tasks, fit_results, fit_settings):
+    """
+    Fills the entries of `fit_results` whose task has a
+    cached fit in `cache_dir`, and returns the cache keys
+    of all `tasks`.
+    """
+    cache_keys = [
+        fit_cache_key(var_type, var_val, var_dists, fit_settings)
+        for _, var_type, var_val, var_dists, _ in tasks
+    ]
+    for position, task in enumerate(tasks):
+        dist_params = load_cached_fit(cache_dir, cache_keys[position])
+        if dist_params is not None:
+            cached_dic = defaultdict(dict)
+            cached_dic[task_var_name(task)].update(dist_params)
+            fit_results[position] = (cached_dic, 0.0)
+    num_cached = sum(result is not None for result in fit_results)
+    print("Loaded {} fits from the cache...".format(num_cached))
+    return cache_keys
+
+
+def _store_fit_results(
+    cache_dir, tasks, fit_results, cache_keys, truncated, max_bytes
+):
+    """
+    Stores the fits of `tasks` in `cache_dir`, except those
+    of the `truncated` variables.
+    """
+    for task, result, key in zip(tasks, fit_results, cache_keys):
+        var_name = task_var_name(task)
+        # Fits cut short by the time budget are not worth keeping
+        if var_name not in truncated:
+            store_cached_fit(cache_dir, key, result[0][var_name], max_bytes)
+
+
 def get_dist_node_no_parent(
     data_long,
     alt_id_col,
@@ -267,6 +1164,14 @@ def get_dist_node_no_parent(
     trip_spec,
     var_types,
     cont_dists=None,
+    n_jobs=1,
+    return_fit_times=False,
+    time_budget=None,
+    top_k=3,
+    cache_dir=None,
+    cache_max_bytes=100 * 2 ** 20,
+    binned=False,
+    seed=None,
 ):
     """
     Function to find the distribution of specific variables
@@ -312,46 +1217,151 @@ def get_dist_node_no_parent(
     cont_dists: list
         List of continuous RVs distribution names from scipy.
 
+    n_jobs: int
+        Number of processes across which the variables are
+        fitted. The result does not depend on `n_jobs`.
+        Default == 1.
+
+    return_fit_times: bool
+        Whether to also return the time spent fitting each
+        variable. Default == False.
+
+    time_budget: float or None
+        If not None, the total number of seconds to spend
+        fitting continuous variables, which are then fitted
+        with `fit_tasks_with_budget` instead of Fitter. The
+        variables whose fits were cut short by the budget
+        are reported. Cannot be combined with `n_jobs > 1`.
+        Default is None.
+
+    top_k: int
+        Maximum number of candidate distributions fitted
+        per continuous variable when `time_budget` is not
+        None. Default == 3.
+
+    cache_dir: str or None
+        If not None, the directory of a persistent cache of
+        fitted distributions. Variables whose values, type,
+        candidate distributions and fitting procedure match
+        a cached entry are not refitted. Default is None.
+
+    cache_max_bytes: int
+        Maximum size of the cache on disk. The least recently
+        used entries are evicted first. Default == 100 MiB.
+
+    binned: bool
+        Whether continuous variables are fitted by maximizing
+        the likelihood of binned counts with `fit_binned_mle`,
+        whose cost per optimizer iteration does not grow with
+        the number of rows. Default == False.
+
+    seed: int or None
+        Random seed of the subsamples used to rank candidate
+        distributions when `time_budget` is not None.
+        Default is None.
+
     Returns
     -------
     a nested dictionary with keys as variable names and values
     as dictionaries containing both the distribution name and
-    its parameters.
+    its parameters. If `return_fit_times` is True, a second
+    dictionary with keys as variable names and values as the
+    seconds spent fitting each variable is also returned.
     """
+    if time_budget is not None and n_jobs != 1:
+        msg = "`time_budget` cannot be combined with `n_jobs` > 1."
+        raise ValueError(msg)
     params_dict = defaultdict(dict)
+    fit_times = {}
 
-    # Code for Individual Specific Variables
-    print("Getting Distributions of Individual Specific Variables...")
-    print("---------------------------------------------------------")
-    ind_spec_dic_params = ind_spec_dist(
-        data_long, obs_id_col, ind_spec, var_types, cont_dists
-    )
-    params_dict.update(ind_spec_dic_params)
-    print("Done...")
-
-    # Code for Alternative Specific Variables
-    # Loop around the different available alternatives
-    print("Getting Distributions of Alternative Specific Variables...")
-    print("----------------------------------------------------------")
-    alt_spec_dic_params = alt_spec_dist(
-        data_long,
-        alt_id_col,
-        alt_spec_dic,
-        var_types,
-        alt_name_dic,
-        cont_dists,
+    # Index the observations and alternatives once, then gather
+    # every variable's fit task, so that all of them can be
+    # shared out across one pool of processes
+    first_obs_rows, alt_rows = index_long_data(
+        data_long, obs_id_col, alt_id_col
     )
-    params_dict.update(alt_spec_dic_params)
-    print("Done...")
-
-    # Trip Specific Variable (maybe combine with individual specific variables)
-    # Loop around trip (observation) specific variables
-    print("Getting Distributions of Trip Specific Variables...")
-    print("---------------------------------------------------------")
-    trip_spec_dic_params = trip_spec_dist(
-        data_long, obs_id_col, trip_spec, var_types, cont_dists
-    )
-    params_dict.update(trip_spec_dic_params)
-    print("Done...")
+    task_groups = [
+        (
+            "Individual Specific Variables",
+            ind_spec_tasks(
+                data_long,
+                obs_id_col,
+                ind_spec,
+                var_types,
+                cont_dists,
+                first_obs_rows,
+            ),
+        ),
+        (
+            "Alternative Specific Variables",
+            alt_spec_tasks(
+                data_long,
+                alt_id_col,
+                alt_spec_dic,
+                var_types,
+                alt_name_dic,
+                cont_dists,
+                alt_rows,
+            ),
+        ),
+        (
+            "Trip Specific Variables",
+            trip_spec_tasks(
+                data_long,
+                obs_id_col,
+                trip_spec,
+                var_types,
+                cont_dists,
+                first_obs_rows,
+            ),
+        ),
+    ]
+    all_tasks = [task for _, tasks in task_groups for task in tasks]
+    all_results = [None] * len(all_tasks)
+
+    # Serve unchanged variables from the cache
+    if cache_dir is not None:
+        fit_settings = get_fit_settings(time_budget, top_k, seed, binned)
+        cache_keys = _load_cached_results(
+            cache_dir, all_tasks, all_results, fit_settings
+        )
+
+    pending = [pos for pos, res in enumerate(all_results) if res is None]
+    pending_tasks = [all_tasks[pos] for pos in pending]
+    truncated = []
+    if time_budget is None:
+        pending_results = run_fit_tasks(pending_tasks, n_jobs, binned)
+    else:
+        pending_results, truncated = fit_tasks_with_budget(
+            pending_tasks, time_budget, top_k=top_k, seed=seed, binned=binned
+        )
+    for position, result in zip(pending, pending_results):
+        all_results[position] = result
+    if cache_dir is not None:
+        _store_fit_results(
+            cache_dir,
+            [all_tasks[pos] for pos in pending],
+            pending_results,
+            [cache_keys[pos] for pos in pending],
+            truncated,
+            cache_max_bytes,
+        )
+
+    position = 0
+    for group_name, tasks in task_groups:
+        print("Getting Distributions of {}...".format(group_name))
+        print("---------------------------------------------------------")
+        fit_results = all_results[position : position + len(tasks)]
+        position += len(tasks)
+        _print_fit_times(fit_results)
+        for dist_dic, fit_time in fit_results:
+            params_dict.update(dist_dic)
+            fit_times.update({var_name: fit_time for var_name in dist_dic})
+        print("Done...")
+
+    if truncated:
+        print("Fits truncated by the time budget: {}".format(truncated))
 
+    if return_fit_times:
+        return params_dict, fit_times
     return params_dict
@@ -0,0 +1,299 @@
+"""
+Simulation of the child nodes of the causal graphs of
+each alternative, e.g. those in `graphs.py`, based on the
+regressions fitted between connected nodes.
+"""
+from collections import defaultdict
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from causal2020.observables.regression import get_regression_name
+from causal2020.observables.simmodel import get_regression_summary
+
+
+def graph_node_column(node, node_columns=None):
+    """
+    Gets the name of the data column of a graph node, e.g.
+    'total_travel_distance' for 'Total Travel Distance'.
+    Nodes in `node_columns` use the column given there.
+    """
+    if node_columns is not None and node in node_columns:
+        return node_columns[node]
+    return node.lower().replace(" ", "_")
+
+
+def _predict_batch(batch, X, alt_idx, rng):
+    """
+    Predicts the child node of a batch for stacked predictors
+    `X` of all its alternatives, where `alt_idx` gives the
+    position of the alternative of each row in the batch.
+    Draws coefficients and noise as `regression.lin_reg_pred`.
+    """
+    predictor = np.column_stack([np.ones(X.shape[0]), X])
+    std_normals = rng.standard_normal(predictor.shape)
+    coefs = batch["params"][alt_idx]
+    for j in range(predictor.shape[1]):
+        coefs += std_normals[:, j : j + 1] * batch["cov_chol"][alt_idx, :, j]
+    noise = rng.standard_normal(X.shape[0]) * batch["resid_scale"][alt_idx]
+    return np.einsum("ij, ij->i", coefs, predictor) + noise
+
+
+class GraphSimulator:
+    """
+    Simulates the child nodes of the causal graphs of all the
+    alternatives. The graphs are sorted topologically once, and
+    the same node of all the alternatives is then simulated in
+    one vectorized pass, so that adding an alternative only
+    requires its graph and fitted regressions.
+
+    Parameters
+    ----------
+    graphs: dictionary
+        Keys are alternative names, e.g. 'drive_alone', and
+        values are `CausalGraphicalModel` objects, or networkx
+        DiGraphs, of the alternatives.
+
+    fitted_regs: dictionary
+        Keys are alternative names, and values are the output of
+        `fit_alternative_regression` for the alternative. Values
+        of the inner dictionaries may also be the output of
+        `get_regression_summary`.
+
+    node_columns: dictionary or None
+        Names of the data columns of graph nodes whose names do
+        not follow `graph_node_column`.
+
+    Notes
+    -----
+    A node is simulated if it has a single parent and the
+    regression of its column on the column of the parent was
+    fitted. Other nodes with parents, e.g. utilities, are
+    listed in `skipped_nodes`.
+    """
+
+    def __init__(self, graphs, fitted_regs, node_columns=None):
+        self.node_columns = node_columns
+
+        # Combine the graphs, with one node per alternative and node
+        joint_dag = nx.DiGraph()
+        for alt, graph in graphs.items():
+            dag = getattr(graph, "dag", graph)
+            joint_dag.add_nodes_from((alt, node) for node in dag.nodes)
+            joint_dag.add_edges_from(
+                ((alt, parent), (alt, child)) for parent, child in dag.edges
+            )
+        self.order = list(nx.topological_sort(joint_dag))
+
+        # Nodes at the same depth do not depend on each other,
+        # so the same node of all alternatives can be batched
+        depths = {}
+        groups = defaultdict(list)
+        self.skipped_nodes = []
+        for alt, node in self.order:
+            parents = [
+                parent for _, parent in joint_dag.predecessors((alt, node))
+            ]
+            depths[(alt, node)] = 1 + max(
+                (depths[(alt, parent)] for parent in parents), default=-1
+            )
+            if not parents:
+                continue
+            column = graph_node_column(node, node_columns)
+            parent_columns = [
+                graph_node_column(parent, node_columns) for parent in parents
+            ]
+            reg_name = None
+            if len(parents) == 1:
+                reg_name = get_regression_name(parent_columns[0], column)
+            alt_regs = fitted_regs.get(alt, {})
+            if reg_name not in alt_regs:
+                self.skipped_nodes.append((alt, node))
+                continue
+            summary = alt_regs[reg_name]
+            if not isinstance(summary, dict):
+                summary = get_regression_summary(summary)
+            key = (depths[(alt, node)], node, len(parents))
+            groups[key].append((alt, parent_columns, summary))
+
+        self.batches = []
+        for (_, node, _), members in sorted(
+            groups.items(), key=lambda item: item[0][0]
+        ):
+            self.batches.append(
+                {
+                    "node": node,
+                    "column": graph_node_column(node, node_columns),
+                    "alternatives": [alt for alt, _, _ in members],
+                    "parents": [parents for _, parents, _ in members],
+                    "params": np.stack([s["params"] for _, _, s in members]),
+                    "cov_chol": np.stack(
+                        [s["cov_chol"] for _, _, s in members]
+                    ),
+                    "resid_scale": np.array(
+                        [s["resid_scale"] for _, _, s in members]
+                    ),
+                }
+            )
+
+    def _select_batches(self, nodes=None, alternatives=None):
+        """
+        Restricts the batches to the given graph nodes and
+        alternatives, keeping the topological order.
+        """
+        for batch in self.batches:
+            if nodes is not None and batch["node"] not in nodes:
+                continue
+            if alternatives is None:
+                yield batch
+                continue
+            keep = [
+                pos
+                for pos, alt in enumerate(batch["alternatives"])
+                if alt in alternatives
+            ]
+            if not keep:
+                continue
+            sub_batch = dict(batch)
+            for key in ["alternatives", "parents"]:
+                sub_batch[key] = [batch[key][pos] for pos in keep]
+            for key in ["params", "cov_chol", "resid_scale"]:
+                sub_batch[key] = batch[key][keep]
+            yield sub_batch
+
+    def simulate(
+        self, sim_data, random_state=None, nodes=None, alternatives=None
+    ):
+        """
+        Simulates the child nodes in a wide format dataset, where
+        the column of a node for an alternative is named
+        '{column}_{alternative}'. Parent nodes without such a
+        column, e.g. individual specific variables, are read from
+        '{column}'.
+
+        Parameters
+        ----------
+        sim_data: DataFrame or dictionary of arrays
+            The simulated nodes without parents, e.g. from
+            `sim_node_no_parent`. The child nodes are added to it.
+
+        random_state: np.random.Generator or None
+            Source of randomness. If None, numpy's global random
+            state is used.
+
+        nodes: list of str or None
+            Graph nodes to simulate. If None, all are simulated.
+
+        alternatives: list of str or None
+            Alternatives to simulate. If None, all are simulated.
+
+        Returns
+        -------
+        `sim_data`, with the simulated child node columns.
+        """
+        rng = np.random if random_state is None else random_state
+        for batch in self._select_batches(nodes, alternatives):
+            X_parts = []
+            for alt, parents in zip(batch["alternatives"], batch["parents"]):
+                X_parts.append(
+                    np.column_stack(
+                        [
+                            np.asarray(
+                                sim_data[self._wide_column(sim_data, p, alt)],
+                                dtype=float,
+                            )
+                            for p in parents
+                        ]
+                    )
+                )
+            sizes = [part.shape[0] for part in X_parts]
+            alt_idx = np.repeat(np.arange(len(sizes)), sizes)
+            prediction = _predict_batch(
+                batch, np.concatenate(X_parts), alt_idx, rng
+            )
+            offsets = np.cumsum([0] + sizes)
+            for pos, alt in enumerate(batch["alternatives"]):
+                column = "{}_{}".format(batch["column"], alt)
+                sim_data[column] = prediction[offsets[pos] : offsets[pos + 1]]
+        return sim_data
+
+    @staticmethod
+    def _wide_column(sim_data, column, alt):
+        """
+        Gets the wide format column of a node for an alternative.
+        """
+        alt_column = "{}_{}".format(column, alt)
+        return alt_column if alt_column in sim_data else column
+
+    def simulate_long(
+        self,
+        long_data,
+        alt_id_col,
+        alt_name_dict,
+        random_state=None,
+        nodes=None,
+        alternatives=None,
+    ):
+        """
+        Simulates the child nodes in a long format dataset, e.g.
+        after perturbing a parent node, for the rows of each
+        alternative.
+
+        Parameters
+        ----------
+        long_data: DataFrame
+            Long format dataset. The child node columns are
+            replaced for the rows of the simulated alternatives.
+
+        alt_id_col: str
+            Name of the column with the alternative ids.
+
+        alt_name_dict: dictionary
+            Keys are alternative ids, and values are alternative
+            names, which are the keys of `graphs`. Must include
+            every simulated alternative.
+
+        random_state, nodes, alternatives:
+            See `simulate`.
+
+        Returns
+        -------
+        `long_data`, with the simulated child node columns.
+        """
+        rng = np.random if random_state is None else random_state
+        alt_ids = {name: alt_id for alt_id, name in alt_name_dict.items()}
+        batches = list(self._select_batches(nodes, alternatives))
+        for batch in batches:
+            for alt in batch["alternatives"]:
+                if alt not in alt_ids:
+                    msg = "Alternative '{}' is missing from `alt_name_dict`."
+                    raise ValueError(msg.format(alt))
+
+        row_alt_ids = np.asarray(long_data[alt_id_col])
+        for batch in batches:
+            batch_ids = [alt_ids[alt] for alt in batch["alternatives"]]
+            row_pos = pd.Index(batch_ids).get_indexer(row_alt_ids)
+            rows = np.flatnonzero(row_pos >= 0)
+            alt_idx = row_pos[rows]
+
+            # Convert each parent column once for all the alternatives
+            parent_values = {
+                parent: np.asarray(long_data[parent], dtype=float)[rows]
+                for parents in batch["parents"]
+                for parent in parents
+            }
+            X = np.empty((rows.shape[0], len(batch["parents"][0])))
+            for pos, parents in enumerate(batch["parents"]):
+                alt_rows = alt_idx == pos
+                for j, parent in enumerate(parents):
+                    X[alt_rows, j] = parent_values[parent][alt_rows]
+            prediction = _predict_batch(batch, X, alt_idx, rng)
+
+            column = batch["column"]
+            if column in long_data:
+                values = np.array(long_data[column], dtype=float)
+            else:
+                values = np.full(row_alt_ids.shape[0], np.nan)
+            values[rows] = prediction
+            long_data[column] = values
+        return long_data
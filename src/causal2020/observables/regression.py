@@ -222,3 +222,38 @@ def lin_reg_pred(X, fitted_reg, size, causal_scale=None):
     prediction = dot_prod + noise
 
     return prediction
+
+
+def lin_reg_pred_replicates(X, fitted_reg, offsets, causal_scale=None):
+    """
+    Uses the fitted regression to produce predictions for
+    many stacked replications in a single call, so that the
+    regression parameters and covariance are extracted once.
+
+    Parameters
+    ----------
+    X: array-like
+        predictor array of all replications, stacked as
+        returned by `simulation.sim_node_replicates`.
+
+    fitted_reg: Statsmodels regression model
+        Currently only supports statsmodels
+        regression models.
+
+    offsets: array-like of ints
+        The replicate offsets, from
+        `simulation.get_replicate_offsets`.
+
+    causal_scale: int or list
+        See `lin_reg_pred`.
+
+    Returns
+    -------
+    Array of the stacked predictions. Replication `r` is
+    in `prediction[offsets[r]:offsets[r + 1]]`.
+    """
+    size = int(offsets[-1])
+    if len(X) != size:
+        msg = "`X` MUST have `offsets[-1]` rows."
+        raise ValueError(msg)
+    return lin_reg_pred(X, fitted_reg, size, causal_scale=causal_scale)
@@ -0,0 +1,114 @@
+"""
+Samplers that are built once per fitted variable
+and then reused to draw simulated values quickly.
+"""
+import numpy as np
+
+
+def draw_uniforms(size, random_state=None):
+    """
+    Draws uniform values on [0, 1) from `random_state`, a
+    np.random.Generator, or from numpy's global random state
+    if `random_state` is None.
+    """
+    if random_state is None:
+        return np.random.random_sample(size)
+    return random_state.random(size)
+
+
+def draw_integers(high, size, random_state=None):
+    """
+    Draws integers on [0, high) from `random_state`, a
+    np.random.Generator, or from numpy's global random state
+    if `random_state` is None.
+    """
+    if random_state is None:
+        return np.random.randint(high, size=size)
+    return random_state.integers(high, size=size)
+
+
+class CategoricalSampler:
+    """
+    Draws values of a categorical variable in O(1) time
+    per draw, using the alias method of Walker (1977) as
+    described by Vose (1991).
+
+    Parameters
+    ----------
+    values: array-like
+        The categories of the variable.
+
+    probs: array-like
+        The probability of each category. Normalized to
+        sum to one.
+    """
+
+    def __init__(self, values, probs):
+        self.values = np.asarray(values)
+        probs = np.asarray(probs, dtype=float)
+        if probs.ndim != 1 or probs.shape != self.values.shape:
+            msg = "`values` and `probs` MUST be 1D and of the same length."
+            raise ValueError(msg)
+        if (probs < 0).any() or probs.sum() <= 0:
+            msg = "`probs` MUST be non-negative with a positive sum."
+            raise ValueError(msg)
+        self.probs = probs / probs.sum()
+        self.accept_probs, self.aliases = self._build_alias_table(self.probs)
+
+    @classmethod
+    def from_observations(cls, var_val):
+        """
+        Builds the sampler of the empirical distribution of
+        `var_val`, without allocating space for categories
+        that never occur.
+        """
+        values, counts = np.unique(np.asarray(var_val), return_counts=True)
+        return cls(values, counts)
+
+    @staticmethod
+    def _build_alias_table(probs):
+        """
+        Splits the scaled probabilities into the probability
+        of accepting each column and the alias drawn otherwise.
+        """
+        num_categories = probs.shape[0]
+        scaled = probs * num_categories
+        accept_probs = np.ones(num_categories)
+        aliases = np.arange(num_categories)
+        small = list(np.flatnonzero(scaled < 1))
+        large = list(np.flatnonzero(scaled >= 1))
+        while small and large:
+            less, more = small.pop(), large.pop()
+            accept_probs[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left equals one up to rounding error
+        return accept_probs, aliases
+
+    def sample(self, size, random_state=None):
+        """
+        Draws `size` values of the variable.
+
+        Parameters
+        ----------
+        size: int or tuple of ints
+            Shape of the returned array.
+
+        random_state: np.random.Generator or None
+            Source of randomness. If None, numpy's global
+            random state is used, so that `np.random.seed`
+            makes the draws reproducible.
+
+        Returns
+        -------
+        ndarray of simulated values.
+        """
+        num_categories = self.probs.shape[0]
+        columns = draw_integers(num_categories, size, random_state)
+        uniforms = draw_uniforms(size, random_state)
+        accepted = uniforms < self.accept_probs[columns]
+        return self.values[np.where(accepted, columns, self.aliases[columns])]
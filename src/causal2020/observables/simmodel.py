@@ -0,0 +1,239 @@
+"""
+A fitted simulation model that can be saved to a
+single file and loaded by simulation workers without
+refitting, and without importing statsmodels or Fitter.
+"""
+import json
+
+import numpy as np
+from causal2020.observables.simulation import build_node_simulators
+from causal2020.observables.simulation import build_samplers
+from causal2020.observables.simulation import sim_nodes_batch
+
+SIM_MODEL_VERSION = 1
+
+
+def get_regression_summary(fitted_reg):
+    """
+    Extracts the parameters needed to simulate from a
+    fitted statsmodels regression.
+
+    Parameters
+    ----------
+    fitted_reg: Statsmodels regression model
+        A fitted model, e.g. from `fit_alternative_regression`.
+
+    Returns
+    -------
+    Dictionary with the parameter names, the parameter means,
+    a lower triangular factor `cov_chol` of the parameter
+    covariance such that `cov = cov_chol @ cov_chol.T`, and
+    the standard deviation of the residuals, which is nan
+    if the model has no residuals.
+    """
+    if not hasattr(fitted_reg, "cov_params"):
+        msg = "Only statsmodels regression models can be summarized."
+        raise ValueError(msg)
+    params = fitted_reg.params
+    cov = np.asarray(fitted_reg.cov_params(), dtype=float)
+    try:
+        cov_chol = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Singular covariance, e.g. for a perfect fit. Clip the
+        # eigenvalues and triangularize the resulting square root
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        root = eigvecs * np.sqrt(np.clip(eigvals, 0, None))
+        cov_chol = np.linalg.qr(root.T, mode="r").T
+    resid = getattr(fitted_reg, "resid", None)
+    resid_scale = np.nan if resid is None else np.std(resid, ddof=1)
+    return {
+        "param_names": [str(name) for name in getattr(params, "index", [])],
+        "params": np.asarray(params, dtype=float),
+        "cov_chol": cov_chol,
+        "resid_scale": float(resid_scale),
+    }
+
+
+def _encode(obj, arrays):
+    """
+    Converts `obj` into a JSON-serializable description,
+    moving its arrays into `arrays`.
+    """
+    if hasattr(obj, "to_numpy"):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            msg = "Arrays of Python objects cannot be saved."
+            raise ValueError(msg)
+        key = "arr_{}".format(len(arrays))
+        arrays[key] = obj
+        return {"array": key}
+    if isinstance(obj, dict):
+        return {"dict": {str(k): _encode(v, arrays) for k, v in obj.items()}}
+    if isinstance(obj, (list, tuple)):
+        kind = "list" if isinstance(obj, list) else "tuple"
+        return {kind: [_encode(v, arrays) for v in obj]}
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    return {"value": obj}
+
+
+def _decode(spec, arrays):
+    """
+    Inverse of `_encode`.
+    """
+    if "array" in spec:
+        return arrays[spec["array"]]
+    if "dict" in spec:
+        return {k: _decode(v, arrays) for k, v in spec["dict"].items()}
+    if "list" in spec:
+        return [_decode(v, arrays) for v in spec["list"]]
+    if "tuple" in spec:
+        return tuple(_decode(v, arrays) for v in spec["tuple"])
+    return spec["value"]
+
+
+class SimulationModel:
+    """
+    Bundles the fitted distributions of the nodes without
+    parents and the summaries of the fitted regressions.
+
+    Parameters
+    ----------
+    node_params: dictionary
+        The variable distribution dictionary resulting from
+        `get_dist_node_no_parent`.
+
+    regressions: dictionary or None
+        Keys are regression names and values are dictionaries
+        from `get_regression_summary`.
+    """
+
+    def __init__(self, node_params, regressions=None):
+        self.node_params = dict(node_params)
+        self.regressions = {} if regressions is None else dict(regressions)
+        self._samplers = None
+        self._simulators = None
+
+    @classmethod
+    def from_fits(cls, node_params, fitted_regs=None):
+        """
+        Builds the model from the output of `get_dist_node_no_parent`
+        and of `fit_alternative_regression`.
+        """
+        regressions = {}
+        if fitted_regs is not None:
+            for name, fitted_reg in fitted_regs.items():
+                regressions[name] = get_regression_summary(fitted_reg)
+        return cls(node_params, regressions)
+
+    @property
+    def samplers(self):
+        """
+        The samplers of the categorical nodes, built on first use.
+        """
+        if self._samplers is None:
+            self._samplers = build_samplers(self.node_params)
+        return self._samplers
+
+    def save(self, path):
+        """
+        Saves the model to a single compressed `.npz` file. The
+        arrays are stored as `.npy` entries, and everything else
+        as a JSON entry, so loading never needs to unpickle.
+        """
+        arrays = {}
+        description = {
+            "version": SIM_MODEL_VERSION,
+            "node_params": _encode(self.node_params, arrays),
+            "regressions": _encode(self.regressions, arrays),
+        }
+        np.savez_compressed(
+            path, model_json=np.array(json.dumps(description)), **arrays
+        )
+        return None
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a model saved with `SimulationModel.save`.
+        """
+        with np.load(path, allow_pickle=False) as npz_file:
+            arrays = {key: npz_file[key] for key in npz_file.files}
+        description = json.loads(str(arrays.pop("model_json")))
+        if description.get("version") != SIM_MODEL_VERSION:
+            msg = "The model was saved by an incompatible version."
+            raise ValueError(msg)
+        return cls(
+            _decode(description["node_params"], arrays),
+            _decode(description["regressions"], arrays),
+        )
+
+    def sim_nodes_no_parent(self, size=1000, as_frame=True):
+        """
+        Simulates the nodes without parents, reusing the
+        resolved distributions of every node. See
+        `sim_nodes_batch`.
+        """
+        if self._simulators is None:
+            self._simulators = build_node_simulators(
+                self.node_params, self.samplers
+            )
+        return sim_nodes_batch(
+            self.node_params,
+            size=size,
+            simulators=self._simulators,
+            as_frame=as_frame,
+        )
+
+    def lin_reg_pred(
+        self, X, regression_name, size, causal_scale=None, random_state=None
+    ):
+        """
+        Produces predictions of a stored linear regression, as
+        `regression.lin_reg_pred` does for the fitted model.
+
+        Parameters
+        ----------
+        X: array-like
+            predictor array, without the constant.
+
+        regression_name: str
+            Key of the regression in `regressions`.
+
+        size: int
+            Size of dataset
+
+        causal_scale: int or list
+            int or list to scale the fitted coefficients
+            for each of the estimated parameters.
+
+        random_state: np.random.Generator or None
+            Source of randomness. If None, numpy's global
+            random state is used.
+
+        Returns
+        -------
+        Array of predictions.
+        """
+        regression = self.regressions[regression_name]
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[:, None]
+        predictor = np.column_stack([np.ones(X.shape[0]), X])
+
+        # Generators and the np.random module share these methods
+        rng = np.random if random_state is None else random_state
+
+        # Draw the coefficients from their sampling distribution
+        std_normals = rng.standard_normal((size, X.shape[1] + 1))
+        coefs = regression["params"] + std_normals @ regression["cov_chol"].T
+
+        # scale some parameters if desired causal effect is bigger
+        if causal_scale is not None:
+            coefs[:, 1:] = coefs[:, 1:] * np.array(causal_scale)
+
+        noise = rng.normal(
+            loc=0, scale=regression["resid_scale"], size=size
+        )
+        return np.einsum("ij, ij->i", coefs, predictor) + noise
@@ -3,9 +3,16 @@ Functions used in the simulation of observables
 to simulate data for nodes in a causal graph
 based on specified distribution and parameters
 """
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import numpy as np
 import pandas as pd
 import scipy.stats
+from causal2020.observables.sampling import CategoricalSampler
+from causal2020.observables.sampling import draw_integers
+from causal2020.observables.sampling import draw_uniforms
 
 
 def is_unique(var_values):
@@ -40,17 +47,46 @@ def is_categorical(var_type):
     return var_type == "categorical"
 
 
-def sim_categorical(var_dist_params, size):
+def sim_categorical(var_dist_params, size, sampler=None):
     """
     Function to simulate data for
-    a categorical/Discrete variable.
+    a categorical/Discrete variable. A prebuilt
+    `CategoricalSampler` of the variable can be
+    passed to avoid rebuilding it on every call.
     """
-    values = var_dist_params[0]
-    freq = var_dist_params[1]
-    data_sim = np.random.choice(a=values, p=freq, size=size)
+    if sampler is None:
+        values = var_dist_params[0]
+        freq = var_dist_params[1]
+        sampler = CategoricalSampler(values, freq)
+    data_sim = sampler.sample(size)
     return data_sim
 
 
+def build_samplers(params_dict):
+    """
+    Builds a `CategoricalSampler` for each categorical
+    variable of a distribution dictionary, so that
+    repeated simulations can reuse them.
+
+    Parameters
+    ----------
+    params_dict: dictionary
+        The variable distribution dictionary resulting from
+        `get_dist_node_no_parent`.
+
+    Returns
+    -------
+    Dictionary with the names of the categorical variables
+    as keys and their samplers as values.
+    """
+    samplers = {}
+    for column, variable in params_dict.items():
+        if is_categorical(variable["distribution"]):
+            values, freq = variable["parameters"]
+            samplers[column] = CategoricalSampler(values, freq)
+    return samplers
+
+
 def sim_constant(var_dist_params):
     """
     Function to simulate data for a
@@ -61,12 +97,34 @@ def sim_constant(var_dist_params):
     return data_sim
 
 
-def sim_empirical(var_dist_params, size):
+def sim_empirical(var_dist_params, size, random_state=None):
     """
     Function to sample with replacement
-    for a variable.
+    for a variable. The parameters are either
+    the observed values themselves, or their
+    summary from `distfit.compress_empirical`.
+    Draws from `random_state`, a np.random.Generator,
+    or from numpy's global random state if None.
     """
-    data_sim = np.random.choice(var_dist_params, size=size)
+    if not isinstance(var_dist_params, dict):
+        if random_state is None:
+            data_sim = np.random.choice(var_dist_params, size=size)
+        else:
+            data_sim = random_state.choice(var_dist_params, size=size)
+    elif "quantiles" in var_dist_params:
+        # Invert the piecewise linear CDF through the quantiles
+        data_sim = np.interp(
+            draw_uniforms(size, random_state),
+            var_dist_params["levels"],
+            var_dist_params["quantiles"],
+        )
+    else:
+        # Invert the CDF of the counts, which is equivalent to
+        # sampling the original values uniformly
+        cum_counts = np.cumsum(var_dist_params["counts"], dtype=np.int64)
+        draws = draw_integers(cum_counts[-1], size, random_state)
+        positions = np.searchsorted(cum_counts, draws, side="right")
+        data_sim = var_dist_params["values"][positions]
     return data_sim
 
 
@@ -83,13 +141,13 @@ def sim_continuous(var_dist, var_dist_params, size):
     return data_sim
 
 
-def sim_from_distribution(var_dist, var_dist_params, size):
+def sim_from_distribution(var_dist, var_dist_params, size, sampler=None):
     """
     Funtion to simulate data of size N based type of dist
     and the distribution parameters.
     """
     if is_categorical(var_dist):
-        sim_array = sim_categorical(var_dist_params, size)
+        sim_array = sim_categorical(var_dist_params, size, sampler)
         # Simulate variables for data with a single unique value
     elif is_constant(var_dist):
         sim_array = sim_constant(var_dist_params)
@@ -103,7 +161,190 @@ def sim_from_distribution(var_dist, var_dist_params, size):
     return sim_array
 
 
-def sim_node_no_parent(params_dict, size=1000):
+def build_node_simulators(params_dict, samplers=None):
+    """
+    Resolves the distribution of each variable once, so that
+    simulating a batch does no per-variable lookups.
+
+    Parameters
+    ----------
+    params_dict: dictionary
+        The variable distribution dictionary resulting from
+        `get_dist_node_no_parent`.
+
+    samplers: dictionary or None
+        Prebuilt samplers of the categorical variables, from
+        `build_samplers(params_dict)`. If None, they are built.
+
+    Returns
+    -------
+    Dictionary with the variable names as keys, and functions
+    that take the number of draws and an optional
+    np.random.Generator, and return an array of the simulated
+    values, as values.
+    """
+    if samplers is None:
+        samplers = build_samplers(params_dict)
+
+    simulators = {}
+    for column, variable in params_dict.items():
+        var_dist = variable["distribution"]
+        var_dist_params = variable["parameters"]
+        if is_categorical(var_dist):
+            sampler = samplers.get(column)
+            if sampler is None:
+                sampler = CategoricalSampler(*var_dist_params)
+            simulators[column] = sampler.sample
+        elif is_constant(var_dist):
+            value = np.asarray(sim_constant(var_dist_params)).ravel()[0]
+            simulators[column] = partial(_sim_constant_array, value)
+        elif is_empirical(var_dist):
+            simulators[column] = partial(sim_empirical, var_dist_params)
+        else:
+            # Freeze the scipy distribution with its parameters
+            frozen_dist = getattr(scipy.stats, var_dist)(*var_dist_params)
+            simulators[column] = partial(_sim_frozen, frozen_dist)
+    return simulators
+
+
+def _sim_constant_array(value, size, random_state=None):
+    """
+    Repeats the value of a constant variable.
+    """
+    return np.full(size, value)
+
+
+def _sim_frozen(frozen_dist, size, random_state=None):
+    """
+    Draws from a frozen scipy distribution.
+    """
+    return frozen_dist.rvs(size=size, random_state=random_state)
+
+
+def get_column_rng(seed, column):
+    """
+    Creates the random number generator of one variable, from
+    `seed` and the name of the variable. Each variable has an
+    independent stream, so adding or removing variables does
+    not change the values simulated for the others.
+
+    Parameters
+    ----------
+    seed: int or np.random.SeedSequence
+        The random seed. A SeedSequence, e.g. of a block of
+        rows, is extended with the name of the variable.
+
+    column: str
+        Name of the variable.
+
+    Returns
+    -------
+    np.random.Generator
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        entropy, spawn_key = seed.entropy, tuple(seed.spawn_key)
+    else:
+        entropy, spawn_key = seed, ()
+    # Python's hash of strings changes across processes, so
+    # derive the key of the name from a stable digest instead
+    digest = hashlib.sha256(str(column).encode("utf-8")).digest()
+    name_key = tuple(int(word) for word in np.frombuffer(digest, "<u4"))
+    seed_seq = np.random.SeedSequence(entropy, spawn_key=spawn_key + name_key)
+    return np.random.default_rng(seed_seq)
+
+
+def sim_nodes_batch(
+    params_dict,
+    size=1000,
+    samplers=None,
+    simulators=None,
+    as_frame=False,
+    random_state=None,
+    seed=None,
+    variables=None,
+    n_jobs=1,
+):
+    """
+    Simulates all the variables of a distribution dictionary
+    as one array per variable, without assembling a DataFrame
+    column by column.
+
+    Parameters
+    ----------
+    params_dict: dictionary
+        The variable distribution dictionary resulting from
+        `get_dist_node_no_parent`.
+
+    size: int
+        Number of simulated observations.
+
+    samplers: dictionary or None
+        See `build_node_simulators`.
+
+    simulators: dictionary or None
+        The output of `build_node_simulators(params_dict)`, to
+        reuse across repeated simulations. If None, it is built.
+
+    as_frame: bool
+        If True, the arrays are wrapped in a DataFrame without
+        copying them.
+
+    random_state: np.random.Generator or None
+        Source of randomness shared by all variables. If None
+        and `seed` is None, numpy's global random state is used.
+
+    seed: int, np.random.SeedSequence or None
+        If not None, each variable is simulated from its own
+        stream from `get_column_rng(seed, variable)`, so its
+        values do not depend on the other variables.
+
+    variables: list of str or None
+        The variables to simulate. With `seed`, simulating a
+        subset regenerates exactly the same values for those
+        variables as simulating all of them. If None, all the
+        variables are simulated.
+
+    n_jobs: int
+        Number of threads simulating variables concurrently.
+        Requires `seed`, since the global random state cannot
+        be shared across threads reproducibly.
+
+    Returns
+    -------
+    Dictionary with the variable names as keys and the arrays
+    of simulated values as values, or a DataFrame if
+    `as_frame` is True.
+    """
+    if seed is not None and random_state is not None:
+        msg = "Only one of `seed` and `random_state` can be specified."
+        raise ValueError(msg)
+    if n_jobs > 1 and seed is None:
+        msg = "`seed` MUST be specified to simulate with `n_jobs` > 1."
+        raise ValueError(msg)
+    if variables is None:
+        variables = list(params_dict.keys())
+    if simulators is None:
+        simulators = build_node_simulators(
+            {var: params_dict[var] for var in variables}, samplers
+        )
+
+    def sim_column(column):
+        column_rng = random_state
+        if seed is not None:
+            column_rng = get_column_rng(seed, column)
+        return simulators[column](size, column_rng)
+
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            columns = dict(zip(variables, executor.map(sim_column, variables)))
+    else:
+        columns = {column: sim_column(column) for column in variables}
+    if as_frame:
+        return pd.DataFrame(columns, copy=False)
+    return columns
+
+
+def sim_node_no_parent(params_dict, size=1000, samplers=None):
     """
     Funtion to simulate data of size N based on specified
     distribution/parameters found by the fitter package.
@@ -118,18 +359,109 @@ def sim_node_no_parent(params_dict, size=1000):
         Size of the desired simulated dataset, default value
         is 1000 observations.
 
+    samplers: dictionary or None
+        Prebuilt samplers of the categorical variables, from
+        `build_samplers(params_dict)`. Pass them when simulating
+        from the same `params_dict` repeatedly. If None, they
+        are built on each call.
+
     Returns
     -------
     DataFrame object with simulated data based on specified distributions
     """
-    # Create Empty DataFrame with keys from params_dict
-    sim_df = pd.DataFrame(columns=list(params_dict.keys()))
-    sim_df = sim_df.fillna(0)
+    return sim_nodes_batch(params_dict, size, samplers, as_frame=True)
+
+
+def get_replicate_offsets(sizes):
+    """
+    Computes where each replication starts in arrays that
+    stack all replications.
+
+    Parameters
+    ----------
+    sizes: array-like of ints
+        Number of observations in each replication.
+
+    Returns
+    -------
+    Array of length `len(sizes) + 1`, such that replication
+    `r` is stored in rows `offsets[r]:offsets[r + 1]`.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    if sizes.ndim != 1 or (sizes < 0).any():
+        msg = "`sizes` MUST be a 1D array of non-negative integers."
+        raise ValueError(msg)
+    offsets = np.zeros(sizes.shape[0] + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return offsets
 
-    for column in list(params_dict.keys()):
-        variable = params_dict[column]
-        var_dist = variable["distribution"]
-        var_dist_params = variable["parameters"]
-        sim_df[column] = sim_from_distribution(var_dist, var_dist_params, size)
 
-    return sim_df
+def sim_node_replicates(
+    params_dict, sizes, samplers=None, simulators=None, as_frame=False
+):
+    """
+    Simulates many replications of the nodes without parents
+    in one call per variable. The replications are stacked,
+    so the per-call cost of each distribution is paid once
+    instead of once per replication.
+
+    Parameters
+    ----------
+    params_dict: dictionary
+        The variable distribution dictionary resulting from
+        `get_dist_node_no_parent`.
+
+    sizes: array-like of ints
+        Number of observations in each replication. The sizes
+        may differ across replications.
+
+    samplers, simulators: dictionary or None
+        See `sim_nodes_batch`.
+
+    as_frame: bool
+        See `sim_nodes_batch`.
+
+    Returns
+    -------
+    Tuple of the stacked simulated data, as returned by
+    `sim_nodes_batch`, and the replicate offsets from
+    `get_replicate_offsets`. When all sizes are equal to n,
+    each column can be reshaped to `(len(sizes), n)`.
+    """
+    offsets = get_replicate_offsets(sizes)
+    sim_data = sim_nodes_batch(
+        params_dict,
+        size=int(offsets[-1]),
+        samplers=samplers,
+        simulators=simulators,
+        as_frame=as_frame,
+    )
+    return sim_data, offsets
+
+
+def split_replicates(sim_data, offsets):
+    """
+    Splits stacked replications into a list with one entry
+    per replication, without copying the data.
+
+    Parameters
+    ----------
+    sim_data: DataFrame, dictionary of arrays, or array
+        Stacked replications, e.g. from `sim_node_replicates`.
+
+    offsets: array-like of ints
+        The replicate offsets from `get_replicate_offsets`.
+
+    Returns
+    -------
+    List of the replications, of the same type as `sim_data`.
+    """
+    bounds = list(zip(offsets[:-1], offsets[1:]))
+    if isinstance(sim_data, pd.DataFrame):
+        return [sim_data.iloc[start:end] for start, end in bounds]
+    if isinstance(sim_data, dict):
+        return [
+            {column: values[start:end] for column, values in sim_data.items()}
+            for start, end in bounds
+        ]
+    return [sim_data[start:end] for start, end in bounds]
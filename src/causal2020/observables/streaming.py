@@ -0,0 +1,248 @@
+"""
+Functions used to simulate synthetic populations that
+are too large to hold in memory, in chunks of rows that
+are written to Parquet as they are produced.
+"""
+import numpy as np
+import pandas as pd
+from causal2020.observables.availability import sim_availability_matrix
+from causal2020.observables.sampling import CategoricalSampler
+from causal2020.observables.simulation import build_node_simulators
+from causal2020.observables.simulation import get_column_rng
+from causal2020.observables.simulation import sim_nodes_batch
+
+# Number of rows simulated from each random stream. Chunks are
+# made of whole blocks, so the simulated rows do not depend on
+# the chunk size.
+DEFAULT_BLOCK_SIZE = 2 ** 16
+
+
+def get_block_seed_seq(seed, block):
+    """
+    Creates the seed sequence of a block of rows, which is
+    spawned from `seed` and the position of the block. Each
+    column of the block has an independent stream derived
+    from it with `get_column_rng`.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(block,))
+
+
+def sim_block(
+    model,
+    size,
+    seed_seq,
+    simulators,
+    child_nodes=None,
+    availability=None,
+    n_jobs=1,
+):
+    """
+    Simulates one block of rows: the nodes without parents,
+    then the child nodes, then the availability columns.
+
+    Parameters
+    ----------
+    model: SimulationModel
+        The fitted simulation model.
+
+    size: int
+        Number of rows of the block.
+
+    seed_seq: np.random.SeedSequence
+        The seed sequence of the block.
+
+    simulators: dictionary
+        The output of `build_node_simulators` for the nodes
+        without parents of `model`.
+
+    child_nodes: dictionary or None
+        See `iter_simulation_chunks`.
+
+    availability: tuple or None
+        Tuple of a `CategoricalSampler` of the number of
+        available alternatives and the alternative name
+        dictionary, as used in `sim_availability_matrix`.
+
+    n_jobs: int
+        Number of threads simulating the nodes without parents.
+
+    Returns
+    -------
+    Dictionary with column names as keys and arrays of
+    simulated values as values.
+    """
+    columns = sim_nodes_batch(
+        model.node_params,
+        size,
+        simulators=simulators,
+        seed=seed_seq,
+        n_jobs=n_jobs,
+    )
+    if child_nodes is not None:
+        # Child nodes are simulated in order, so they may depend
+        # on child nodes listed before them
+        for column, (regression_name, predictors) in child_nodes.items():
+            if isinstance(predictors, str):
+                predictors = [predictors]
+            X = np.column_stack([columns[name] for name in predictors])
+            columns[column] = model.lin_reg_pred(
+                X,
+                regression_name,
+                size,
+                random_state=get_column_rng(seed_seq, column),
+            )
+    if availability is not None:
+        av_sampler, alt_name_dict = availability
+        # The availability columns share one stream, named after them
+        av_columns = [alt_name_dict[i] + "_AV" for i in alt_name_dict]
+        av_df = sim_availability_matrix(
+            av_sampler,
+            size,
+            alt_name_dict,
+            random_state=get_column_rng(seed_seq, str(av_columns)),
+        )
+        for column in av_df.columns:
+            columns[column] = av_df[column].to_numpy()
+    return columns
+
+
+def iter_simulation_chunks(
+    model,
+    num_rows,
+    chunk_size=2 ** 20,
+    seed=None,
+    child_nodes=None,
+    availability=None,
+    block_size=DEFAULT_BLOCK_SIZE,
+    n_jobs=1,
+):
+    """
+    Simulates `num_rows` rows in chunks. Rows are simulated
+    in blocks of `block_size` rows, and each column of each
+    block has an independent random stream, so the same
+    `seed` gives the same rows for any chunk size, and memory
+    use is bounded by the chunk size.
+
+    Parameters
+    ----------
+    model: SimulationModel
+        The fitted simulation model.
+
+    num_rows: int
+        Total number of rows to simulate.
+
+    chunk_size: int
+        Number of rows in each chunk. Must be a multiple of
+        `block_size`. Default is 2 ** 20.
+
+    seed: int or None
+        The random seed. If None, fresh entropy is drawn once
+        and used for every block.
+
+    child_nodes: dictionary or None
+        Keys are the names of the child columns, and values are
+        tuples of the name of a regression in `model` and the
+        name, or list of names, of the predictor columns.
+
+    availability: tuple or None
+        Tuple of the observed numbers of available alternatives,
+        e.g. from `get_num_of_av_alts`, and the alternative name
+        dictionary. If None, no availability is simulated.
+
+    block_size: int
+        Number of rows simulated from each random stream.
+
+    n_jobs: int
+        Number of threads simulating the nodes without parents.
+
+    Returns
+    -------
+    Iterator of DataFrames with the simulated chunks.
+    """
+    if chunk_size <= 0 or chunk_size % block_size != 0:
+        msg = "`chunk_size` MUST be a positive multiple of `block_size`."
+        raise ValueError(msg)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if availability is not None:
+        num_alts, alt_name_dict = availability
+        if not isinstance(num_alts, CategoricalSampler):
+            num_alts = CategoricalSampler.from_observations(num_alts)
+        availability = (num_alts, alt_name_dict)
+    simulators = build_node_simulators(model.node_params, model.samplers)
+
+    for chunk_start in range(0, num_rows, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, num_rows)
+        blocks = []
+        for block_start in range(chunk_start, chunk_stop, block_size):
+            block_seq = get_block_seed_seq(seed, block_start // block_size)
+            block_rows = min(block_size, num_rows - block_start)
+            blocks.append(
+                sim_block(
+                    model,
+                    block_rows,
+                    block_seq,
+                    simulators,
+                    child_nodes,
+                    availability,
+                    n_jobs,
+                )
+            )
+        chunk = {
+            column: np.concatenate([block[column] for block in blocks])
+            for column in blocks[0]
+        }
+        chunk_df = pd.DataFrame(chunk, copy=False)
+        chunk_df.index = pd.RangeIndex(chunk_start, chunk_stop)
+        yield chunk_df
+
+
+def stream_simulation_to_parquet(
+    model,
+    path,
+    num_rows,
+    chunk_size=2 ** 20,
+    seed=None,
+    child_nodes=None,
+    availability=None,
+    block_size=DEFAULT_BLOCK_SIZE,
+    n_jobs=1,
+):
+    """
+    Simulates `num_rows` rows in chunks, writing each chunk to
+    a Parquet file as a row group as soon as it is simulated.
+    See `iter_simulation_chunks` for the parameters.
+
+    Returns
+    -------
+    Number of chunks written to `path`.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        msg = "pyarrow is needed to write Parquet files."
+        raise ImportError(msg)
+
+    writer = None
+    num_chunks = 0
+    try:
+        for chunk_df in iter_simulation_chunks(
+            model,
+            num_rows,
+            chunk_size=chunk_size,
+            seed=seed,
+            child_nodes=child_nodes,
+            availability=availability,
+            block_size=block_size,
+            n_jobs=n_jobs,
+        ):
+            table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            num_chunks += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_chunks
@@ -1,12 +1,33 @@
+import os
+import time
+
 import numpy as np
+import pandas as pd
 import pytest
+import scipy.stats
+from causal2020.observables import distfit
+from causal2020.observables.distfit import compress_empirical
+from causal2020.observables.distfit import fit_binned_mle
+from causal2020.observables.distfit import fit_cache_key
+from causal2020.observables.distfit import fit_tasks_with_budget
+from causal2020.observables.distfit import get_continuous_dist
+from causal2020.observables.distfit import get_dist_node_no_parent
+from causal2020.observables.distfit import index_long_data
+from causal2020.observables.distfit import rank_continuous_dists
 
 
 PATH = "../../../data/raw/spring_2016_all_bay_area_long_format_plus_cross_bay_col.csv"
-data_long = pd.read_csv(PATH)
 
 
-def test_get_dist_node_no_parent():
+@pytest.fixture
+def data_long():
+    # The raw dataset is not part of the repository
+    if not os.path.exists(PATH):
+        pytest.skip("The long format dataset is not available.")
+    return pd.read_csv(PATH)
+
+
+def test_get_dist_node_no_parent(data_long):
     # Setup
     alternative_id_col = "mode_id"
     observation_id_col = "observation_id"
@@ -70,10 +91,9 @@ def test_get_dist_node_no_parent():
         "household_size": {
             "distribution": "categorical",
             "parameters": [
-                np.array([0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]),
+                np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]),
                 np.array(
                     [
-                        0.0,
                         0.08341658,
                         0.2465035,
                         0.20704296,
@@ -219,3 +239,257 @@ def test_get_dist_node_no_parent():
         np.testing.assert_array_almost_equal(
             truth_params_dic[k]["parameters"], params_dic[k]["parameters"]
         )
+
+
+def test_get_dist_node_no_parent_parallel_matches_serial():
+    # Setup
+    num_obs = 300
+    np.random.seed(0)
+    data = pd.DataFrame(
+        {
+            "observation_id": np.repeat(np.arange(num_obs), 2),
+            "mode_id": np.tile([1, 2], num_obs),
+            "num_kids": np.repeat(np.random.randint(0, 3, num_obs), 2),
+            "income": np.repeat(np.random.gamma(2, 3, num_obs), 2),
+            "total_travel_time": np.random.gamma(2, 10, 2 * num_obs),
+        }
+    )
+    kwargs = {
+        "data_long": data,
+        "alt_id_col": "mode_id",
+        "obs_id_col": "observation_id",
+        "alt_spec_dic": {1: ["total_travel_time"], 2: ["total_travel_time"]},
+        "alt_name_dic": {1: "drive_alone", 2: "walk"},
+        "ind_spec": ["num_kids", "income"],
+        "trip_spec": [],
+        "var_types": {
+            "num_kids": "categorical",
+            "income": "continuous",
+            "total_travel_time": "continuous",
+        },
+        "cont_dists": ["norm", "gamma", "expon"],
+    }
+
+    # Exercise
+    serial_params = get_dist_node_no_parent(**kwargs)
+    parallel_params, fit_times = get_dist_node_no_parent(
+        **kwargs, n_jobs=2, return_fit_times=True
+    )
+
+    # Verify
+    assert list(serial_params) == list(parallel_params)
+    assert set(fit_times) == set(serial_params)
+    for k in serial_params:
+        assert (
+            serial_params[k]["distribution"]
+            == parallel_params[k]["distribution"]
+        )
+        assert repr(serial_params[k]["parameters"]) == repr(
+            parallel_params[k]["parameters"]
+        )
+
+
+def test_fit_tasks_with_budget_reports_truncated_fits():
+    # Setup
+    np.random.seed(1)
+    cont_dists = ["norm", "gamma", "expon", "lognorm"]
+    x_values = pd.Series(np.random.gamma(5, 2, 5000))
+    y_values = pd.Series(np.random.randint(0, 3, 100))
+    tasks = [
+        ("x", "continuous", x_values, cont_dists, None),
+        ("y", "categorical", y_values, None, None),
+    ]
+
+    # Exercise
+    fit_results, truncated = fit_tasks_with_budget(tasks, 60, seed=2)
+    _, truncated_no_budget = fit_tasks_with_budget(tasks, 0, seed=2)
+
+    # Verify
+    assert fit_results[0][0]["x"]["distribution"] == "gamma"
+    assert len(fit_results[0][0]["x"]["parameters"]) == 3
+    assert fit_results[1][0]["y"]["distribution"] == "categorical"
+    assert truncated == []
+    assert truncated_no_budget == ["x"]
+
+
+def test_rank_continuous_dists_stops_at_deadline():
+    # Setup
+    np.random.seed(3)
+    values = np.random.gamma(5, 2, 2000)
+    cont_dists = ["norm", "gamma", "expon", "lognorm"]
+
+    # Exercise
+    full_ranking = rank_continuous_dists(values, cont_dists, seed=4)
+    cut_ranking = rank_continuous_dists(
+        values, cont_dists, seed=4, deadline=time.perf_counter()
+    )
+
+    # Verify
+    assert len(full_ranking) == 4
+    assert cut_ranking == []
+
+
+def test_fit_tasks_with_budget_stops_slow_fits():
+    # Setup
+    np.random.seed(4)
+    values = pd.Series(np.random.gamma(5, 2, 5000))
+    cont_dists = ["norm", "levy_stable", "gamma"]
+    tasks = [("v", "continuous", values, cont_dists, None)]
+
+    # Exercise
+    start_time = time.perf_counter()
+    fit_results, truncated = fit_tasks_with_budget(tasks, 5, seed=0)
+    elapsed = time.perf_counter() - start_time
+
+    # Verify
+    assert elapsed < 10
+    assert truncated == ["v"]
+    assert fit_results[0][0]["v"]["distribution"] in ["norm", "gamma"]
+
+
+def test_fit_cache_key_depends_on_cache_format_version(monkeypatch):
+    # Setup
+    values = pd.Series([1.0, 2.0, 3.0])
+    key = fit_cache_key("continuous", values, ["norm"], "fitter")
+
+    # Exercise
+    monkeypatch.setattr(
+        distfit, "CACHE_FORMAT_VERSION", distfit.CACHE_FORMAT_VERSION + 1
+    )
+    new_key = fit_cache_key("continuous", values, ["norm"], "fitter")
+
+    # Verify
+    assert new_key != key
+
+
+def test_fit_binned_mle_raises_after_timeout():
+    # Setup
+    np.random.seed(5)
+    values = np.random.gamma(5, 2, 20000)
+
+    # Exercise and Verify
+    start_time = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        fit_binned_mle(values, "levy_stable", timeout=2)
+    assert time.perf_counter() - start_time < 5
+
+
+def test_get_continuous_dist_skips_slow_binned_fits():
+    # Setup
+    np.random.seed(6)
+    values = pd.Series(np.random.gamma(5, 2, 20000))
+
+    # Exercise
+    start_time = time.perf_counter()
+    cont_dict = get_continuous_dist(
+        "v", values, ["levy_stable", "gamma"], binned=True, timeout=2
+    )
+    elapsed = time.perf_counter() - start_time
+
+    # Verify
+    assert elapsed < 6
+    assert cont_dict["v"]["distribution"] == "gamma"
+
+
+def test_get_dist_node_no_parent_cache_refits_changed_columns(tmp_path):
+    # Setup
+    num_obs = 200
+    np.random.seed(3)
+    data = pd.DataFrame(
+        {
+            "observation_id": np.arange(num_obs),
+            "mode_id": np.ones(num_obs, dtype=int),
+            "income": np.random.gamma(2, 3, num_obs),
+            "total_travel_time": np.random.gamma(2, 10, num_obs),
+        }
+    )
+    kwargs = {
+        "alt_id_col": "mode_id",
+        "obs_id_col": "observation_id",
+        "alt_spec_dic": {1: ["total_travel_time"]},
+        "alt_name_dic": {1: "drive_alone"},
+        "ind_spec": ["income"],
+        "trip_spec": [],
+        "var_types": {
+            "income": "continuous",
+            "total_travel_time": "continuous",
+        },
+        "cont_dists": ["norm", "gamma"],
+        "cache_dir": str(tmp_path),
+        "return_fit_times": True,
+    }
+
+    # Exercise
+    first_params, _ = get_dist_node_no_parent(data_long=data, **kwargs)
+    cached_params, cached_times = get_dist_node_no_parent(
+        data_long=data, **kwargs
+    )
+    data["income"] *= 2
+    _, refit_times = get_dist_node_no_parent(data_long=data, **kwargs)
+
+    # Verify
+    assert repr(dict(first_params)) == repr(dict(cached_params))
+    assert cached_times == {
+        "income": 0.0,
+        "total_travel_time_drive_alone": 0.0,
+    }
+    assert refit_times["income"] > 0
+    assert refit_times["total_travel_time_drive_alone"] == 0.0
+
+
+def test_index_long_data_matches_pandas_filtering():
+    # Setup
+    np.random.seed(4)
+    data = pd.DataFrame(
+        {
+            "observation_id": np.repeat(np.random.permutation(50), 3),
+            "mode_id": np.tile([3, 1, 2], 50),
+        }
+    )
+    data = data.sample(frac=0.8, random_state=5).reset_index(drop=True)
+
+    # Exercise
+    first_obs_rows, alt_rows = index_long_data(
+        data, "observation_id", "mode_id"
+    )
+
+    # Verify
+    expected_first = data.drop_duplicates("observation_id").index.to_numpy()
+    np.testing.assert_array_equal(first_obs_rows, expected_first)
+    assert list(alt_rows) == list(data["mode_id"].unique())
+    for alt_id, rows in alt_rows.items():
+        expected_rows = data.index[data["mode_id"] == alt_id].to_numpy()
+        np.testing.assert_array_equal(rows, expected_rows)
+
+
+def test_fit_binned_mle_matches_exact_fit():
+    # Setup
+    np.random.seed(6)
+    values = np.random.gamma(2, 3, 200000) + 1
+    exact_params = scipy.stats.gamma.fit(values)
+
+    # Exercise
+    binned_params = fit_binned_mle(values, "gamma", seed=7)
+
+    # Verify
+    np.testing.assert_allclose(binned_params, exact_params, rtol=0.02)
+
+
+def test_compress_empirical_keeps_counts_or_quantiles():
+    # Setup
+    np.random.seed(8)
+    discrete_values = np.random.randint(0, 5, 1000)
+    continuous_values = np.random.normal(size=10000)
+
+    # Exercise
+    discrete_params = compress_empirical(discrete_values)
+    continuous_params = compress_empirical(continuous_values)
+
+    # Verify
+    np.testing.assert_array_equal(discrete_params["values"], np.arange(5))
+    np.testing.assert_array_equal(
+        discrete_params["counts"], np.bincount(discrete_values)
+    )
+    assert continuous_params["quantiles"].shape == (257,)
+    assert continuous_params["quantiles"][0] == continuous_values.min()
+    assert continuous_params["quantiles"][-1] == continuous_values.max()
@@ -0,0 +1,148 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+from causal2020.observables.graphsim import GraphSimulator
+from causal2020.observables.regression import fit_alternative_regression
+
+
+def make_simulator():
+    np.random.seed(0)
+    data = pd.DataFrame(
+        {
+            "total_travel_distance": np.random.gamma(2, 3, size=1000),
+            "total_travel_time": np.random.gamma(3, 10, size=1000),
+        }
+    )
+    noise = np.random.normal(size=(1000, 3))
+    data["da_time"] = 2 * data["total_travel_distance"] + 5 + noise[:, 0]
+    data["da_cost"] = 0.5 * data["total_travel_distance"] + 1 + noise[:, 1]
+    data["wtw_cost"] = 0.1 * data["total_travel_time"] + 2 + noise[:, 2]
+    da_data = pd.DataFrame(
+        {
+            "total_travel_distance": data["total_travel_distance"],
+            "total_travel_time": data["da_time"],
+            "total_travel_cost": data["da_cost"],
+        }
+    )
+    wtw_data = pd.DataFrame(
+        {
+            "total_travel_time": data["total_travel_time"],
+            "total_travel_cost": data["wtw_cost"],
+        }
+    )
+    fitted_regs = {
+        "drive_alone": fit_alternative_regression(
+            {
+                1: ("total_travel_distance", "total_travel_time"),
+                2: ("total_travel_distance", "total_travel_cost"),
+            },
+            {1: "linear", 2: "linear"},
+            da_data,
+        ),
+        "wtw": fit_alternative_regression(
+            {1: ("total_travel_time", "total_travel_cost")},
+            {1: "linear"},
+            wtw_data,
+        ),
+    }
+    graphs = {
+        "drive_alone": nx.DiGraph(
+            [
+                ("Total Travel Distance", "Total Travel Time"),
+                ("Total Travel Distance", "Total Travel Cost"),
+                ("Total Travel Time", "Utility (Drive Alone)"),
+                ("Total Travel Cost", "Utility (Drive Alone)"),
+            ]
+        ),
+        "wtw": nx.DiGraph(
+            [
+                ("Total Travel Time", "Total Travel Cost"),
+                ("Total Travel Cost", "Utility (WTW)"),
+            ]
+        ),
+    }
+    return GraphSimulator(graphs, fitted_regs)
+
+
+def test_graph_simulator_wide_data():
+    # Setup
+    simulator = make_simulator()
+    rng = np.random.default_rng(1)
+    sim_data = {
+        "total_travel_distance_drive_alone": rng.gamma(2, 3, size=20000),
+        "total_travel_time_wtw": rng.gamma(3, 10, size=20000),
+    }
+
+    # Exercise
+    simulator.simulate(sim_data, random_state=rng)
+
+    # Verify
+    assert [batch["column"] for batch in simulator.batches] == [
+        "total_travel_time",
+        "total_travel_cost",
+    ]
+    assert simulator.batches[1]["alternatives"] == ["drive_alone", "wtw"]
+    assert sorted(simulator.skipped_nodes) == [
+        ("drive_alone", "Utility (Drive Alone)"),
+        ("wtw", "Utility (WTW)"),
+    ]
+    for column, parent, slope, intercept in [
+        ("total_travel_time_drive_alone", "distance_drive_alone", 2, 5),
+        ("total_travel_cost_drive_alone", "distance_drive_alone", 0.5, 1),
+        ("total_travel_cost_wtw", "time_wtw", 0.1, 2),
+    ]:
+        x = sim_data["total_travel_" + parent]
+        fitted_slope, fitted_intercept = np.polyfit(x, sim_data[column], 1)
+        assert pytest.approx(fitted_slope, abs=0.05) == slope
+        assert pytest.approx(fitted_intercept, abs=0.3) == intercept
+
+
+def test_graph_simulator_long_data():
+    # Setup
+    simulator = make_simulator()
+    long_data = pd.DataFrame(
+        {
+            "mode_id": np.tile([1, 4, 7], 1000),
+            "total_travel_distance": np.tile([10.0, 0.0, 1.0], 1000),
+            "total_travel_time": np.tile([-1.0, 50.0, -1.0], 1000),
+            "total_travel_cost": -1.0,
+        }
+    )
+    alt_name_dict = {1: "drive_alone", 4: "wtw", 7: "walk"}
+
+    # Exercise
+    simulator.simulate_long(
+        long_data,
+        "mode_id",
+        alt_name_dict,
+        random_state=np.random.default_rng(2),
+        nodes=["Total Travel Cost"],
+    )
+
+    # Verify
+    mean_cost = long_data.groupby("mode_id")["total_travel_cost"].mean()
+    assert pytest.approx(mean_cost[1], abs=0.2) == 6
+    assert pytest.approx(mean_cost[4], abs=0.2) == 7
+    assert mean_cost[7] == -1
+    np.testing.assert_array_equal(
+        long_data["total_travel_time"], np.tile([-1, 50, -1], 1000)
+    )
+
+
+def test_graph_simulator_long_data_missing_alternative():
+    # Setup
+    simulator = make_simulator()
+    long_data = pd.DataFrame(
+        {
+            "mode_id": [1, 4],
+            "total_travel_distance": [10.0, 0.0],
+            "total_travel_time": [-1.0, 50.0],
+            "total_travel_cost": -1.0,
+        }
+    )
+
+    # Exercise and Verify
+    with pytest.raises(ValueError, match="wtw"):
+        simulator.simulate_long(long_data, "mode_id", {1: "drive_alone"})
+    assert (long_data["total_travel_cost"] == -1).all()
@@ -1,6 +1,10 @@
 import numpy as np
 import pandas as pd
 import pytest
+from causal2020.observables.regression import fit_alternative_regression
+from causal2020.observables.regression import lin_reg_pred
+from causal2020.observables.regression import lin_reg_pred_replicates
+from causal2020.observables.simulation import get_replicate_offsets
 
 
 def test_fit_regression():
@@ -34,4 +38,26 @@ def test_reg_prediction():
 
     # Verify
     diff = data["y"] - y_pred
-    assert pytest.approx(np.mean(diff)) == 0
+    assert pytest.approx(np.mean(diff), abs=1e-6) == 0
+
+
+def test_reg_prediction_replicates():
+    # Setup
+    x = np.random.randint(100, 3500, size=2000)
+    data = pd.DataFrame(data=x, columns=["x"])
+    data["y"] = 5 * data["x"] + 2
+    fitted_reg = fit_alternative_regression(
+        {1: ("x", "y")}, {1: "linear"}, data
+    )
+    offsets = get_replicate_offsets([500, 1200, 300])
+
+    # Exercise
+    y_pred = lin_reg_pred_replicates(data["x"], fitted_reg["y_on_x"], offsets)
+
+    # Verify
+    assert y_pred.shape == (2000,)
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        diff = data["y"].values[start:end] - y_pred[start:end]
+        assert pytest.approx(np.mean(diff), abs=1e-6) == 0
+    with pytest.raises(ValueError):
+        lin_reg_pred_replicates(data["x"][:10], fitted_reg["y_on_x"], offsets)
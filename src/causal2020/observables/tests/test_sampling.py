@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from causal2020.observables.sampling import CategoricalSampler
+
+
+def test_categorical_sampler_matches_probabilities():
+    # Setup
+    values = np.array([3, 10 ** 9, 7, 42])
+    probs = np.array([0.1, 0.45, 0.05, 0.4])
+    sampler = CategoricalSampler(values, probs)
+    rng = np.random.default_rng(0)
+
+    # Exercise
+    draws = sampler.sample(200000, random_state=rng)
+
+    # Verify
+    assert set(np.unique(draws)) <= set(values)
+    freq = np.array([(draws == value).mean() for value in values])
+    np.testing.assert_allclose(freq, probs, atol=0.005)
+
+
+def test_categorical_sampler_from_observations():
+    # Setup
+    observed = np.array([5, 5, 2, 5, 2, 9, 5, 5])
+
+    # Exercise
+    sampler = CategoricalSampler.from_observations(observed)
+
+    # Verify
+    np.testing.assert_array_equal(sampler.values, [2, 5, 9])
+    np.testing.assert_allclose(sampler.probs, [0.25, 0.625, 0.125])
+    with pytest.raises(ValueError):
+        CategoricalSampler([1, 2], [0.5])
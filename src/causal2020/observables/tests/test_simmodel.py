@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from causal2020.observables.regression import fit_alternative_regression
+from causal2020.observables.simmodel import SimulationModel
+
+
+def test_simulation_model_round_trip(tmp_path):
+    # Setup
+    np.random.seed(0)
+    data = pd.DataFrame({"x": np.random.uniform(1, 10, size=500)})
+    data["y"] = 3 * data["x"] + 1 + np.random.normal(size=500)
+    fitted_regs = fit_alternative_regression(
+        {1: ("x", "y")}, {1: "linear"}, data
+    )
+    node_params = {
+        "kids": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 4]), np.array([0.5, 0.3, 0.2])],
+        },
+        "cross_bay": {"distribution": "constant", "parameters": 1},
+        "time": {
+            "distribution": "empirical",
+            "parameters": {
+                "values": np.array([2.5, 3.0]),
+                "counts": np.array([3, 1]),
+            },
+        },
+        "dist": {"distribution": "gamma", "parameters": (2.0, 0.1, 3.0)},
+    }
+    model = SimulationModel.from_fits(node_params, fitted_regs)
+    path = str(tmp_path / "model.npz")
+
+    # Exercise
+    model.save(path)
+    loaded = SimulationModel.load(path)
+
+    # Verify
+    assert loaded.node_params["dist"]["parameters"] == (2.0, 0.1, 3.0)
+    assert loaded.node_params["cross_bay"]["parameters"] == 1
+    for var in ["kids", "time"]:
+        expected = node_params[var]["parameters"]
+        actual = loaded.node_params[var]["parameters"]
+        if isinstance(expected, dict):
+            expected, actual = list(expected.values()), list(actual.values())
+        for expected_array, actual_array in zip(expected, actual):
+            np.testing.assert_array_equal(expected_array, actual_array)
+
+    regression = loaded.regressions["y_on_x"]
+    fitted_reg = fitted_regs["y_on_x"]
+    assert regression["param_names"] == ["const", "x"]
+    np.testing.assert_allclose(regression["params"], fitted_reg.params)
+    np.testing.assert_allclose(
+        regression["cov_chol"] @ regression["cov_chol"].T,
+        fitted_reg.cov_params(),
+    )
+    prediction = loaded.lin_reg_pred(data["x"], "y_on_x", data.shape[0])
+    assert pytest.approx(np.mean(data["y"] - prediction), abs=0.2) == 0
+    assert loaded.sim_nodes_no_parent(size=10).shape == (10, 4)
+
+
+def test_simulation_model_loads_without_fitting_libraries():
+    # Setup
+    code = (
+        "import sys\n"
+        "import causal2020.observables.simmodel\n"
+        "print('statsmodels' in sys.modules or 'fitter' in sys.modules)\n"
+    )
+
+    # Exercise
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+
+    # Verify
+    assert output.decode().strip() == "False"
@@ -2,6 +2,13 @@ import numpy as np
 import pandas as pd
 import pytest
 import scipy.stats
+from causal2020.observables.simulation import build_node_simulators
+from causal2020.observables.simulation import build_samplers
+from causal2020.observables.simulation import sim_empirical
+from causal2020.observables.simulation import sim_node_no_parent
+from causal2020.observables.simulation import sim_node_replicates
+from causal2020.observables.simulation import sim_nodes_batch
+from causal2020.observables.simulation import split_replicates
 
 
 def test_sim_node_no_parent():
@@ -35,3 +42,128 @@ def test_sim_node_no_parent():
     np.testing.assert_array_less(
         abs(expected_data["z"].std() - actual_data["z"].std()), 0.1
     )  # the 0.1 can be discussed
+
+
+def test_sim_empirical_from_counts_and_quantiles():
+    # Setup
+    np.random.seed(9)
+    counts_params = {
+        "values": np.array([1, 5, 9]),
+        "counts": np.array([1, 2, 1]),
+    }
+    quantile_params = {
+        "levels": np.array([0.0, 0.5, 1.0]),
+        "quantiles": np.array([0.0, 1.0, 3.0]),
+    }
+
+    # Exercise
+    counts_sample = sim_empirical(counts_params, size=100000)
+    quantile_sample = sim_empirical(quantile_params, size=100000)
+
+    # Verify
+    assert set(np.unique(counts_sample)) == {1, 5, 9}
+    np.testing.assert_array_less(abs((counts_sample == 5).mean() - 0.5), 0.01)
+    np.testing.assert_array_less(abs(np.median(quantile_sample) - 1), 0.02)
+    assert quantile_sample.min() >= 0 and quantile_sample.max() <= 3
+
+
+def test_sim_node_no_parent_reuses_samplers():
+    # Setup
+    params_dict = {
+        "x": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 2]), np.array([0.5, 0.25, 0.25])],
+        },
+        "z": {"distribution": "norm", "parameters": (20, 1.2)},
+    }
+    samplers = build_samplers(params_dict)
+
+    # Exercise
+    np.random.seed(1)
+    prebuilt = sim_node_no_parent(params_dict, size=1000, samplers=samplers)
+    np.random.seed(1)
+    rebuilt = sim_node_no_parent(params_dict, size=1000)
+
+    # Verify
+    assert list(samplers.keys()) == ["x"]
+    pd.testing.assert_frame_equal(prebuilt, rebuilt)
+
+
+def test_sim_nodes_batch_matches_sim_node_no_parent():
+    # Setup
+    params_dict = {
+        "y": {"distribution": "constant", "parameters": np.array([5])},
+        "x": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 2]), np.array([0.5, 0.25, 0.25])],
+        },
+        "z": {"distribution": "gamma", "parameters": (2.0, 0.5, 3.0)},
+    }
+    simulators = build_node_simulators(params_dict)
+
+    # Exercise
+    np.random.seed(2)
+    columns = sim_nodes_batch(params_dict, size=500, simulators=simulators)
+    np.random.seed(2)
+    sim_df = sim_node_no_parent(params_dict, size=500)
+
+    # Verify
+    assert list(columns.keys()) == ["y", "x", "z"]
+    assert all(len(column) == 500 for column in columns.values())
+    np.testing.assert_array_equal(columns["y"], 5)
+    pd.testing.assert_frame_equal(pd.DataFrame(columns), sim_df)
+
+
+def test_sim_node_replicates_with_ragged_sizes():
+    # Setup
+    params_dict = {
+        "x": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 2]), np.array([0.5, 0.25, 0.25])],
+        },
+        "z": {"distribution": "norm", "parameters": (20, 1.2)},
+    }
+    sizes = [3, 0, 5, 2]
+
+    # Exercise
+    sim_df, offsets = sim_node_replicates(params_dict, sizes, as_frame=True)
+    replicates = split_replicates(sim_df, offsets)
+
+    # Verify
+    np.testing.assert_array_equal(offsets, [0, 3, 3, 8, 10])
+    assert sim_df.shape == (10, 2)
+    assert [len(replicate) for replicate in replicates] == sizes
+    pd.testing.assert_frame_equal(replicates[2], sim_df.iloc[3:8])
+
+
+def test_sim_nodes_batch_with_column_streams():
+    # Setup
+    params_dict = {
+        "x": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 2]), np.array([0.5, 0.25, 0.25])],
+        },
+        "z": {"distribution": "norm", "parameters": (20, 1.2)},
+        "w": {"distribution": "gamma", "parameters": (2.0, 0.0, 1.5)},
+    }
+    fewer_params = {"z": params_dict["z"], "x": params_dict["x"]}
+
+    # Exercise
+    serial = sim_nodes_batch(params_dict, size=1000, seed=3)
+    threaded = sim_nodes_batch(params_dict, size=1000, seed=3, n_jobs=3)
+    fewer = sim_nodes_batch(fewer_params, size=1000, seed=3)
+    regenerated = sim_nodes_batch(
+        params_dict, size=1000, seed=3, variables=["w"]
+    )
+
+    # Verify
+    for column in params_dict:
+        np.testing.assert_array_equal(serial[column], threaded[column])
+    for column in fewer_params:
+        np.testing.assert_array_equal(serial[column], fewer[column])
+    assert list(regenerated.keys()) == ["w"]
+    np.testing.assert_array_equal(serial["w"], regenerated["w"])
+    other_seed = sim_nodes_batch(params_dict, size=1000, seed=4)
+    assert not np.array_equal(serial["z"], other_seed["z"])
+    with pytest.raises(ValueError):
+        sim_nodes_batch(params_dict, size=10, n_jobs=2)
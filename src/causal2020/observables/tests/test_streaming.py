@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from causal2020.observables.regression import fit_alternative_regression
+from causal2020.observables.simmodel import SimulationModel
+from causal2020.observables.streaming import iter_simulation_chunks
+from causal2020.observables.streaming import stream_simulation_to_parquet
+
+
+def test_stream_simulation_is_invariant_to_chunk_size(tmp_path):
+    # Setup
+    np.random.seed(0)
+    data = pd.DataFrame({"distance": np.random.gamma(2, 3, size=500)})
+    data["time"] = 2 * data["distance"] + 5 + np.random.normal(size=500)
+    fitted_regs = fit_alternative_regression(
+        {1: ("distance", "time")}, {1: "linear"}, data
+    )
+    node_params = {
+        "num_kids": {
+            "distribution": "categorical",
+            "parameters": [np.array([0, 1, 2]), np.array([0.5, 0.3, 0.2])],
+        },
+        "distance": {"distribution": "gamma", "parameters": (2.0, 0.0, 3.0)},
+    }
+    model = SimulationModel.from_fits(node_params, fitted_regs)
+    child_nodes = {"time": ("time_on_distance", "distance")}
+    availability = (np.array([1, 2, 2, 3]), {1: "drive", 2: "walk", 3: "bike"})
+    small_path = str(tmp_path / "small.parquet")
+    large_path = str(tmp_path / "large.parquet")
+    kwargs = dict(
+        seed=7,
+        child_nodes=child_nodes,
+        availability=availability,
+        block_size=100,
+    )
+
+    # Exercise
+    num_small = stream_simulation_to_parquet(
+        model, small_path, 1050, chunk_size=100, **kwargs
+    )
+    num_large = stream_simulation_to_parquet(
+        model, large_path, 1050, chunk_size=300, **kwargs
+    )
+    small_df = pd.read_parquet(small_path)
+    large_df = pd.read_parquet(large_path)
+
+    # Verify
+    assert (num_small, num_large) == (11, 4)
+    assert small_df.shape == (1050, 6)
+    pd.testing.assert_frame_equal(small_df, large_df)
+    av_columns = ["drive_AV", "walk_AV", "bike_AV"]
+    assert set(small_df[av_columns].sum(axis=1)) <= {1, 2, 3}
+    diff = small_df["time"] - (2 * small_df["distance"] + 5)
+    assert abs(diff.mean()) < 0.5
+    with pytest.raises(ValueError):
+        next(iter_simulation_chunks(model, 10, chunk_size=150, block_size=100))
@@ -3,10 +3,14 @@
 Functions for performing permutation-based, falsification tests of latent,
 marginal and conditional independence assumptions.
 """
+import hashlib
+import json
 import os
 import sys
 from numbers import Number
+from typing import Dict
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
 from typing import Union
 
@@ -17,6 +21,10 @@ import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sbn
 from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+
+# Name of the file listing the stored chunks of a latent test's checkpoint
+CHECKPOINT_MANIFEST = "manifest.json"
 
 
 def compute_pvalue(
@@ -45,11 +53,136 @@ def compute_pvalue(
     return (obs_statistic < reference_statistics).mean()
 
 
+def _compute_sample_pvalues(
+    sim_sample: np.ndarray,
+    obs_sample: np.ndarray,
+    seed: int,
+    num_permutations: int,
+) -> Tuple[float, float]:
+    """
+    Computes the p-values of the conditional independence test for a single
+    simulated sample of X1, X2, and Z, and for the observed X1 and X2 augmented
+    with the simulated Z. The simulated and augmented observed data share the
+    simulated Z, so both arms are tested jointly with common permutations of
+    X2.
+    """
+    sim_z = sim_sample[:, -1]
+    x1_arrays = np.stack((sim_sample[:, 0], obs_sample[:, 0]), axis=1)
+    x2_arrays = np.stack((sim_sample[:, 1], obs_sample[:, 1]), axis=1)
+
+    obs_r2, permuted_r2 = oi.computed_vs_obs_r2_batch(
+        x1_arrays,
+        x2_arrays,
+        z_array=sim_z,
+        seed=seed,
+        num_permutations=num_permutations,
+    )
+    sampled_pval = compute_pvalue(obs_r2[0], permuted_r2[0])
+    obs_pval = compute_pvalue(obs_r2[1], permuted_r2[1])
+    return sampled_pval, obs_pval
+
+
+def _hash_arrays(*arrays: np.ndarray) -> str:
+    """
+    Computes a hex digest identifying the contents of the given arrays.
+    """
+    hasher = hashlib.sha256()
+    for array in arrays:
+        hasher.update(str(array.shape).encode())
+        hasher.update(np.ascontiguousarray(array).tobytes())
+    return hasher.hexdigest()
+
+
+def _load_checkpoint(
+    checkpoint_dir: str, settings: Dict[str, Union[int, str]]
+) -> Dict[int, Tuple[float, float]]:
+    """
+    Loads the per-sample p-values stored in `checkpoint_dir`. If no manifest
+    exists yet, or if it was created for other settings or data, a new one is
+    created for the given `settings`, and the chunks of the old one are
+    deleted.
+
+    Returns
+    -------
+    completed : dict.
+        Keys are the sample indices that have already been processed. Values
+        are the (sampled_pval, obs_pval) tuples of each sample.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    manifest_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    manifest = {"settings": settings, "chunks": []}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    if manifest["settings"] != settings:
+        # The stored p-values belong to another test, so they are discarded
+        for chunk_name in manifest["chunks"]:
+            chunk_path = os.path.join(checkpoint_dir, chunk_name)
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+        manifest = {"settings": settings, "chunks": []}
+    if not manifest["chunks"]:
+        _write_manifest(checkpoint_dir, manifest)
+        return {}
+
+    completed = {}
+    for chunk_name in manifest["chunks"]:
+        chunk = np.load(os.path.join(checkpoint_dir, chunk_name))
+        for idx, sampled_pval, obs_pval in chunk.T:
+            completed[int(idx)] = (sampled_pval, obs_pval)
+    return completed
+
+
+def _write_manifest(checkpoint_dir: str, manifest: dict) -> None:
+    """
+    Atomically writes the checkpoint manifest to `checkpoint_dir`.
+    """
+    manifest_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
+    return None
+
+
+def _append_checkpoint_chunk(
+    checkpoint_dir: str,
+    indices: Sequence[int],
+    sampled_pvals: np.ndarray,
+    obs_pvals: np.ndarray,
+) -> None:
+    """
+    Stores the p-values of the samples in `indices` as a new `.npy` chunk and
+    records the chunk in the checkpoint manifest. Chunks are only added after
+    they are fully written, so an interrupted write never corrupts the
+    checkpoint.
+    """
+    chunk = np.stack(
+        (
+            np.asarray(indices, dtype=float),
+            sampled_pvals[indices],
+            obs_pvals[indices],
+        ),
+        axis=0,
+    )
+    manifest_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    with open(manifest_path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    chunk_name = "pvals_{:06d}.npy".format(len(manifest["chunks"]))
+    np.save(os.path.join(checkpoint_dir, chunk_name), chunk)
+    manifest["chunks"].append(chunk_name)
+    _write_manifest(checkpoint_dir, manifest)
+    return None
+
+
 def compute_predictive_independence_test_values(
     samples: np.ndarray,
     obs_sample: np.ndarray,
     seed: int = 1038,
     num_permutations: int = 100,
+    checkpoint_dir: Optional[str] = None,
+    checkpoint_every: int = 10,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     Computes two arrays of p-values, one using only simulated data
@@ -74,6 +207,15 @@ def compute_predictive_independence_test_values(
     num_permutations : optional, positive int.
         Denotes the number of permutations to be used in the independence
         test. Default == 100.
+    checkpoint_dir : optional, str or None.
+        Denotes the path to a directory where the per-sample p-values will be
+        stored as they are computed. If the directory already contains a
+        checkpoint for the same data and settings, the samples it records are
+        not recomputed. A checkpoint for other data or settings is discarded.
+        If None, no checkpoint is kept. Default is None.
+    checkpoint_every : optional, positive int.
+        Denotes the number of samples to process between writes of the
+        checkpoint. Ignored if `checkpoint_dir` is None. Default == 10.
 
     Returns
     -------
@@ -93,46 +235,168 @@ def compute_predictive_independence_test_values(
     sampled_pvals = np.empty((num_samples,), dtype=float)
     obs_pvals = np.empty((num_samples,), dtype=float)
 
+    # Restore any p-values that were computed by a previous, interrupted run
+    completed = {}
+    if checkpoint_dir is not None:
+        settings = {
+            "seed": seed,
+            "num_permutations": num_permutations,
+            "num_samples": num_samples,
+            "data_hash": _hash_arrays(samples, obs_sample),
+        }
+        completed = _load_checkpoint(checkpoint_dir, settings)
+        for idx, (sampled_pval, obs_pval) in completed.items():
+            sampled_pvals[idx] = sampled_pval
+            obs_pvals[idx] = obs_pval
+
     # Create the iterable to be looped over to compute test values
-    iterable = checkrs.progress(range(num_permutations))
+    remaining = [i for i in range(num_samples) if i not in completed]
+    iterable = checkrs.progress(remaining)
 
     # Populate the arrays of test statistics
+    pending = []
     for i in iterable:
-        # Get the data to be used to calculate this set of p-values
-        current_sim_sample = samples[:, :, i]
-        current_sim_z = current_sim_sample[:, -1]
-        current_augmented_obs = np.concatenate(
-            (obs_sample, current_sim_z[:, None]), axis=1
-        )
-        current_seed = seed + i
-
-        # Package the arguments to compute the predictive r2 values
-        sim_args = (
-            current_sim_sample[:, 0],
-            current_sim_sample[:, 1],
-            current_sim_z,
-            current_seed,
-            num_permutations,
-            False,
+        # Compute and store the p-values of the conditional independence
+        # test for the current simulated and augmented dataset
+        sampled_pvals[i], obs_pvals[i] = _compute_sample_pvalues(
+            samples[:, :, i], obs_sample, seed + i, num_permutations
         )
 
-        augmented_obs_args = (
-            current_augmented_obs[:, 0],
-            current_augmented_obs[:, 1],
-            current_augmented_obs[:, 2],
-            current_seed,
-            num_permutations,
-            False,
+        if checkpoint_dir is not None:
+            pending.append(i)
+            if len(pending) >= checkpoint_every or i == remaining[-1]:
+                _append_checkpoint_chunk(
+                    checkpoint_dir, pending, sampled_pvals, obs_pvals
+                )
+                pending = []
+    return sampled_pvals, obs_pvals
+
+
+def overall_pvalue_standard_error(
+    sampled_pvals: np.ndarray, obs_pvals: np.ndarray
+) -> float:
+    """
+    Computes the Monte Carlo standard error of the overall p-value of the
+    latent, conditional mean independence test, i.e. of the mean of the
+    indicators `obs_pvals < sampled_pvals`. The proportion in the binomial
+    variance is continuity corrected, as `(successes + 0.5) / (n + 1)`, so
+    that the standard error is not zero when all indicators are equal.
+
+    Parameters
+    ----------
+    sampled_pvals, obs_pvals : 1D np.ndarray
+        Denotes the p-values calculated from a conditional mean independence
+        test, using (respectively) sampled / simulated values of X1, X2, and
+        Z or using observed X1, X2 and simulated Z.
+
+    Returns
+    -------
+    standard_error : float
+        The binomial standard error of the overall p-value.
+    """
+    num_samples = obs_pvals.size
+    num_successes = (obs_pvals < sampled_pvals).sum()
+    corrected_p_value = (num_successes + 0.5) / (num_samples + 1)
+    return np.sqrt(corrected_p_value * (1 - corrected_p_value) / num_samples)
+
+
+def compute_sequential_predictive_independence_test_values(
+    samples: np.ndarray,
+    obs_sample: np.ndarray,
+    seed: int = 1038,
+    num_permutations: int = 100,
+    target_se: float = 0.01,
+    min_samples: int = 20,
+    max_samples: Optional[int] = None,
+    pilot_permutations: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sequential version of `compute_predictive_independence_test_values`.
+    Samples are processed in order until the Monte Carlo standard error of
+    the overall p-value falls below `target_se`, or until the sample budget is
+    exhausted.
+
+    Parameters
+    ----------
+    samples : 3D ndarray.
+        Should have shape (num_observations, 3, num_samples). The three
+        columns should represent X1, X2, and Z, for a test of X1
+        independent of X2 conditional on Z.
+    obs_sample : 2D ndarray
+        Should have shape (num_observations, 2). The two columns should
+        represnt X1 and x2 for the conditional independence test.
+    seed : optional, positive int.
+        The random seed to be used to ensure reproducibility.
+        Default == 1038.
+    num_permutations : optional, positive int.
+        Denotes the number of permutations to be used in the independence
+        test once the overall p-value is close to the desired precision.
+        Default == 100.
+    target_se : optional, positive float.
+        Denotes the Monte Carlo standard error of the overall p-value at which
+        sampling stops. Default == 0.01.
+    min_samples : optional, positive int.
+        Denotes the number of samples to process before the stopping rule is
+        checked. Default == 20.
+    max_samples : optional, positive int or None.
+        Denotes the maximum number of samples to process. If None, all samples
+        may be used. Default is None.
+    pilot_permutations : optional, positive int or None.
+        Denotes a smaller number of permutations to be used while the standard
+        error of the overall p-value exceeds twice `target_se`. The samples
+        processed with the pilot permutations only inform the stopping rule:
+        their p-values are recomputed with `num_permutations` before being
+        returned, since coarser p-values tie more often and would bias the
+        overall p-value. If None, `num_permutations` is always used.
+        Default is None.
+
+    Returns
+    -------
+    sampled_pvals, obs_pvals : 1D np.ndarray
+        Denotes the p-values calculated from a conditional mean independence
+        test for each processed sample, using (respectively) sampled /
+        simulated values of X1, X2, and Z or using observed X1, X2 and
+        simulated Z.
+    """
+    if len(samples.shape) != 3:
+        msg = "`samples` should have shape (num_rows, 3, num_samples)."
+        raise ValueError(msg)
+    num_samples = samples.shape[-1]
+    if max_samples is not None:
+        num_samples = min(num_samples, max_samples)
+
+    # Initialize a container for the p-values of the sampled and observed data
+    sampled_pvals = np.empty((num_samples,), dtype=float)
+    obs_pvals = np.empty((num_samples,), dtype=float)
+
+    current_se = np.inf
+    num_processed = 0
+    pilot_samples = []
+    for i in checkrs.progress(range(num_samples)):
+        # Use fewer permutations while the overall p-value is imprecise
+        use_pilot = current_se > 2 * target_se
+        current_permutations = num_permutations
+        if use_pilot and pilot_permutations is not None:
+            current_permutations = pilot_permutations
+            pilot_samples.append(i)
+        sampled_pvals[i], obs_pvals[i] = _compute_sample_pvalues(
+            samples[:, :, i], obs_sample, seed + i, current_permutations
         )
+        num_processed = i + 1
 
-        # Compute and store the p-values of the conditional independence
-        # test for the current simulated and augmented dataset
-        sampled_pvals[i] = compute_pvalue(*oi.computed_vs_obs_r2(*sim_args))
+        # Check whether the overall p-value is precise enough to stop
+        current_se = overall_pvalue_standard_error(
+            sampled_pvals[:num_processed], obs_pvals[:num_processed]
+        )
+        if num_processed >= min_samples and current_se < target_se:
+            break
 
-        obs_pvals[i] = compute_pvalue(
-            *oi.computed_vs_obs_r2(*augmented_obs_args)
+    # Recompute the pilot p-values with the full number of permutations
+    for i in pilot_samples:
+        sampled_pvals[i], obs_pvals[i] = _compute_sample_pvalues(
+            samples[:, :, i], obs_sample, seed + i, num_permutations
         )
-    return sampled_pvals, obs_pvals
+    return sampled_pvals[:num_processed], obs_pvals[:num_processed]
 
 
 def visualize_predictive_cit_results(
@@ -221,6 +485,11 @@ def perform_visual_predictive_cit_test(
     output_path: Optional[str] = None,
     show: bool = True,
     close: bool = False,
+    checkpoint_dir: Optional[str] = None,
+    target_se: Optional[float] = None,
+    min_samples: int = 20,
+    max_samples: Optional[int] = None,
+    pilot_permutations: Optional[int] = None,
 ) -> Tuple[float, np.ndarray, np.ndarray]:
     """
     Performs a visual, permutation test of the hypothesis that the expected
@@ -253,6 +522,26 @@ def perform_visual_predictive_cit_test(
     close : optional, bool.
         Denotes whether the matplotlib figure that visualizes the results of
         the permutation test should be closed. Default == False.
+    checkpoint_dir : optional, str or None.
+        Denotes the path to a directory where the per-sample p-values will be
+        checkpointed so that an interrupted test can be resumed. See
+        `compute_predictive_independence_test_values`. Default is None.
+    target_se : optional, positive float or None.
+        If not None, samples are processed sequentially until the Monte Carlo
+        standard error of the overall p-value falls below `target_se`. See
+        `compute_sequential_predictive_independence_test_values`. Cannot be
+        combined with `checkpoint_dir`. Default is None.
+    min_samples : optional, positive int.
+        Denotes the number of samples to process in sequential mode before the
+        stopping rule is checked. Ignored if `target_se` is None.
+        Default == 20.
+    max_samples : optional, positive int or None.
+        Denotes the maximum number of samples to process in sequential mode.
+        Ignored if `target_se` is None. Default is None.
+    pilot_permutations : optional, positive int or None.
+        Denotes the number of permutations to use while the overall p-value is
+        still imprecise in sequential mode. Ignored if `target_se` is None.
+        Default is None.
 
     Returns
     -------
@@ -264,9 +553,37 @@ def perform_visual_predictive_cit_test(
         Z or using observed X1, X2 and simulated Z.
     """
     # Compute the observed and sampled pvalues
-    sampled_pvals, obs_pvals = compute_predictive_independence_test_values(
-        samples, obs_sample, seed, num_permutations=num_permutations
-    )
+    if target_se is None:
+        sampled_pvals, obs_pvals = compute_predictive_independence_test_values(
+            samples,
+            obs_sample,
+            seed,
+            num_permutations=num_permutations,
+            checkpoint_dir=checkpoint_dir,
+        )
+    else:
+        if checkpoint_dir is not None:
+            msg = "`checkpoint_dir` cannot be used when `target_se` is given."
+            raise ValueError(msg)
+        (
+            sampled_pvals,
+            obs_pvals,
+        ) = compute_sequential_predictive_independence_test_values(
+            samples,
+            obs_sample,
+            seed,
+            num_permutations=num_permutations,
+            target_se=target_se,
+            min_samples=min_samples,
+            max_samples=max_samples,
+            pilot_permutations=pilot_permutations,
+        )
+        if verbose:
+            msg = "Used {} samples; Monte Carlo standard error is {:.3f}."
+            standard_error = overall_pvalue_standard_error(
+                sampled_pvals, obs_pvals
+            )
+            print(msg.format(sampled_pvals.size, standard_error))
 
     # Visualize the results of the predictive permutation CIT test
     overall_p_value = visualize_predictive_cit_results(
@@ -280,6 +597,100 @@ def perform_visual_predictive_cit_test(
     return overall_p_value, sampled_pvals, obs_pvals
 
 
+def _step_cdf_segments(sorted_array: np.ndarray) -> np.ndarray:
+    """
+    Creates the vertices of the empirical CDF of each column of
+    `sorted_array`, drawn as post-steps.
+
+    Parameters
+    ----------
+    sorted_array : 2D ndarray.
+        Each column should contain one simulated vector, sorted in ascending
+        order.
+
+    Returns
+    -------
+    segments : 3D ndarray.
+        Will have shape `(num_columns, 2 * num_rows - 1, 2)`. Denotes the
+        (x, y) vertices of each column's CDF, as used by `LineCollection`.
+    """
+    num_rows, num_columns = sorted_array.shape
+    cdf_values = np.arange(1, num_rows + 1) / num_rows
+
+    segments = np.empty((num_columns, 2 * num_rows - 1, 2), dtype=float)
+    segments[:, :, 0] = np.repeat(sorted_array, 2, axis=0)[1:].T
+    segments[:, :, 1] = np.repeat(cdf_values, 2)[:-1]
+    return segments
+
+
+def _cdf_envelope(
+    sorted_array: np.ndarray, envelope_quantiles: Tuple[float, float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the pointwise quantile band and median of the empirical CDFs of
+    the columns of `sorted_array`, i.e. the quantiles of the simulated values
+    at each level of the CDFs.
+
+    Returns
+    -------
+    cdf_values, lower, median, upper : 1D ndarrays.
+        Each has length `num_rows`. Denotes the levels of the CDFs and the
+        lower quantile, median, and upper quantile of the values at each level.
+    """
+    num_rows = sorted_array.shape[0]
+    cdf_values = np.arange(1, num_rows + 1) / num_rows
+    lower, median, upper = np.quantile(
+        sorted_array,
+        (envelope_quantiles[0], 0.5, envelope_quantiles[1]),
+        axis=1,
+    )
+    return cdf_values, lower, median, upper
+
+
+def _plot_simulated_cdfs_on_axis(
+    simulated_array: np.ndarray,
+    ax: Axes,
+    color: str,
+    label: Optional[str] = None,
+    alpha: float = 0.5,
+    envelope_quantiles: Optional[Tuple[float, float]] = None,
+) -> None:
+    """
+    Plots the CDFs of all columns of `simulated_array` on `ax` with a fixed
+    number of artists. The columns are sorted in a single call. If
+    `envelope_quantiles` is None, every CDF is drawn in one LineCollection.
+    Otherwise, only the pointwise quantile band and median of the simulated
+    CDFs are drawn.
+    """
+    sorted_array = np.sort(simulated_array, axis=0)
+
+    if envelope_quantiles is None:
+        line_collection = LineCollection(
+            _step_cdf_segments(sorted_array),
+            colors=color,
+            alpha=alpha,
+            label=label,
+        )
+        ax.add_collection(line_collection)
+        ax.autoscale_view()
+        return None
+
+    cdf_values, lower, median, upper = _cdf_envelope(
+        sorted_array, envelope_quantiles
+    )
+    ax.fill_betweenx(
+        cdf_values,
+        lower,
+        upper,
+        step="post",
+        color=color,
+        alpha=alpha,
+        label=label,
+    )
+    ax.plot(median, cdf_values, color=color, drawstyle="steps-post")
+    return None
+
+
 def plot_simulated_vs_observed_cdf(
     obs_array: np.ndarray,
     simulated_array: np.ndarray,
@@ -290,6 +701,7 @@ def plot_simulated_vs_observed_cdf(
     output_path: Optional[str] = None,
     show: bool = True,
     close: bool = False,
+    envelope_quantiles: Optional[Tuple[float, float]] = None,
 ) -> Axes:
     """
     Plots both simulated and observed cdfs for provided observed and simulated
@@ -321,6 +733,11 @@ def plot_simulated_vs_observed_cdf(
     close : optional, bool.
         Denotes whether the matplotlib figure that visualizes the results of
         the permutation test should be closed. Default == False.
+    envelope_quantiles : optional, 2-tuple of floats in (0, 1), or None.
+        If None, the CDF of every simulated column is plotted. Otherwise,
+        denotes the lower and upper quantiles of the pointwise band of
+        simulated CDFs to be plotted, e.g. (0.05, 0.95), in place of the
+        individual CDFs. Default is None.
 
     Returns
     -------
@@ -328,22 +745,18 @@ def plot_simulated_vs_observed_cdf(
         The Axes instance containing the simulated and observed CDFs.
     """
     sbn.set_style("white")
-    # Determine the number of simulations
-    num_simulations = simulated_array.shape[1]
-
     # Create the figure
     fig, ax = plt.subplots(figsize=figsize)
 
     # Plot the simulated cdfs
-    for sim_id in range(num_simulations):
-        label = "Simulated" if sim_id == 0 else None
-        sim_cdf._plot_single_cdf_on_axis(
-            simulated_array[:, sim_id],
-            ax,
-            color=sim_color,
-            label=label,
-            alpha=0.5,
-        )
+    _plot_simulated_cdfs_on_axis(
+        simulated_array,
+        ax,
+        color=sim_color,
+        label="Simulated",
+        alpha=0.5,
+        envelope_quantiles=envelope_quantiles,
+    )
 
     # Plot the observed cdf
     sim_cdf._plot_single_cdf_on_axis(
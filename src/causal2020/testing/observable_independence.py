@@ -169,6 +169,162 @@ def computed_vs_obs_r2(
     return obs_r2, permuted_r2
 
 
+def _make_permutation_indices(
+    num_rows: int, num_permutations: int, seed: Optional[int] = None
+) -> np.ndarray:
+    """
+    Creates the block of permuted row indices used by the permutation tests.
+    The permutations are generated by successively shuffling a single index
+    array, exactly as in `computed_vs_obs_r2`, so that both functions permute
+    `x2_array` identically for a given seed.
+
+    Returns
+    -------
+    permutation_indices : 2D np.ndarray of ints.
+        Will have shape `(num_permutations, num_rows)`. Each row is one
+        permutation of `np.arange(num_rows)`.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+
+    permutation_indices = np.empty((num_permutations, num_rows), dtype=int)
+    shuffled_index_array = np.arange(num_rows)
+    for i in range(num_permutations):
+        np.random.shuffle(shuffled_index_array)
+        permutation_indices[i] = shuffled_index_array
+    return permutation_indices
+
+
+def _residualize(
+    array_2d: np.ndarray, z_array: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Computes the residuals of each column of `array_2d` after a least-squares
+    regression on an intercept and (optionally) `z_array`. The design matrix
+    is factorized once and shared by every column.
+    """
+    num_rows = array_2d.shape[0]
+    if z_array is None:
+        design = np.ones((num_rows, 1))
+    else:
+        design = np.concatenate(
+            (np.ones((num_rows, 1)), z_array[:, None]), axis=1
+        )
+    q_matrix, _ = np.linalg.qr(design)
+    return array_2d - q_matrix @ (q_matrix.T @ array_2d)
+
+
+def _r2_from_residuals(
+    x1_resid: np.ndarray, x2_resid: np.ndarray, total_sum_squares: np.ndarray
+) -> np.ndarray:
+    """
+    Computes the r2 of regressions of x1 on x2 and the conditioning variables,
+    given residuals of x1 and x2 with respect to the conditioning variables.
+    By the Frisch-Waugh-Lovell theorem, this equals the r2 of the full linear
+    regression with an intercept.
+    """
+    cross_products = (x1_resid * x2_resid).sum(axis=0)
+    x2_sum_squares = (x2_resid ** 2).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        explained = np.where(
+            x2_sum_squares > 0, cross_products ** 2 / x2_sum_squares, 0.0
+        )
+    residual_sum_squares = (x1_resid ** 2).sum(axis=0) - explained
+    return 1 - residual_sum_squares / total_sum_squares
+
+
+def computed_vs_obs_r2_batch(
+    x1_arrays: np.ndarray,
+    x2_arrays: np.ndarray,
+    z_array: Optional[np.ndarray] = None,
+    seed: Optional[int] = None,
+    num_permutations: int = 100,
+    permutation_indices: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batched version of `computed_vs_obs_r2` for several (x1, x2) pairs that
+    share the same conditioning variable `z_array`. One block of permutation
+    indices is applied to every pair, and all regressions are computed with a
+    single factorization of the design matrix of the intercept and `z_array`.
+
+    Parameters
+    ----------
+    x1_arrays : 2D np.ndarray.
+        Should have shape `(num_rows, num_pairs)`. Each column denotes a
+        target variable to be predicted.
+    x2_arrays : 2D np.ndarray.
+        Should have shape `(num_rows, num_pairs)`. Each column denotes the
+        explanatory variable to be used and permuted when trying to predict
+        the corresponding column of `x1_arrays`.
+    z_array : optional, 1D ndarray or None.
+        Denotes an explanatory variable to be conditioned on, but not to be
+        permuted, for every pair. Default == None.
+    seed : optional, positive int or None.
+        Denotes the random seed to be used when permuting `x2_arrays`. Ignored
+        if `permutation_indices` is passed. Default == None.
+    num_permutations : optional, positive int.
+        Denotes the number of permutations to use when predicting `x1_arrays`.
+        Ignored if `permutation_indices` is passed. Default == 100.
+    permutation_indices : optional, 2D np.ndarray of ints or None.
+        Should have shape `(num_permutations, num_rows)`. Denotes precomputed
+        permutations of the row indices. If None, the permutations will be
+        generated from `seed`, matching those of `computed_vs_obs_r2`.
+        Default == None.
+
+    Returns
+    -------
+    obs_r2 : 1D np.ndarray
+        Should have length `num_pairs`. Denotes the r2 values obtained using
+        each column of `x2_arrays` to predict the same column of `x1_arrays`,
+        given `z_array` if it was not None.
+    permuted_r2 : 2D np.ndarray
+        Should have shape `(num_pairs, num_permutations)`. Each element denotes
+        the r2 attained using a permuted version of a column of `x2_arrays` to
+        predict the same column of `x1_arrays`.
+    """
+    # Validate argument types and shapes
+    _ensure_is_array(x1_arrays, "x1_arrays")
+    _ensure_is_array(x2_arrays, "x2_arrays")
+    if z_array is not None:
+        _ensure_is_array(z_array, "z_array")
+    if x1_arrays.ndim != 2 or x1_arrays.shape != x2_arrays.shape:
+        msg = "`x1_arrays` and `x2_arrays` MUST be 2D with equal shapes."
+        raise ValueError(msg)
+    if z_array is not None:
+        _check_array_lengths(x1_arrays[:, 0], z_array)
+
+    num_rows, num_pairs = x1_arrays.shape
+    if permutation_indices is None:
+        permutation_indices = _make_permutation_indices(
+            num_rows, num_permutations, seed=seed
+        )
+    num_permutations = permutation_indices.shape[0]
+
+    # Stack the observed and permuted x2 columns so that all of them are
+    # residualized in one pass. Columns are ordered (permutation, pair).
+    permuted_x2 = x2_arrays[permutation_indices.T].reshape(
+        (num_rows, num_permutations * num_pairs)
+    )
+    all_x2 = np.concatenate((x2_arrays, permuted_x2), axis=1)
+    residuals = _residualize(
+        np.concatenate((x1_arrays, all_x2), axis=1), z_array
+    )
+    x1_resid = residuals[:, :num_pairs]
+    x2_resid = residuals[:, num_pairs:]
+
+    # Compute the r2 of every observed and permuted regression
+    total_sum_squares = ((x1_arrays - x1_arrays.mean(axis=0)) ** 2).sum(axis=0)
+    all_r2 = _r2_from_residuals(
+        np.tile(x1_resid, num_permutations + 1),
+        x2_resid,
+        np.tile(total_sum_squares, num_permutations + 1),
+    ).reshape((num_permutations + 1, num_pairs))
+
+    obs_r2 = all_r2[0]
+    permuted_r2 = all_r2[1:].T
+    return obs_r2, permuted_r2
+
+
 def visualize_permutation_results(
     obs_r2: float,
     permuted_r2: np.ndarray,
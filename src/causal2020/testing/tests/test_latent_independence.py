@@ -0,0 +1,214 @@
+import numpy as np
+import pytest
+from causal2020.testing import latent_independence as li
+
+
+def make_samples(num_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(size=(40, 3, num_samples))
+    obs_sample = rng.normal(size=(40, 2))
+    return samples, obs_sample
+
+
+def test_overall_pvalue_standard_error_is_continuity_corrected():
+    # Setup
+    sampled_pvals = np.full(10, 0.6)
+    obs_pvals = np.full(10, 0.2)
+
+    # Exercise
+    standard_error = li.overall_pvalue_standard_error(sampled_pvals, obs_pvals)
+
+    # Verify
+    corrected_p_value = (10 + 0.5) / (10 + 1)
+    expected = np.sqrt(corrected_p_value * (1 - corrected_p_value) / 10)
+    assert pytest.approx(standard_error, abs=1e-12) == expected
+    assert standard_error > 0
+
+
+def test_sequential_test_stops_after_min_samples():
+    # Setup
+    samples, obs_sample = make_samples(12)
+
+    # Exercise
+    loose_pvals, _ = li.compute_sequential_predictive_independence_test_values(
+        samples, obs_sample, num_permutations=20, target_se=0.5, min_samples=5
+    )
+    tight_pvals, _ = li.compute_sequential_predictive_independence_test_values(
+        samples, obs_sample, num_permutations=20, target_se=1e-3, min_samples=5
+    )
+
+    # Verify
+    assert loose_pvals.size == 5
+    assert tight_pvals.size == 12
+
+
+def test_sequential_test_recomputes_pilot_pvalues():
+    # Setup
+    samples, obs_sample = make_samples(8)
+    kwargs = {"num_permutations": 30, "target_se": 1e-3, "min_samples": 2}
+
+    # Exercise
+    pilot_results = li.compute_sequential_predictive_independence_test_values(
+        samples, obs_sample, pilot_permutations=3, **kwargs
+    )
+    full_results = li.compute_sequential_predictive_independence_test_values(
+        samples, obs_sample, **kwargs
+    )
+
+    # Verify
+    for pilot_pvals, full_pvals in zip(pilot_results, full_results):
+        np.testing.assert_array_equal(pilot_pvals, full_pvals)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def record_seeds(compute_sample_pvalues, seeds, max_calls=None):
+    """
+    Wraps `_compute_sample_pvalues`, recording the seed of each call and
+    interrupting the test after `max_calls` calls.
+    """
+
+    def wrapper(*args):
+        if len(seeds) == max_calls:
+            raise Interrupted()
+        seeds.append(args[2])
+        return compute_sample_pvalues(*args)
+
+    return wrapper
+
+
+def test_checkpointed_test_resumes_after_interruption(tmp_path, monkeypatch):
+    # Setup
+    samples, obs_sample = make_samples(7)
+    kwargs = {
+        "seed": 3,
+        "num_permutations": 20,
+        "checkpoint_dir": str(tmp_path / "checkpoint"),
+        "checkpoint_every": 2,
+    }
+    expected = li.compute_predictive_independence_test_values(
+        samples, obs_sample, seed=3, num_permutations=20
+    )
+    compute_sample_pvalues = li._compute_sample_pvalues
+    first_seeds, resumed_seeds = [], []
+    # Interrupt the first run after two chunks of two samples
+    monkeypatch.setattr(
+        li,
+        "_compute_sample_pvalues",
+        record_seeds(compute_sample_pvalues, first_seeds, max_calls=4),
+    )
+    with pytest.raises(Interrupted):
+        li.compute_predictive_independence_test_values(
+            samples, obs_sample, **kwargs
+        )
+
+    # Exercise
+    monkeypatch.setattr(
+        li,
+        "_compute_sample_pvalues",
+        record_seeds(compute_sample_pvalues, resumed_seeds),
+    )
+    resumed = li.compute_predictive_independence_test_values(
+        samples, obs_sample, **kwargs
+    )
+
+    # Verify
+    assert first_seeds == [3, 4, 5, 6]
+    assert resumed_seeds == [7, 8, 9]
+    for resumed_pvals, expected_pvals in zip(resumed, expected):
+        np.testing.assert_array_equal(resumed_pvals, expected_pvals)
+
+
+def test_checkpoint_of_other_settings_is_discarded(tmp_path):
+    # Setup
+    samples, obs_sample = make_samples(4)
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    li.compute_predictive_independence_test_values(
+        samples,
+        obs_sample,
+        seed=3,
+        num_permutations=20,
+        checkpoint_dir=checkpoint_dir,
+    )
+    other_obs_sample = obs_sample + 1
+    expected = {
+        "seed": li.compute_predictive_independence_test_values(
+            samples, obs_sample, seed=4, num_permutations=20
+        ),
+        "data": li.compute_predictive_independence_test_values(
+            samples, other_obs_sample, seed=4, num_permutations=20
+        ),
+    }
+
+    for change, obs_values in [
+        ("seed", obs_sample),
+        ("data", other_obs_sample),
+    ]:
+        # Exercise
+        results = li.compute_predictive_independence_test_values(
+            samples,
+            obs_values,
+            seed=4,
+            num_permutations=20,
+            checkpoint_dir=checkpoint_dir,
+        )
+
+        # Verify
+        for pvals, expected_pvals in zip(results, expected[change]):
+            np.testing.assert_array_equal(pvals, expected_pvals)
+
+
+def test_predictive_test_computes_one_pvalue_per_sample():
+    # Setup
+    samples, obs_sample = make_samples(5)
+
+    # Exercise
+    sampled_pvals, obs_pvals = li.compute_predictive_independence_test_values(
+        samples, obs_sample, seed=2, num_permutations=12
+    )
+
+    # Verify
+    assert sampled_pvals.shape == obs_pvals.shape == (5,)
+    for i in range(5):
+        expected = li._compute_sample_pvalues(
+            samples[:, :, i], obs_sample, 2 + i, 12
+        )
+        assert (sampled_pvals[i], obs_pvals[i]) == expected
+
+
+def test_step_cdf_segments():
+    # Setup
+    sorted_array = np.array([[1.0, 10.0], [2.0, 20.0], [4.0, 40.0]])
+
+    # Exercise
+    segments = li._step_cdf_segments(sorted_array)
+
+    # Verify
+    assert segments.shape == (2, 5, 2)
+    np.testing.assert_array_equal(segments[0, :, 0], [1, 2, 2, 4, 4])
+    np.testing.assert_array_equal(segments[1, :, 0], [10, 20, 20, 40, 40])
+    np.testing.assert_allclose(
+        segments[:, :, 1], [[1 / 3, 1 / 3, 2 / 3, 2 / 3, 1]] * 2
+    )
+
+
+def test_cdf_envelope_matches_quantiles():
+    # Setup
+    simulated_array = np.array(
+        [[3.0, 1.0, 8.0, 5.0], [0.0, 2.0, 6.0, 7.0], [4.0, 9.0, 2.0, 1.0]]
+    )
+    sorted_array = np.sort(simulated_array, axis=0)
+
+    # Exercise
+    cdf_values, lower, median, upper = li._cdf_envelope(
+        sorted_array, (0.1, 0.9)
+    )
+
+    # Verify
+    np.testing.assert_allclose(cdf_values, [1 / 3, 2 / 3, 1])
+    for level, row in enumerate(sorted_array):
+        assert lower[level] == pytest.approx(np.quantile(row, 0.1))
+        assert upper[level] == pytest.approx(np.quantile(row, 0.9))
+    np.testing.assert_allclose(median, [1.0, 4.0, 7.5])
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from causal2020.testing import observable_independence as oi
+
+
+@pytest.mark.parametrize("conditional", [False, True])
+def test_batched_r2_matches_per_pair_regressions(conditional):
+    # Setup
+    rng = np.random.default_rng(0)
+    x1_arrays = rng.normal(size=(30, 2))
+    x2_arrays = rng.normal(size=(30, 2)) + 0.5 * x1_arrays
+    z_array = rng.normal(size=30) if conditional else None
+
+    # Exercise
+    obs_r2, permuted_r2 = oi.computed_vs_obs_r2_batch(
+        x1_arrays, x2_arrays, z_array=z_array, seed=5, num_permutations=15
+    )
+
+    # Verify
+    assert permuted_r2.shape == (2, 15)
+    for pair in range(2):
+        expected_obs_r2, expected_permuted_r2 = oi.computed_vs_obs_r2(
+            x1_arrays[:, pair],
+            x2_arrays[:, pair],
+            z_array=z_array,
+            seed=5,
+            num_permutations=15,
+            progress=False,
+        )
+        assert pytest.approx(obs_r2[pair], abs=1e-10) == expected_obs_r2
+        np.testing.assert_allclose(
+            permuted_r2[pair], expected_permuted_r2, rtol=0, atol=1e-10
+        )
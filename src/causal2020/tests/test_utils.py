@@ -0,0 +1,85 @@
+import numpy as np
+import scipy.stats
+from causal2020.utils import _slice_dist_samples
+from causal2020.utils import iter_samples_from_factor_model
+from causal2020.utils import sample_from_factor_model
+
+
+def make_factor_model(num_samples):
+    return {
+        "loadings_dist": scipy.stats.norm(),
+        "coef_dist": scipy.stats.norm(loc=np.arange(num_samples) / 10),
+        "noise_dist": scipy.stats.norm(scale=0.5),
+        "standard_deviations": np.array([1.0, 2.0, 0.5]),
+        "means": np.array([0.0, 10.0, -3.0]),
+        "num_obs": 20,
+        "num_samples": num_samples,
+        "num_factors": 2,
+        "seed": 11,
+    }
+
+
+def test_slice_dist_samples():
+    # Setup
+    loc = np.arange(4)[None, None, :] * np.ones((2, 3, 1))
+    sample_dist = scipy.stats.norm(loc=loc, scale=2)
+    shared_dist = scipy.stats.norm(loc=1, scale=2)
+
+    # Exercise
+    sliced_dist = _slice_dist_samples(sample_dist, 2, 4)
+
+    # Verify
+    np.testing.assert_array_equal(sliced_dist.kwds["loc"], 2)
+    assert sliced_dist.kwds["loc"].shape == (2, 3, 1)
+    assert sliced_dist.kwds["scale"] == 2
+    assert _slice_dist_samples(shared_dist, 2, 4) is shared_dist
+
+
+def test_chunked_samples_match_monolithic_samples():
+    # Setup
+    model = make_factor_model(7)
+    x_samples, loadings_samples = sample_from_factor_model(**model)
+
+    for dtype, rtol in [(np.float64, 0), (np.float32, 1e-5)]:
+        # Exercise
+        chunks = list(
+            iter_samples_from_factor_model(**model, chunk_size=3, dtype=dtype)
+        )
+
+        # Verify
+        assert [x_chunk.shape[-1] for x_chunk, _ in chunks] == [3, 3, 1]
+        assert all(x_chunk.dtype == dtype for x_chunk, _ in chunks)
+        np.testing.assert_allclose(
+            np.concatenate([x_chunk for x_chunk, _ in chunks], axis=-1),
+            x_samples,
+            rtol=rtol,
+            atol=rtol,
+        )
+        np.testing.assert_allclose(
+            np.concatenate([loadings for _, loadings in chunks], axis=-1),
+            loadings_samples,
+            rtol=rtol,
+            atol=rtol,
+        )
+
+
+def test_samples_do_not_depend_on_parallelism():
+    # Setup
+    model = make_factor_model(9)
+    expected = list(iter_samples_from_factor_model(**model, chunk_size=2))
+
+    for n_jobs, backend in [(3, "thread"), (2, "process")]:
+        # Exercise
+        chunks = list(
+            iter_samples_from_factor_model(
+                **model, chunk_size=2, n_jobs=n_jobs, backend=backend
+            )
+        )
+
+        # Verify
+        assert len(chunks) == len(expected)
+        for (x_chunk, loadings), (x_expected, loadings_expected) in zip(
+            chunks, expected
+        ):
+            np.testing.assert_array_equal(x_chunk, x_expected)
+            np.testing.assert_array_equal(loadings, loadings_expected)
@@ -2,7 +2,12 @@
 """
 Generic utilities that helpful across project-submodules.
 """
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
+from typing import Sequence
 from typing import Tuple
 from typing import Union
 
@@ -16,6 +21,9 @@ from scipy.stats.distributions import rv_discrete
 
 DISTRIBUTION_TYPE = Union[rv_continuous, rv_discrete]
 GRAPH_TYPE = Union[CausalGraphicalModel, Digraph, Graph]
+SEED_TYPE = Union[int, np.random.SeedSequence, np.random.Generator]
+
+POOL_EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
 
 PROJECT_ROOT = here()
 
@@ -67,6 +75,222 @@ def create_graph_image(
     return None
 
 
+def _check_factor_model_moments(
+    means: np.ndarray, standard_deviations: np.ndarray
+) -> None:
+    """
+    Ensures that `means` and `standard_deviations` are 1D ndarrays of equal
+    length.
+    """
+    msg = None
+    ndarray_condition = any(
+        (not isinstance(x, np.ndarray) for x in (means, standard_deviations))
+    )
+    if ndarray_condition:
+        msg = "`means` and `standard_deviations` MUST be ndarrays."
+    elif means.ndim != 1 or standard_deviations.ndim != 1:
+        msg = "`means` and `standard_deviations` MUST be 1D."
+    elif means.size != standard_deviations.size:
+        msg = "`means` and `standard_deviations` MUST have equal lengths."
+    if msg is not None:
+        raise ValueError(msg)
+    return None
+
+
+def _slice_dist_samples(
+    dist: DISTRIBUTION_TYPE, sample_idx: int, num_samples: int
+) -> DISTRIBUTION_TYPE:
+    """
+    Returns the frozen distribution of a single sample of `dist`. Arguments of
+    `dist` that vary along the trailing, sample axis are sliced to
+    `sample_idx`. Distributions without such arguments are returned as is.
+    """
+
+    def needs_slice(arg):
+        has_sample_axis = np.ndim(arg) >= 1 and np.shape(arg)[-1] > 1
+        return has_sample_axis and np.shape(arg)[-1] == num_samples
+
+    def slice_arg(arg):
+        if needs_slice(arg):
+            return np.asarray(arg)[..., sample_idx : sample_idx + 1]
+        return arg
+
+    if not any(needs_slice(x) for x in (*dist.args, *dist.kwds.values())):
+        return dist
+    new_args = [slice_arg(x) for x in dist.args]
+    new_kwds = {key: slice_arg(value) for key, value in dist.kwds.items()}
+    return dist.dist(*new_args, **new_kwds)
+
+
+def _as_seed_sequence(seed: SEED_TYPE) -> np.random.SeedSequence:
+    """
+    Converts an int, SeedSequence, or Generator into a SeedSequence from which
+    independent child streams can be spawned.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2 ** 63, size=4))
+    return np.random.SeedSequence(seed)
+
+
+def _draw_factor_model_chunk(
+    loadings_dist: DISTRIBUTION_TYPE,
+    coef_dist: DISTRIBUTION_TYPE,
+    noise_dist: DISTRIBUTION_TYPE,
+    standard_deviations: np.ndarray,
+    means: np.ndarray,
+    num_obs: int,
+    num_factors: int,
+    num_samples: int,
+    start: int,
+    sample_seeds: Sequence[np.random.SeedSequence],
+    dtype: np.dtype,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draws the block of samples `start, ..., start + len(sample_seeds) - 1`
+    from the factor model. Sample `start + i` is drawn from its own random
+    stream, `sample_seeds[i]`, so the result does not depend on how samples
+    are grouped into blocks or distributed across workers.
+    """
+    num_predictors = means.size
+    current_size = len(sample_seeds)
+    loadings_chunk = np.empty(
+        (num_obs, num_factors, current_size), dtype=dtype
+    )
+    x_chunk = np.empty((num_obs, num_predictors, current_size), dtype=dtype)
+
+    for offset, sample_seed in enumerate(sample_seeds):
+        sample_idx = start + offset
+        rng = np.random.default_rng(sample_seed)
+        loadings_chunk[:, :, offset] = _slice_dist_samples(
+            loadings_dist, sample_idx, num_samples
+        ).rvs((num_obs, num_factors, 1), random_state=rng)[:, :, 0]
+        coefs = _slice_dist_samples(coef_dist, sample_idx, num_samples).rvs(
+            (num_factors, num_predictors, 1), random_state=rng
+        )[:, :, 0]
+        noise = _slice_dist_samples(noise_dist, sample_idx, num_samples).rvs(
+            size=(num_obs, num_predictors, 1), random_state=rng
+        )[:, :, 0]
+
+        # Combine the draws according to the probabilistic factor model,
+        # writing the product straight into the sample's output slice
+        x_sample = x_chunk[:, :, offset]
+        np.matmul(
+            loadings_chunk[:, :, offset], coefs.astype(dtype), out=x_sample
+        )
+        x_sample += noise
+
+    x_chunk *= standard_deviations.astype(dtype)[None, :, None]
+    x_chunk += means.astype(dtype)[None, :, None]
+    return x_chunk, loadings_chunk
+
+
+def iter_samples_from_factor_model(
+    loadings_dist: DISTRIBUTION_TYPE,
+    coef_dist: DISTRIBUTION_TYPE,
+    noise_dist: DISTRIBUTION_TYPE,
+    standard_deviations: np.ndarray,
+    means: np.ndarray,
+    num_obs: int,
+    num_samples: int,
+    num_factors: int = 1,
+    seed: SEED_TYPE = 728,
+    chunk_size: int = 100,
+    dtype: np.dtype = np.float64,
+    n_jobs: int = 1,
+    backend: str = "thread",
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Lazily draws samples from a factor model of the form:
+    `(loadings * coeffcients + noise) * standard_deviations + means`,
+    yielding blocks of at most `chunk_size` samples at a time so that memory
+    use does not grow with `num_samples`. Every sample is drawn from its own
+    random stream, spawned from `seed`, so the draws do not depend on
+    `chunk_size` or `n_jobs` and match those of `sample_from_factor_model`.
+
+    Parameters
+    ----------
+    loadings_dist, coef_dist, noise_dist : DISTRIBUTION_TYPE.
+        See `sample_from_factor_model`.
+    standard_deviations, means : 1D ndarray.
+        See `sample_from_factor_model`.
+    num_obs : positive int.
+        The number of observations being simulated per sample.
+    num_samples : positive int.
+        The total number of samples to draw from the factor model.
+    num_factors : optional, positive int.
+        The number of factors for predicting each column. Default == 1.
+    seed : optional, int, np.random.SeedSequence, or np.random.Generator.
+        Source of randomness used to ensure reproducibility of sampling
+        results. The global numpy random state is neither used nor modified.
+        Default == 728.
+    chunk_size : optional, positive int.
+        The maximum number of samples in each yielded block. Default == 100.
+    dtype : optional, numpy dtype.
+        The floating point type of the yielded arrays, e.g. `np.float32`.
+        Default == np.float64.
+    n_jobs : optional, positive int.
+        The number of workers used to draw blocks concurrently. At most
+        `n_jobs` blocks are held in memory at once. Default == 1.
+    backend : optional, str.
+        Either 'thread' or 'process', denoting the type of pool used when
+        `n_jobs > 1`. Default == 'thread'.
+
+    Yields
+    ------
+    x_chunk : 3D np.ndarray.
+        Samples from the specified factor model. Will have shape
+        `(num_obs, num_predictors, current_chunk_size)`.
+    loadings_chunk : 3D np.ndarray.
+        Samples from loadings_dist, with shape
+        `(num_obs, num_factors, current_chunk_size)`.
+    """
+    _check_factor_model_moments(means, standard_deviations)
+    if chunk_size < 1:
+        raise ValueError("`chunk_size` MUST be a positive int.")
+    if backend not in POOL_EXECUTORS:
+        msg = "`backend` MUST be one of {}.".format(list(POOL_EXECUTORS))
+        raise ValueError(msg)
+
+    # Spawn one independent random stream per sample
+    sample_seeds = _as_seed_sequence(seed).spawn(num_samples)
+
+    def chunk_args(start):
+        stop = min(start + chunk_size, num_samples)
+        return (
+            loadings_dist,
+            coef_dist,
+            noise_dist,
+            standard_deviations,
+            means,
+            num_obs,
+            num_factors,
+            num_samples,
+            start,
+            sample_seeds[start:stop],
+            dtype,
+        )
+
+    starts = range(0, num_samples, chunk_size)
+    if n_jobs == 1:
+        for start in starts:
+            yield _draw_factor_model_chunk(*chunk_args(start))
+        return
+
+    # Keep at most `n_jobs` blocks in flight and yield them in order
+    with POOL_EXECUTORS[backend](max_workers=n_jobs) as executor:
+        pending = deque()
+        for start in starts:
+            pending.append(
+                executor.submit(_draw_factor_model_chunk, *chunk_args(start))
+            )
+            if len(pending) >= n_jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 def sample_from_factor_model(
     loadings_dist: DISTRIBUTION_TYPE,
     coef_dist: DISTRIBUTION_TYPE,
@@ -77,7 +301,9 @@ def sample_from_factor_model(
     num_samples: int,
     num_factors: int = 1,
     post: bool = False,
-    seed: int = 728,
+    seed: SEED_TYPE = 728,
+    n_jobs: int = 1,
+    backend: str = "thread",
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     Draws samples from a factor model of the form:
@@ -109,9 +335,16 @@ def sample_from_factor_model(
         The number of samples to draw from the factor model.
     num_factors : optional, positive int.
         The number of factors for predicting each column. Default == 1.
-    seed : optional, positive int.
-        Random seed to ensure reproducibility of sampling results.
+    seed : optional, int, np.random.SeedSequence, or np.random.Generator.
+        Source of randomness used to ensure reproducibility of sampling
+        results. Each sample is drawn from its own child stream of `seed`.
         Default == 728.
+    n_jobs : optional, positive int.
+        The number of workers used to draw the samples. The results do not
+        depend on `n_jobs`. Default == 1.
+    backend : optional, str.
+        Either 'thread' or 'process', denoting the type of pool used when
+        `n_jobs > 1`. Default == 'thread'.
 
     Returns
     -------
@@ -124,35 +357,31 @@ def sample_from_factor_model(
         shape `(num_obs, num_factors, num_samples)`.
     """
     # Basic argument checking
-    msg = None
-    ndarray_condition = any(
-        (not isinstance(x, np.ndarray) for x in (means, standard_deviations))
-    )
-    if ndarray_condition:
-        msg = "`means` and `standard_deviations` MUST be ndarrays."
-    if means.ndim != 1 or standard_deviations.ndim != 1:
-        msg = "`means` and `standard_deviations` MUST be 1D."
-    if means.size != standard_deviations.size:
-        msg = "`means` and `standard_deviations` MUST have equal lengths."
-    if msg is not None:
-        raise ValueError(msg)
+    _check_factor_model_moments(means, standard_deviations)
 
-    # Figure out the number of predictors being simulated
+    # Initialize the containers for the samples
     num_predictors = means.size
-    # Set the seed for reproducibility
-    np.random.seed(seed)
-    # Get samples of loadings, coefficients, and noise terms.
-    loadings_samples = loadings_dist.rvs((num_obs, num_factors, num_samples))
-    coef_samples = coef_dist.rvs((num_factors, num_predictors, num_samples))
-    noise_samples = noise_dist.rvs(size=(num_obs, num_predictors, num_samples))
-    # Combine the samples according to the probabilistic factor model
-    x_standardized_samples = (
-        np.einsum("mnr,ndr->mdr", loadings_samples, coef_samples)
-        + noise_samples
-    )
-    # Get samples of X on the original scale of each variable
-    x_samples = (
-        x_standardized_samples * standard_deviations[None, :, None]
-        + means[None, :, None]
+    x_samples = np.empty((num_obs, num_predictors, num_samples))
+    loadings_samples = np.empty((num_obs, num_factors, num_samples))
+
+    # Fill the containers, one block of samples at a time
+    chunks = iter_samples_from_factor_model(
+        loadings_dist,
+        coef_dist,
+        noise_dist,
+        standard_deviations,
+        means,
+        num_obs,
+        num_samples,
+        num_factors=num_factors,
+        seed=seed,
+        n_jobs=n_jobs,
+        backend=backend,
     )
+    start = 0
+    for x_chunk, loadings_chunk in chunks:
+        stop = start + x_chunk.shape[-1]
+        x_samples[:, :, start:stop] = x_chunk
+        loadings_samples[:, :, start:stop] = loadings_chunk
+        start = stop
     return x_samples, loadings_samples